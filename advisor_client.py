@@ -0,0 +1,69 @@
+# Client for the advisor service (service.py), with the same interface app.py uses on CryptoAdvisor
+import os
+import uuid
+
+import requests
+
+# Set to the service's base URL (e.g. http://localhost:8000) to run app.py as a thin client
+ADVISOR_URL = os.getenv("CRYPGENE_ADVISOR_URL")
+
+# Seconds to wait for the service to start answering, and between streamed chunks
+DEFAULT_TIMEOUT = 60
+
+
+class RemoteAdvisor:
+    """Drop-in stand-in for CryptoAdvisor that forwards each call to the advisor service"""
+    def __init__(self, base_url=ADVISOR_URL, session_id=None, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.session_id = session_id or uuid.uuid4().hex
+        self.timeout = timeout
+        self.currency = "usd"
+        self.http = requests.Session()
+
+    def _url(self, suffix=""):
+        return f"{self.base_url}/v1/sessions/{self.session_id}{suffix}"
+
+    def reset_conversation(self):
+        """Start a fresh conversation on the service"""
+        try:
+            self.http.delete(self._url(), timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Error resetting remote conversation: {str(e)}")
+        # A new id also keeps the old conversation from coming back if the delete failed
+        self.session_id = uuid.uuid4().hex
+        return True
+
+    def load_conversation(self, messages):
+        """Replace the service's history for this conversation with saved messages"""
+        try:
+            response = self.http.put(self._url("/history"), json={"messages": messages}, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Error loading remote conversation: {str(e)}")
+
+    def get_response(self, query):
+        try:
+            response = self.http.post(self._url("/messages"), json={"message": query, "stream": False, "currency": self.currency},
+                                      timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()["response"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Error generating response: {str(e)}")
+            # Imported here: agent is only needed for this message, and the client shouldn't load it
+            from agent import error_response
+            return error_response(e)
+
+    def stream_response(self, query):
+        """Yield the answer's text chunks as the service streams them"""
+        try:
+            with self.http.post(self._url("/messages"), json={"message": query, "stream": True, "currency": self.currency},
+                                stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                response.encoding = "utf-8"
+                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                    if chunk:
+                        yield chunk
+        except requests.RequestException as e:
+            print(f"Error generating response: {str(e)}")
+            from agent import error_response
+            yield error_response(e)
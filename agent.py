@@ -1,15 +1,30 @@
 # Importing libraries required
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pycoingecko import CoinGeckoAPI
+# LangChain and the Gemini client are imported on first use (see get_llm), so pages that
+# never chat don't pay for them at startup
+import market_data
+from coingecko_gateway import PRIORITY_CHAT
+from async_market_data import get_async_client
+from coin_index import get_coin_index
+from query_parser import parse_query
+from conversation_memory import ConversationMemory, estimate_tokens
+from market_cache import get_market_cache
+from response_cache import get_response_cache, question_signature
+from alerts import alert_message, create_alert, get_alert_engine, parse_alert_request
+from currency import BASE_CURRENCY, display_currency
+from prepared_prompt import data_block, get_prepared_prompt
+import telemetry
+import asyncio
 import os
+import threading
 import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Upper bound (in seconds) on market data lookups in the async path; past this we answer without data
+ASYNC_DATA_TIMEOUT = 5
+
 def get_google_api_key():
     """Get Google API key from Streamlit secrets or environment variable."""
     # First try Streamlit secrets (for Streamlit Cloud deployment)
@@ -29,18 +44,8 @@ def get_google_api_key():
         )
     return api_key
 
-class CryptoAdvisor:
-    def __init__(self):
-        # Initialize CoinGecko API client
-        self.cg = CoinGeckoAPI()
-        
-        # Initialize cache for crypto data
-        self.cache = {}
-        self.cache_expiry = {}
-        self.cache_duration = 300  # Cache duration in seconds (5 minutes)
-        
-        # Define system message for better conversation quality
-        self.system_message = """
+# Define system message for better conversation quality
+SYSTEM_MESSAGE = """
         You are CrypGene, a crypto-savvy friend.
         Keep your advice under 80 words—warm, relatable, and natural. You should also have the knowledge of prices of crypto currencies.
         Explain blockchain, trends, risks, and analysis like you're chatting over coffee.
@@ -48,197 +53,531 @@ class CryptoAdvisor:
         Ask thoughtful questions, share both pros and cons, and never guarantee returns.
         Mention risks clearly and adjust your advice based on the user's vibe.
         """
+
+# Process-wide LLM client, shared by every advisor and built on first use
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """Return the shared Gemini chat model, creating it on first use"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                # Set up the LLM with optimized settings for faster responses
+                _llm = ChatGoogleGenerativeAI(
+                    model="gemini-2.5-flash",
+                    temperature=0.4,  # Lower temperature for faster, more deterministic responses
+                    google_api_key=os.getenv("GOOGLE_API_KEY"),
+                    max_output_tokens=150  # Limit output size for faster generation
+                    # The system message goes out as Gemini's system instruction, unchanged from
+                    # turn to turn, so the model can reuse its cached prefix
+                )
+    return _llm
+
+class CryptoAdvisor:
+    def __init__(self):
+        # Market data is fetched through the process-wide cache in market_data,
+        # so every advisor instance shares the same CoinGecko responses
+        self.system_message = SYSTEM_MESSAGE
         
-        # Set up the LLM with optimized settings for faster responses
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.4,  # Lower temperature for faster, more deterministic responses
-            google_api_key=os.getenv("GOOGLE_API_KEY"),
-            max_output_tokens=150,  # Limit output size for faster generation
-            convert_system_message_to_human=True  # Convert system messages to human messages for Gemini compatibility
-        )
+        # The LLM client is shared too (see get_llm); set self.llm to use another model
+        self._llm = None
         
-        # Setup conversation memory (list of messages)
-        self.messages = []
+        # Setup conversation memory (token-budgeted, with a rolling summary of older turns)
+        self.memory = ConversationMemory()
         
-        # Setup the conversation prompt template
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", self.system_message),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}")
-        ])
+        # Serializes turns in aget_response; created lazily inside the event loop
+        self._turn_lock = None
+        
+        # Owner of this conversation's price alerts (see alerts.py); None turns alerts off.
+        # The app sets it to the session's id, so chat and sidebar share one watchlist
+        self.alert_owner = None
+        self._alerts_seen = 0
+        
+        # Currency prices are quoted in; data is always fetched in USD and converted locally
+        self.currency = BASE_CURRENCY
+    
+    @property
+    def llm(self):
+        return self._llm if self._llm is not None else get_llm()
+    
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+    
+    @property
+    def prompt(self):
+        # Built once per system message and shared by every advisor using it
+        return get_prepared_prompt(self.system_message)
     
     # Add a new method to reset conversation memory
     def reset_conversation(self):
         """Reset the conversation memory to start a fresh chat"""
-        self.messages = []
+        self.memory.clear()
         
         # Return a flag indicating this is a fresh conversation
         # This will be used by the app to clear speech-related state
         return True
     
+    def load_conversation(self, messages):
+        """Replace the conversation memory with a saved chat's [{"role", "content"}, ...] messages"""
+        self.memory.clear()
+        # Replay user/assistant pairs; the memory compacts older turns as usual, so a long
+        # chat costs no more than a live one. The market data injected back then isn't stored.
+        query = None
+        for message in messages:
+            if message["role"] == "user":
+                query = message["content"]
+            elif query is not None:
+                self.record_turn(query, message["content"])
+                query = None
+    
+    def get_coin_index(self):
+        """Return the shared local coin index, or None if it can't be loaded"""
+        try:
+            return get_coin_index()
+        except Exception as e:
+            print(f"Error loading coin index: {str(e)}")
+            return None
+    
+    def resolve_coin_id(self, crypto_name):
+        """Resolve a coin name or symbol to its CoinGecko id"""
+        # Local O(1) lookup first; only fall back to the search API for unknown names
+        coin_index = self.get_coin_index()
+        if coin_index is not None:
+            coin_id = coin_index.lookup(crypto_name)
+            if coin_id:
+                return coin_id
+        
+        search_result = market_data.search(crypto_name, priority=PRIORITY_CHAT)
+        if search_result and 'coins' in search_result and search_result['coins']:
+            return search_result['coins'][0]['id']
+        return None
+    
+    def get_multi_crypto_data(self, crypto_names):
+        """Get market data for several cryptocurrencies with one batched upstream call"""
+        try:
+            coin_ids = [coin_id for coin_id in (self.resolve_coin_id(name) for name in crypto_names) if coin_id]
+            if not coin_ids:
+                return []
+            return market_data.get_coins_by_ids(coin_ids, priority=PRIORITY_CHAT)
+        except Exception as e:
+            print(f"Error fetching crypto data: {str(e)}")
+            return []
+    
     def get_crypto_data(self, crypto_name=None):
-        """Get cryptocurrency data from CoinGecko with caching for faster responses"""
+        """Get cryptocurrency data from CoinGecko through the shared market data cache"""
         try:
-            current_time = time.time()
-            cache_key = f"crypto_{crypto_name if crypto_name else 'global'}"
-            
-            # Check if we have cached data that hasn't expired
-            if cache_key in self.cache and current_time < self.cache_expiry.get(cache_key, 0):
-                return self.cache[cache_key]
-            
             if crypto_name:
-                # Search for specific crypto
-                search_result = self.cg.search(crypto_name)
-                if search_result and 'coins' in search_result and search_result['coins']:
-                    coin_id = search_result['coins'][0]['id']
-                    
-                    # Check if we have coin_id in cache
-                    coin_cache_key = f"coin_{coin_id}"
-                    if coin_cache_key in self.cache and current_time < self.cache_expiry.get(coin_cache_key, 0):
-                        return self.cache[coin_cache_key]
-                    
-                    coin_data = self.cg.get_coin_by_id(coin_id, localization=False, market_data=True)
-                    
-                    result = {
-                        'name': coin_data['name'],
-                        'symbol': coin_data['symbol'].upper(),
-                        'current_price': coin_data['market_data']['current_price']['usd'],
-                        'market_cap': coin_data['market_data']['market_cap']['usd'],
-                        'price_change_24h': coin_data['market_data']['price_change_percentage_24h'],
-                        'price_change_7d': coin_data['market_data']['price_change_percentage_7d'],
-                        'price_change_30d': coin_data['market_data']['price_change_percentage_30d'],
-                    }
-                    
-                    # Cache the result with both keys
-                    self.cache[cache_key] = result
-                    self.cache[coin_cache_key] = result
-                    self.cache_expiry[cache_key] = current_time + self.cache_duration
-                    self.cache_expiry[coin_cache_key] = current_time + self.cache_duration
-                    
-                    return result
+                # Look up a specific crypto through the slim /coins/markets path
+                coins = self.get_multi_crypto_data([crypto_name])
+                if coins:
+                    return coins[0]
             
             # If no specific crypto or not found, return global market data
-            global_data = self.cg.get_global()
-            
-            result = {
-                'total_market_cap': global_data['total_market_cap']['usd'],
-                'total_volume': global_data['total_volume']['usd'],
-                'market_cap_change_percentage_24h_usd': global_data['market_cap_change_percentage_24h_usd'],
-                'active_cryptocurrencies': global_data['active_cryptocurrencies'],
-                'markets': global_data['markets'],
-            }
-            
-            # Cache the global data
-            self.cache[cache_key] = result
-            self.cache_expiry[cache_key] = current_time + self.cache_duration
-            
-            return result
+            return global_summary(market_data.get_global(priority=PRIORITY_CHAT))
         
         except Exception as e:
             print(f"Error fetching crypto data: {str(e)}")
             return None
     
+    def format_crypto_data(self, crypto_data):
+        """Format coin or global market data for the LLM (each block is rendered once per data version)"""
+        return data_block(crypto_data, self.currency)
+    
+    @property
+    def messages(self):
+        """Conversation history as sent to the LLM"""
+        return self.memory.messages()
+    
+    def parse(self, query):
+        """Extract the intent and every coin mention in a single pass over the query"""
+        with telemetry.span("parse"):
+            return parse_query(query, self.get_coin_index())
+    
+    def build_data_context(self, parsed):
+        """Format the market data relevant to a parsed query, or return an empty string"""
+        # Only process crypto data if it's a relevant query
+        crypto_data = None
+        with telemetry.span("market_data", intent=parsed.intent or "none"):
+            if parsed.intent == "coin":
+                # Multi-coin questions like "compare btc, eth and sol" are fetched in one batch;
+                # otherwise fall back to the word after the keyword (e.g. "price of pepe")
+                specific_cryptos = parsed.coins or [parsed.candidate]
+                if len(specific_cryptos) > 1:
+                    crypto_data = self.get_multi_crypto_data(specific_cryptos)
+                else:
+                    crypto_data = self.get_crypto_data(specific_cryptos[0])
+            elif parsed.intent == "market":
+                crypto_data = self.get_crypto_data()
+        
+        # Enhance the query with crypto data if available
+        return self.format_crypto_data(crypto_data) if crypto_data else ""
+    
+    def alert_context(self, query):
+        """Set up an alert the query asks for, and report alerts that fired since the last turn"""
+        if self.alert_owner is None:
+            return ""
+        context = ""
+        request = parse_alert_request(query, self.get_coin_index())
+        if request:
+            try:
+                # Prices in the request are taken to be in the currency the user sees
+                rule = create_alert(self.alert_owner, *request, currency=display_currency(self.currency))
+                context += f"\n\nPrice alert set: {rule['label']}. The app will notify the user when it triggers.\n"
+            except Exception as e:
+                context += f"\n\nCould not set that price alert: {str(e)}\n"
+        
+        fired = get_alert_engine().fired_since(self.alert_owner, self._alerts_seen)
+        if fired:
+            self._alerts_seen = fired[-1]['seq']
+            context += "\n\nPrice alerts that triggered since the last message:\n"
+            context += "".join(f"- {alert_message(alert)}\n" for alert in fired)
+        return context
+    
+    def record_turn(self, query, response, data_context=""):
+        """Add a user message and the AI response to the conversation history"""
+        # The raw query and the injected data are kept apart so memory can drop stale data later
+        self.memory.add_turn(query, response, data_context)
+    
+    def response_cache_signature(self, parsed, data_context):
+        """Return the response cache signature for this turn, or None if it can't be cached"""
+        # Questions without a coin or market intent can be about anything, so their answers
+        # aren't shared across sessions at all
+        if parsed.intent is None:
+            return None
+        # The prompt carries this session's history, and an answer may lean on anything said
+        # there (holdings, plans), even with market data attached; so only answers generated
+        # with no history at all are shared, and only such turns are served from the cache
+        if len(self.memory) > 0 or self.memory.summary:
+            return None
+        return question_signature(parsed, self.get_coin_index())
+    
+    def get_cached_response(self, parsed, data_context, signature):
+        """Return a cached answer to an equivalent question about the same data, or None"""
+        if signature is None:
+            return None
+        with telemetry.span("response_cache"):
+            return get_response_cache().get(parsed, data_context, signature)
+    
+    def cache_response(self, parsed, data_context, signature, response):
+        """Share an answer with other sessions for as long as the data it quotes is fresh"""
+        if signature is None:
+            return
+        ttl = None
+        if data_context:
+            market_cache = get_market_cache()
+            ttl = min(market_cache.ttl_for('coin_market'), market_cache.ttl_for('global'))
+        get_response_cache().set(parsed, data_context, signature, response, ttl)
+    
+    def build_prompt(self, query, data_context):
+        """Render the full prompt for this turn: system message, history and the new input"""
+        with telemetry.span("prompt"):
+            prompt_value = self.prompt.render(self.messages, query + data_context)
+        if telemetry.ENABLED:
+            tokens = sum(estimate_tokens(message_text(message)) for message in prompt_value.to_messages())
+            telemetry.observe("crypgene_prompt_tokens", tokens, buckets=telemetry.TOKEN_BUCKETS)
+        return prompt_value
+    
     def get_response(self, query):
         """Generate a response to the user's query with optimized processing"""
+        turn = telemetry.start_turn()
         try:
-            import time
             start_time = time.time()
             
-            # Optimized keyword detection for cryptocurrency queries
-            crypto_keywords = ["price of", "how is", "what about", "data on", "information on", "stats for", "how much is", "what's the price", "what is the price", "current price", "price for", "value of", "cost of", "worth of"]
-            market_keywords = ["market", "overall", "general", "trending", "crypto market", "cryptocurrency market"]
-            
-            # Fast check if this is a crypto-related query
-            query_lower = query.lower()
-            is_crypto_query = any(keyword in query_lower for keyword in crypto_keywords) or any(keyword in query_lower for keyword in market_keywords)
-            
-            # Only process crypto data if it's a relevant query
-            crypto_data = None
-            if is_crypto_query:
-                specific_crypto = None
-                
-                # Check for specific crypto mentions
-                # First, check for common cryptocurrency names directly in the query
-                common_cryptos = ["bitcoin", "btc", "ethereum", "eth", "dogecoin", "doge", "ripple", "xrp", "cardano", "ada", 
-                                 "solana", "sol", "polkadot", "dot", "litecoin", "ltc", "chainlink", "link", "stellar", "xlm", 
-                                 "tether", "usdt", "binance", "bnb"]
-                
-                for crypto in common_cryptos:
-                    if crypto in query_lower.split():
-                        specific_crypto = crypto
-                        break
-                
-                # If no common crypto found, try to extract from keywords
-                if not specific_crypto:
-                    for keyword in crypto_keywords:
-                        if keyword in query_lower:
-                            # Extract potential crypto name after the keyword
-                            keyword_index = query_lower.find(keyword)
-                            remaining_text = query[keyword_index + len(keyword):].strip()
-                            if remaining_text:
-                                potential_crypto = remaining_text.split()[0]
-                                if potential_crypto and len(potential_crypto) > 1:
-                                    specific_crypto = potential_crypto
-                                    break
-                
-                # Get crypto data if needed
-                if specific_crypto:
-                    crypto_data = self.get_crypto_data(specific_crypto)
-                elif any(keyword in query_lower for keyword in market_keywords):
-                    crypto_data = self.get_crypto_data()
-            
-            # Enhance the query with crypto data if available
-            enhanced_query = query
-            if crypto_data:
-                # Format price data in a more readable way for the LLM
-                formatted_data = ""
-                if 'name' in crypto_data and 'current_price' in crypto_data:
-                    # Format for specific cryptocurrency
-                    formatted_data = f"\n\nLatest data for {crypto_data['name']} ({crypto_data['symbol']}):\n"
-                    formatted_data += f"Current Price: ${crypto_data['current_price']:,.2f} USD\n"
-                    
-                    if 'price_change_24h' in crypto_data:
-                        change_24h = crypto_data['price_change_24h']
-                        direction = "up" if change_24h > 0 else "down"
-                        formatted_data += f"24h Change: {direction} {abs(change_24h):.2f}%\n"
-                    
-                    if 'market_cap' in crypto_data:
-                        formatted_data += f"Market Cap: ${crypto_data['market_cap']:,.0f} USD\n"
-                else:
-                    # Format for global market data
-                    formatted_data = "\n\nLatest Global Crypto Market Data:\n"
-                    if 'total_market_cap' in crypto_data:
-                        formatted_data += f"Total Market Cap: ${crypto_data['total_market_cap']:,.0f} USD\n"
-                    if 'market_cap_change_percentage_24h_usd' in crypto_data:
-                        formatted_data += f"24h Market Change: {crypto_data['market_cap_change_percentage_24h_usd']:.2f}%\n"
-                    if 'active_cryptocurrencies' in crypto_data:
-                        formatted_data += f"Active Cryptocurrencies: {crypto_data['active_cryptocurrencies']}\n"
-                
-                enhanced_query = f"{query}{formatted_data}"
+            parsed = self.parse(query)
+            alert_context = self.alert_context(query)
+            data_context = self.build_data_context(parsed) + alert_context
             
-            # Create the chain with prompt and LLM
-            chain = self.prompt | self.llm
+            # Answer near-duplicate questions about the same data without calling the LLM;
+            # alerts are personal, so turns that carry them aren't shared
+            signature = None if alert_context else self.response_cache_signature(parsed, data_context)
+            response = self.get_cached_response(parsed, data_context, signature)
+            if response is not None:
+                self.record_turn(query, response, data_context)
+                telemetry.count("crypgene_turns_total", source="cache")
+                telemetry.record_duration("turn", time.time() - start_time, source="cache")
+                print(f"Response served from cache in {time.time() - start_time:.3f} seconds")
+                return response
             
-            # Invoke the chain with conversation history (before adding current message)
-            response_obj = chain.invoke({
-                "history": self.messages,  # Previous conversation history
-                "input": enhanced_query
-            })
+            # Render the prompt with conversation history (before adding current message)
+            prompt_value = self.build_prompt(query, data_context)
+            with telemetry.span("llm_completion"):
+                response_obj = self.llm.invoke(prompt_value)
             
             # Extract response content
-            response = response_obj.content if hasattr(response_obj, 'content') else str(response_obj)
+            response = message_text(response_obj)
             
             # Add both user message and AI response to conversation history
-            self.messages.append(HumanMessage(content=enhanced_query))
-            self.messages.append(AIMessage(content=response))
+            self.cache_response(parsed, data_context, signature, response)
+            self.record_turn(query, response, data_context)
             
             # Log performance metrics
             processing_time = time.time() - start_time
+            telemetry.count("crypgene_turns_total", source="llm")
+            telemetry.record_duration("turn", processing_time, source="llm")
             print(f"Response generated in {processing_time:.2f} seconds")
             
             return response
         
         except Exception as e:
+            telemetry.count("crypgene_errors_total", where="get_response")
+            telemetry.log_event("error", where="get_response", error=repr(e))
+            print(f"Error generating response: {str(e)}")
+            return error_response(e)
+        
+        finally:
+            telemetry.end_turn(turn)
+    
+    def stream_response(self, query):
+        """Generate a response to the user's query, yielding text chunks as the LLM produces them"""
+        turn = telemetry.start_turn()
+        start_time = time.time()
+        first_token_time = None
+        data_context = None
+        source = "llm"
+        chunks = []
+        try:
+            parsed = self.parse(query)
+            alert_context = self.alert_context(query)
+            data_context = self.build_data_context(parsed) + alert_context
+            
+            # A cached answer is sent as a single chunk
+            signature = None if alert_context else self.response_cache_signature(parsed, data_context)
+            response = self.get_cached_response(parsed, data_context, signature)
+            if response is not None:
+                source = "cache"
+                first_token_time = time.time()
+                chunks.append(response)
+                yield response
+                return
+            
+            # Stream the LLM's answer to the prompt with conversation history (before adding current message)
+            prompt_value = self.build_prompt(query, data_context)
+            llm_start = time.time()
+            for chunk in self.llm.stream(prompt_value):
+                text = message_text(chunk)
+                if not text:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time()
+                    telemetry.record_duration("llm_first_token", first_token_time - llm_start)
+                chunks.append(text)
+                yield text
+            telemetry.record_duration("llm_completion", time.time() - llm_start)
+            
+            # Only complete answers are shared through the response cache
+            self.cache_response(parsed, data_context, signature, "".join(chunks))
+        
+        except Exception as e:
+            telemetry.count("crypgene_errors_total", where="stream_response")
+            telemetry.log_event("error", where="stream_response", error=repr(e))
             print(f"Error generating response: {str(e)}")
-            return f"I'm sorry, but I encountered an error while processing your request. Please try again later. (Error: {str(e)})"
\ No newline at end of file
+            # Don't record a failed turn in the history
+            data_context = None
+            yield error_response(e)
+        
+        finally:
+            # Record the turn even if the consumer stopped early (e.g. the user interrupted
+            # the page), so the history matches what was shown; skip turns with no reply at all
+            if data_context is not None and chunks:
+                self.record_turn(query, "".join(chunks), data_context)
+                
+                # Log performance metrics
+                telemetry.count("crypgene_turns_total", source=source)
+                telemetry.record_duration("turn", time.time() - start_time, source=source)
+                print(f"First token in {first_token_time - start_time:.2f} seconds, "
+                      f"response streamed in {time.time() - start_time:.2f} seconds")
+            telemetry.end_turn(turn)
+    
+    async def aresolve_coin_ids(self, crypto_names, coin_index=None):
+        """Resolve several coin names to CoinGecko ids, searching for unknown names concurrently"""
+        client = get_async_client()
+        
+        async def resolve(name):
+            coin_id = coin_index.lookup(name) if coin_index is not None else None
+            if coin_id:
+                return coin_id
+            search_result = await client.search(name)
+            if search_result and search_result.get('coins'):
+                return search_result['coins'][0]['id']
+            return None
+        
+        coin_ids = await asyncio.gather(*(resolve(name) for name in crypto_names))
+        return [coin_id for coin_id in coin_ids if coin_id]
+    
+    async def aget_crypto_data(self, parsed, coin_index=None):
+        """Async counterpart of the data lookup in build_data_context"""
+        client = get_async_client()
+        if parsed.intent == "coin":
+            specific_cryptos = parsed.coins or [parsed.candidate]
+            coin_ids = await self.aresolve_coin_ids(specific_cryptos, coin_index)
+            coins = await client.get_coins_by_ids(coin_ids) if coin_ids else []
+            if len(specific_cryptos) > 1:
+                return coins
+            if coins:
+                return coins[0]
+        elif parsed.intent != "market":
+            return None
+        
+        # Market question, or a single coin we couldn't find: use global market data
+        return global_summary(await client.get_global())
+    
+    async def abuild_data_context(self, parsed, timeout=ASYNC_DATA_TIMEOUT):
+        """Async counterpart of build_data_context, with an upper bound on data lookups"""
+        try:
+            with telemetry.span("market_data", intent=parsed.intent or "none"):
+                crypto_data = await asyncio.wait_for(self.aget_crypto_data(parsed, self.get_coin_index()), timeout)
+        except asyncio.TimeoutError:
+            telemetry.count("crypgene_errors_total", where="market_data_timeout")
+            print(f"Market data lookup timed out after {timeout} seconds")
+            crypto_data = None
+        except Exception as e:
+            telemetry.count("crypgene_errors_total", where="abuild_data_context")
+            print(f"Error fetching crypto data: {str(e)}")
+            crypto_data = None
+        
+        return self.format_crypto_data(crypto_data) if crypto_data else ""
+    
+    async def aget_response(self, query):
+        """Async version of get_response, for serving many conversations from one event loop"""
+        # Turns of the same conversation must not interleave, or the history would be mixed up
+        if self._turn_lock is None:
+            self._turn_lock = asyncio.Lock()
+        
+        async with self._turn_lock:
+            turn = telemetry.start_turn()
+            try:
+                start_time = time.time()
+                
+                # The index is loaded from disk (or built) on first use, so keep that off the event loop
+                parsed = await asyncio.to_thread(self.parse, query)
+                alert_context = await asyncio.to_thread(self.alert_context, query) if self.alert_owner else ""
+                data_context = await self.abuild_data_context(parsed) + alert_context
+                
+                signature = None if alert_context else self.response_cache_signature(parsed, data_context)
+                response = self.get_cached_response(parsed, data_context, signature)
+                if response is not None:
+                    self.record_turn(query, response, data_context)
+                    telemetry.count("crypgene_turns_total", source="cache")
+                    telemetry.record_duration("turn", time.time() - start_time, source="cache")
+                    return response
+                
+                prompt_value = self.build_prompt(query, data_context)
+                with telemetry.span("llm_completion"):
+                    response_obj = await self.llm.ainvoke(prompt_value)
+                response = message_text(response_obj)
+                
+                self.cache_response(parsed, data_context, signature, response)
+                self.record_turn(query, response, data_context)
+                
+                processing_time = time.time() - start_time
+                telemetry.count("crypgene_turns_total", source="llm")
+                telemetry.record_duration("turn", processing_time, source="llm")
+                print(f"Response generated in {processing_time:.2f} seconds")
+                
+                return response
+            
+            except Exception as e:
+                telemetry.count("crypgene_errors_total", where="aget_response")
+                telemetry.log_event("error", where="aget_response", error=repr(e))
+                print(f"Error generating response: {str(e)}")
+                return error_response(e)
+            
+            finally:
+                telemetry.end_turn(turn)
+    
+    async def astream_response(self, query):
+        """Async version of stream_response: market data and the LLM are awaited, never run on a thread"""
+        if self._turn_lock is None:
+            self._turn_lock = asyncio.Lock()
+        
+        async with self._turn_lock:
+            turn = telemetry.start_turn()
+            start_time = time.time()
+            first_token_time = None
+            data_context = None
+            source = "llm"
+            chunks = []
+            # Only set once the whole answer went out; a client that disconnects mid-stream
+            # closes the generator, and the partial answer must not enter the history
+            completed = False
+            try:
+                parsed = await asyncio.to_thread(self.parse, query)
+                alert_context = await asyncio.to_thread(self.alert_context, query) if self.alert_owner else ""
+                data_context = await self.abuild_data_context(parsed) + alert_context
+                
+                signature = None if alert_context else self.response_cache_signature(parsed, data_context)
+                response = self.get_cached_response(parsed, data_context, signature)
+                if response is not None:
+                    source = "cache"
+                    first_token_time = time.time()
+                    chunks.append(response)
+                    yield response
+                    completed = True
+                    return
+                
+                prompt_value = self.build_prompt(query, data_context)
+                llm_start = time.time()
+                async for chunk in self.llm.astream(prompt_value):
+                    text = message_text(chunk)
+                    if not text:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                        telemetry.record_duration("llm_first_token", first_token_time - llm_start)
+                    chunks.append(text)
+                    yield text
+                telemetry.record_duration("llm_completion", time.time() - llm_start)
+                
+                self.cache_response(parsed, data_context, signature, "".join(chunks))
+                completed = True
+            
+            except Exception as e:
+                telemetry.count("crypgene_errors_total", where="astream_response")
+                telemetry.log_event("error", where="astream_response", error=repr(e))
+                print(f"Error generating response: {str(e)}")
+                # Don't record a failed turn in the history
+                yield error_response(e)
+            
+            finally:
+                if completed and chunks:
+                    self.record_turn(query, "".join(chunks), data_context)
+                    telemetry.count("crypgene_turns_total", source=source)
+                    telemetry.record_duration("turn", time.time() - start_time, source=source)
+                    print(f"First token in {first_token_time - start_time:.2f} seconds, "
+                          f"response streamed in {time.time() - start_time:.2f} seconds")
+                telemetry.end_turn(turn)
+
+
+def global_summary(global_data):
+    """Pick the global market fields the advisor uses from a /global response"""
+    return {
+        'total_market_cap': global_data['total_market_cap']['usd'],
+        'total_volume': global_data['total_volume']['usd'],
+        'market_cap_change_percentage_24h_usd': global_data['market_cap_change_percentage_24h_usd'],
+        'active_cryptocurrencies': global_data['active_cryptocurrencies'],
+        'markets': global_data['markets'],
+    }
+
+
+def message_text(message):
+    """Extract the text of an LLM message or message chunk"""
+    content = message.content if hasattr(message, 'content') else message
+    if isinstance(content, str):
+        return content
+    # Some models return a list of content blocks instead of a plain string
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else block.get('text', '')
+            for block in content
+            if isinstance(block, (str, dict))
+        )
+    return str(content)
+
+
+def error_response(error):
+    """Message shown to the user when a response can't be generated"""
+    return f"I'm sorry, but I encountered an error while processing your request. Please try again later. (Error: {str(error)})"
@@ -0,0 +1,307 @@
+# Watchlist price alerts, evaluated in bulk each time the refresher polls /coins/markets. Rules
+# are stored column-wise, so a tick is one vectorized comparison over every rule of every
+# session, and it never costs an extra upstream request.
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import market_data
+from currency import BASE_CURRENCY, format_money, to_base
+from market_refresher import start_refresher
+
+# Directions a rule can fire in
+ABOVE = 1
+BELOW = -1
+
+# Active rules one session may hold, and how long (in seconds) an unfired rule is kept
+MAX_RULES_PER_OWNER = 50
+DEFAULT_RULE_TTL = 7 * 24 * 60 * 60
+
+# Alerts are checked against the /coins/markets page the refresher polls, i.e. the top 250 coins
+ALERT_UNIVERSE = 250
+
+# Fired alerts kept per session for the UI and the advisor to pick up
+MAX_FIRED_PER_OWNER = 50
+
+# Initial capacity of the rule columns; they double as needed
+INITIAL_CAPACITY = 1024
+
+# Requests like "tell me when ETH drops 5%" or "alert me if bitcoin goes above $70,000"
+ALERT_REQUEST_PATTERN = re.compile(
+    r"\b(?:tell|notify|alert|ping|warn|let)\s+me\b.*?\b(?:when|if|once)\s+(?P<coin>[a-z0-9][a-z0-9 .-]*?)\s+"
+    r"(?:(?P<move>drops|falls|dips|goes down|rises|jumps|climbs|pumps|goes up)\s+(?:by\s+)?"
+    r"(?P<percent>\d+(?:\.\d+)?)\s*(?:%|percent)"
+    r"|(?:goes\s+|gets\s+|is\s+|trades\s+)?(?P<side>above|over|below|under|hits|reaches)\s+\$?"
+    r"(?P<price>\d[\d,]*(?:\.\d+)?)\s*(?P<suffix>k\b)?)"
+)
+
+DOWN_MOVES = {"drops", "falls", "dips", "goes down"}
+ABOVE_WORDS = {"above", "over"}
+BELOW_WORDS = {"below", "under"}
+
+
+class AlertEngine:
+    """Threshold rules for many sessions, checked against each market snapshot at once"""
+    def __init__(self, capacity=INITIAL_CAPACITY, rule_ttl=DEFAULT_RULE_TTL):
+        self.rule_ttl = rule_ttl
+        self._lock = threading.Lock()
+
+        # Rule columns, one row per rule; freed rows are reused
+        self._coin = np.zeros(capacity, np.int32)
+        self._direction = np.zeros(capacity, np.int8)
+        self._threshold = np.zeros(capacity, np.float64)
+        self._expires = np.zeros(capacity, np.float64)
+        self._active = np.zeros(capacity, bool)
+        self._free = list(range(capacity - 1, -1, -1))
+
+        # Per-row details only touched when a rule is listed or fires
+        self._rules = [None] * capacity
+        self._owner_rows = {}
+        self._next_rule_id = 1
+
+        # Coins referenced by rules, mapped to columns of the per-tick price vector
+        self._coin_ids = []
+        self._coin_index = {}
+
+        self._fired = {}
+        self._fired_seq = 0
+        self.last_evaluated = None
+
+    def add(self, owner, coin_id, direction, threshold, label=None, currency=BASE_CURRENCY):
+        """Add a one-shot rule: fire once the price is >= (ABOVE) or <= (BELOW) threshold
+
+        threshold is in the base currency; currency is the one the owner sees the rule in."""
+        if direction not in (ABOVE, BELOW):
+            raise ValueError("direction must be ABOVE or BELOW")
+        if not threshold or threshold <= 0:
+            raise ValueError("threshold must be a positive price")
+        with self._lock:
+            rows = self._owner_rows.setdefault(owner, set())
+            if len(rows) >= MAX_RULES_PER_OWNER:
+                raise ValueError(f"at most {MAX_RULES_PER_OWNER} alerts can be active at once")
+            if not self._free:
+                self._grow()
+            row = self._free.pop()
+            coin = self._coin_index.get(coin_id)
+            if coin is None:
+                coin = self._coin_index[coin_id] = len(self._coin_ids)
+                self._coin_ids.append(coin_id)
+
+            rule = {
+                'id': self._next_rule_id,
+                'owner': owner,
+                'coin_id': coin_id,
+                'direction': direction,
+                'threshold': float(threshold),
+                'label': label or describe(coin_id, direction, threshold, currency),
+                'currency': currency,
+                'created_at': time.time(),
+            }
+            self._next_rule_id += 1
+            self._coin[row] = coin
+            self._direction[row] = direction
+            self._threshold[row] = threshold
+            self._expires[row] = rule['created_at'] + self.rule_ttl
+            self._active[row] = True
+            self._rules[row] = rule
+            rows.add(row)
+            return dict(rule)
+
+    def remove(self, owner, rule_id):
+        """Delete one of an owner's rules; returns False if it doesn't exist (any more)"""
+        with self._lock:
+            for row in self._owner_rows.get(owner, ()):
+                if self._rules[row]['id'] == rule_id:
+                    self._release(row)
+                    return True
+        return False
+
+    def clear(self, owner):
+        """Forget every rule and fired alert of an owner"""
+        with self._lock:
+            for row in list(self._owner_rows.get(owner, ())):
+                self._release(row)
+            self._fired.pop(owner, None)
+
+    def rules(self, owner):
+        """An owner's active rules, oldest first"""
+        with self._lock:
+            rules = [dict(self._rules[row]) for row in self._owner_rows.get(owner, ())]
+        return sorted(rules, key=lambda rule: rule['id'])
+
+    def fired_since(self, owner, seq=0):
+        """An owner's fired alerts with a sequence number above seq, oldest first"""
+        with self._lock:
+            return [dict(alert) for alert in self._fired.get(owner, ()) if alert['seq'] > seq]
+
+    def evaluate(self, prices, now=None):
+        """Check every rule against a {coin_id: price} mapping; returns the alerts that fired"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._coin_ids:
+                self.last_evaluated = now
+                return []
+            # One price per referenced coin (not per rule), then a single pass over the rules
+            coin_prices = np.array([prices.get(coin_id, np.nan) for coin_id in self._coin_ids], dtype=np.float64)
+            price = coin_prices[self._coin]
+            with np.errstate(invalid='ignore'):
+                crossed = np.where(self._direction == ABOVE, price >= self._threshold, price <= self._threshold)
+            hits = np.flatnonzero(self._active & crossed)
+            expired = np.flatnonzero(self._active & (self._expires <= now) & ~crossed)
+
+            fired = []
+            for row in hits:
+                rule = self._rules[row]
+                self._fired_seq += 1
+                # Messages are formatted by alert_message() when shown, outside this lock
+                alert = {**rule, 'seq': self._fired_seq, 'price': float(price[row]), 'fired_at': now}
+                self._fired.setdefault(rule['owner'], deque(maxlen=MAX_FIRED_PER_OWNER)).append(alert)
+                fired.append(alert)
+                self._release(row)
+            for row in expired:
+                self._release(row)
+            self.last_evaluated = now
+            return fired
+
+    def on_market_refresh(self, endpoint, key, coins):
+        """Refresher listener: evaluate the rules against a freshly polled /coins/markets page"""
+        prices = {coin['id']: coin['current_price'] for coin in coins or ()
+                  if coin.get('current_price') is not None}
+        self.evaluate(prices)
+
+    def __len__(self):
+        with self._lock:
+            return int(self._active.sum())
+
+    def _release(self, row):
+        # Must be called with the lock held
+        rule = self._rules[row]
+        self._owner_rows[rule['owner']].discard(row)
+        if not self._owner_rows[rule['owner']]:
+            del self._owner_rows[rule['owner']]
+        self._active[row] = False
+        self._rules[row] = None
+        self._free.append(row)
+
+    def _grow(self):
+        # Must be called with the lock held
+        old = len(self._active)
+        new = old * 2
+        self._coin = np.concatenate([self._coin, np.zeros(old, np.int32)])
+        self._direction = np.concatenate([self._direction, np.zeros(old, np.int8)])
+        self._threshold = np.concatenate([self._threshold, np.zeros(old, np.float64)])
+        self._expires = np.concatenate([self._expires, np.zeros(old, np.float64)])
+        self._active = np.concatenate([self._active, np.zeros(old, bool)])
+        self._rules.extend([None] * old)
+        self._free.extend(range(new - 1, old - 1, -1))
+
+
+def describe(coin_id, direction, threshold, currency=BASE_CURRENCY):
+    return f"{coin_id} {'above' if direction == ABOVE else 'below'} {format_money(threshold, currency)}"
+
+
+def alert_message(alert):
+    """What to tell the owner about a fired alert, in the currency the rule was set in"""
+    currency = alert.get('currency', BASE_CURRENCY)
+    try:
+        price = format_money(alert['price'], currency)
+    except ValueError:
+        price = format_money(alert['price'], BASE_CURRENCY)
+    return f"{alert['label']}: now {price}"
+
+
+def parse_alert_request(query, coin_index):
+    """Turn "tell me when ETH drops 5%" into (coin_id, move, value), or None if it isn't one
+
+    move is "up"/"down" (value in percent) or "above"/"below"/"cross" (value is a price)."""
+    match = ALERT_REQUEST_PATTERN.search(query.lower())
+    if not match or coin_index is None:
+        return None
+    coin_text = match.group("coin")
+    coin_text = re.sub(r"^(?:the|my)\s+", "", coin_text).removesuffix(" price").strip()
+    coin_id = coin_index.lookup(coin_text) or coin_index.lookup(coin_text.split()[-1])
+    if not coin_id:
+        return None
+
+    if match.group("move"):
+        move = "down" if match.group("move") in DOWN_MOVES else "up"
+        return coin_id, move, float(match.group("percent"))
+
+    price = float(match.group("price").replace(",", ""))
+    if match.group("suffix"):
+        price *= 1000
+    side = match.group("side")
+    move = "above" if side in ABOVE_WORDS else "below" if side in BELOW_WORDS else "cross"
+    return coin_id, move, price
+
+
+def rule_for(move, value, current_price, currency=BASE_CURRENCY):
+    """(direction, threshold, label suffix) for a parsed or UI-entered request
+
+    Prices (value for price moves, current_price and the threshold) are in the base currency;
+    currency is only used for the label."""
+    if move in ("up", "down"):
+        if not current_price:
+            raise ValueError("no current price to measure the move from")
+        start = format_money(current_price, currency)
+        if move == "down":
+            return BELOW, current_price * (1 - value / 100), f"down {value:g}% from {start}"
+        return ABOVE, current_price * (1 + value / 100), f"up {value:g}% from {start}"
+    if move == "cross":
+        if not current_price:
+            raise ValueError("no current price to tell the direction")
+        move = "above" if value > current_price else "below"
+    direction = ABOVE if move == "above" else BELOW
+    return direction, value, f"{move} {format_money(value, currency)}"
+
+
+def create_alert(owner, coin_id, move, value, currency=BASE_CURRENCY, engine=None):
+    """Add a rule for owner from a move ("up"/"down" percent, "above"/"below"/"cross" price)
+
+    Prices are given, and the rule is shown, in currency; rules are checked in the base currency."""
+    # An engine with no rules is falsy (it has a length), so test for None explicitly
+    engine = get_alert_engine() if engine is None else engine
+    if move not in ("up", "down"):
+        value = to_base(value, currency)
+    coins = market_data.get_coins_by_ids([coin_id])
+    if not coins:
+        raise ValueError(f"no market data for '{coin_id}'")
+    rank = coins[0]['market_cap_rank']
+    if not rank or rank > ALERT_UNIVERSE:
+        raise ValueError(f"alerts only cover the top {ALERT_UNIVERSE} coins by market cap")
+    current_price = coins[0]['current_price']
+    name = coins[0]['symbol']
+    direction, threshold, suffix = rule_for(move, value, current_price, currency)
+    return engine.add(owner, coin_id, direction, threshold, label=f"{name} {suffix}", currency=currency)
+
+
+# Process-wide engine shared by every session
+_engine = None
+_engine_lock = threading.Lock()
+_listening_to = None
+
+
+def get_alert_engine():
+    """Return the process-wide alert engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AlertEngine()
+    return _engine
+
+
+def start_alerts():
+    """Evaluate the shared rules after every /coins/markets poll of the shared refresher"""
+    global _listening_to
+    engine = get_alert_engine()
+    refresher = start_refresher()
+    with _engine_lock:
+        # start_refresher() replaces a refresher that died, so check we're on the current one
+        if _listening_to is not refresher:
+            refresher.add_listener('coins_markets', engine.on_market_refresh)
+            _listening_to = refresher
+    return engine
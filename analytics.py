@@ -0,0 +1,356 @@
+# Batch market analytics over the stored price histories: volatility, drawdown, moving averages,
+# RSI, correlation and beta against BTC, computed with NumPy for the top coins at once. A
+# background thread keeps them current, so chat turns and pages only read finished results.
+import random
+import threading
+import time
+
+import numpy as np
+
+from coingecko_gateway import PRIORITY_BACKGROUND
+from market_snapshot import get_market_snapshot
+from price_store import get_price_store
+
+# Coins analysed, by market cap rank; the benchmark is always included so betas can be computed
+DEFAULT_TOP_N = 20
+BENCHMARK_COIN = 'bitcoin'
+
+# History kept on an hourly grid (crypto trades around the clock, so a year has 24 * 365 bars).
+# CoinGecko only returns hourly points for ranges of up to 90 days, and the price store serves
+# ranges of up to 89 days from its hourly tier, so this must not exceed 89
+HISTORY_DAYS = 89
+BAR_MS = 60 * 60 * 1000
+DAY_MS = 24 * BAR_MS
+BARS_PER_DAY = 24
+BARS_PER_YEAR = BARS_PER_DAY * 365
+
+# Trailing windows, in days
+VOLATILITY_WINDOWS = (7, 30)
+MOVING_AVERAGE_WINDOWS = (7, 30)
+DRAWDOWN_WINDOW = 30
+CORRELATION_WINDOW = 30
+
+# RSI over daily closes (the last hourly bar of each UTC day)
+RSI_PERIOD = 14
+
+# A grid bar takes the latest stored price at or before it, but not one older than this many bars
+MAX_GAP_BARS = 6
+
+# Fewest returns a volatility, correlation or beta is computed from
+MIN_OBSERVATIONS = 24
+
+# How often (in seconds) the background thread pulls new price points and updates the results
+DEFAULT_INTERVAL = 15 * 60
+DEFAULT_JITTER = 0.2
+
+
+def sample(timestamps, prices, grid):
+    """Latest price at or before each grid time (ms), NaN where there is none recent enough"""
+    if not len(timestamps):
+        return np.full(len(grid), np.nan)
+    idx = np.searchsorted(timestamps, grid, side='right') - 1
+    clipped = np.maximum(idx, 0)
+    ok = (idx >= 0) & (grid - timestamps[clipped] <= MAX_GAP_BARS * BAR_MS)
+    return np.where(ok, prices[clipped], np.nan)
+
+
+def log_returns(prices):
+    """Bar-to-bar log returns of a (bars, coins) price matrix"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.diff(np.log(prices), axis=0)
+
+
+def nan_mean(values):
+    """Column means ignoring NaN; NaN for columns without any value"""
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=0)
+    totals = np.where(valid, values, 0.0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return totals / counts
+
+
+def covariance(returns, min_observations=MIN_OBSERVATIONS):
+    """Covariance matrix of (bars, coins) returns over the bars each pair has in common"""
+    valid = ~np.isnan(returns)
+    deviations = np.where(valid, returns - nan_mean(returns), 0.0)
+    mask = valid.astype(np.float64)
+    counts = mask.T @ mask
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = (deviations.T @ deviations) / (counts - 1)
+    cov[counts < min_observations] = np.nan
+    return cov
+
+
+def volatility(returns, min_observations=MIN_OBSERVATIONS):
+    """Annualized volatility of each column of hourly returns"""
+    return np.sqrt(np.diagonal(covariance(returns, min_observations)) * BARS_PER_YEAR)
+
+
+def correlation(cov):
+    std = np.sqrt(np.diagonal(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.outer(std, std)
+    # Pairwise-complete estimates can overshoot slightly when histories differ in length
+    return np.clip(corr, -1.0, 1.0)
+
+
+def max_drawdown(prices):
+    """Deepest fall from a running peak within each column, as a negative fraction"""
+    peaks = np.fmax.accumulate(prices, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.fmin.reduce(prices / peaks - 1, axis=0)
+
+
+class RsiState:
+    """Wilder's RSI for many coins at once, updated one daily close at a time"""
+    def __init__(self, n_coins, period=RSI_PERIOD):
+        self.period = period
+        self.count = np.zeros(n_coins)
+        self.avg_gain = np.zeros(n_coins)
+        self.avg_loss = np.zeros(n_coins)
+        self.last_close = np.full(n_coins, np.nan)
+
+    def step(self, closes):
+        change = closes - self.last_close
+        ok = ~np.isnan(change)
+        self.count += ok
+        # A running mean until `period` changes are in, then Wilder's smoothing: the same
+        # update with the weight capped at the period
+        weight = np.maximum(np.minimum(self.count, self.period), 1)
+        gain = np.where(ok, np.maximum(change, 0), 0.0)
+        loss = np.where(ok, np.maximum(-change, 0), 0.0)
+        self.avg_gain = np.where(ok, self.avg_gain + (gain - self.avg_gain) / weight, self.avg_gain)
+        self.avg_loss = np.where(ok, self.avg_loss + (loss - self.avg_loss) / weight, self.avg_loss)
+        self.last_close = np.where(np.isnan(closes), self.last_close, closes)
+
+    def values(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+        rsi = np.where(self.avg_loss == 0, 100.0, rsi)
+        return np.where(self.count >= self.period, rsi, np.nan)
+
+    def take(self, columns):
+        """State for a subset of the coins, in the given column order"""
+        state = RsiState(len(columns), self.period)
+        for name in ('count', 'avg_gain', 'avg_loss', 'last_close'):
+            setattr(state, name, getattr(self, name)[columns])
+        return state
+
+    def join(self, other):
+        """State for these coins followed by other's"""
+        state = RsiState(0, self.period)
+        for name in ('count', 'avg_gain', 'avg_loss', 'last_close'):
+            setattr(state, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+        return state
+
+
+def _number(value, digits=4):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+class MarketAnalytics:
+    """Rolling price matrix of the top coins and the metrics computed from it"""
+    def __init__(self, top_n=DEFAULT_TOP_N, history_days=HISTORY_DAYS, store=None):
+        self.top_n = top_n
+        self.history_days = history_days
+        self.store = store or get_price_store()
+
+        # Hourly grid (bar times in ms) x coins; rows are only appended and trimmed, and when the
+        # top coins change only the columns of coins joining or leaving are touched
+        self.ids = []
+        self.grid = np.empty(0, np.int64)
+        self.prices = np.empty((0, 0))
+        self.rsi = None
+
+        # Finished results, replaced as a whole after each update so readers never see a mix
+        self.metrics = {}
+        self.correlation = None
+        self.updated_at = None
+        self.version = 0
+        self._update_lock = threading.Lock()
+
+    def get(self, coin_id):
+        """Precomputed metrics for one coin, or None if it isn't analysed (yet)"""
+        return self.metrics.get(coin_id)
+
+    def correlation_matrix(self):
+        """(coin ids, correlation matrix of 30d hourly returns), or None before the first update"""
+        return self.correlation
+
+    def update(self):
+        """Pull new price points for the top coins and recompute every metric"""
+        with self._update_lock:
+            snapshot = get_market_snapshot()
+            ids = list(snapshot.df['id'].head(self.top_n))
+            if BENCHMARK_COIN not in ids:
+                ids.append(BENCHMARK_COIN)
+            current_by_id = dict(zip(snapshot.df['id'], snapshot.prices()))
+
+            # Ask for exactly history_days up to the last full bar, so the range never tips over
+            # into CoinGecko's daily data
+            end = int(time.time() * 1000) // BAR_MS * BAR_MS
+            start = end - self.history_days * DAY_MS
+            series = dict(zip(ids, self._read_series(ids, start // 1000, end // 1000)))
+
+            if not len(self.grid):
+                self._rebuild(ids, [series[coin_id] for coin_id in ids], start, end)
+            else:
+                if set(ids) != set(self.ids):
+                    self._change_columns(ids, series)
+                self._extend([series[coin_id] for coin_id in self.ids], start, end)
+
+            current = np.array([current_by_id.get(coin_id, np.nan) for coin_id in self.ids], dtype=np.float64)
+            self._compute(current)
+
+    def _read_series(self, ids, from_timestamp, to_timestamp):
+        # The store only asks upstream for the tail it doesn't have yet
+        series = []
+        for coin_id in ids:
+            try:
+                series.append(self.store.get_range(coin_id, from_timestamp, to_timestamp,
+                                                   priority=PRIORITY_BACKGROUND))
+            except Exception as e:
+                print(f"Error loading price history for {coin_id}: {str(e)}")
+                series.append((np.empty(0, np.int64), np.empty(0)))
+        return series
+
+    def _rebuild(self, ids, series, start, end):
+        self.ids = ids
+        self.grid = np.arange(start, end + 1, BAR_MS, dtype=np.int64)
+        self.prices = self._sample_all(series, self.grid)
+        self.rsi = RsiState(len(ids))
+        self._step_rsi(self.grid, self.prices)
+
+    def _change_columns(self, ids, series):
+        # Keep the columns (and RSI state) of coins still in the top, in their current order,
+        # and sample only the coins that joined; a change in rank order alone costs nothing
+        wanted, current = set(ids), set(self.ids)
+        kept = [i for i, coin_id in enumerate(self.ids) if coin_id in wanted]
+        joined = [coin_id for coin_id in ids if coin_id not in current]
+        self.ids = [self.ids[i] for i in kept] + joined
+        self.prices = self.prices[:, kept]
+        self.rsi = self.rsi.take(kept)
+        if joined:
+            new_prices = self._sample_all([series[coin_id] for coin_id in joined], self.grid)
+            new_rsi = RsiState(len(joined))
+            for row in self._close_rows(self.grid):
+                new_rsi.step(new_prices[row])
+            self.prices = np.hstack([self.prices, new_prices])
+            self.rsi = self.rsi.join(new_rsi)
+
+    def _extend(self, series, start, end):
+        new_grid = np.arange(self.grid[-1] + BAR_MS, end + 1, BAR_MS, dtype=np.int64)
+        if len(new_grid):
+            new_prices = self._sample_all(series, new_grid)
+            self.grid = np.concatenate([self.grid, new_grid])
+            self.prices = np.concatenate([self.prices, new_prices])
+            self._step_rsi(new_grid, new_prices)
+        # Drop bars that fell out of the history window; the RSI state doesn't need them
+        keep = np.searchsorted(self.grid, start)
+        self.grid = self.grid[keep:]
+        self.prices = self.prices[keep:]
+
+    @staticmethod
+    def _sample_all(series, grid):
+        return np.column_stack([sample(timestamps, prices, grid) for timestamps, prices in series])
+
+    @staticmethod
+    def _close_rows(grid):
+        # The last bar of each UTC day is that day's close
+        return np.flatnonzero((grid + BAR_MS) % DAY_MS == 0)
+
+    def _step_rsi(self, grid, prices):
+        for row in self._close_rows(grid):
+            self.rsi.step(prices[row])
+
+    def _compute(self, current):
+        prices = self.prices
+        # The live snapshot price is newer than the last bar; fall back to the bar if it's missing
+        last_bar = prices[-1] if len(prices) else np.full(len(self.ids), np.nan)
+        current = np.where(np.isnan(current), last_bar, current)
+        returns = log_returns(prices)
+        available = (~np.isnan(prices)).sum(axis=0) / BARS_PER_DAY
+
+        volatilities = {days: volatility(returns[-days * BARS_PER_DAY:]) for days in VOLATILITY_WINDOWS}
+        averages = {days: nan_mean(prices[-days * BARS_PER_DAY:]) for days in MOVING_AVERAGE_WINDOWS}
+
+        window = prices[-DRAWDOWN_WINDOW * BARS_PER_DAY:]
+        peak = np.fmax(np.fmax.reduce(window, axis=0), current)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdown = current / peak - 1
+        deepest = np.fmin(max_drawdown(np.vstack([window, current])), drawdown)
+
+        cov = covariance(returns[-CORRELATION_WINDOW * BARS_PER_DAY:])
+        corr = correlation(cov)
+        benchmark = self.ids.index(BENCHMARK_COIN)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = cov[:, benchmark] / cov[benchmark, benchmark]
+        rsi = self.rsi.values()
+
+        metrics = {}
+        for i, coin_id in enumerate(self.ids):
+            metrics[coin_id] = {
+                'history_days': round(float(available[i]), 1),
+                **{f'volatility_{days}d': _number(values[i] * 100, 2) for days, values in volatilities.items()},
+                **{f'ma_{days}d': _number(values[i], 8) for days, values in averages.items()},
+                'drawdown_30d': _number(drawdown[i] * 100, 2),
+                'max_drawdown_30d': _number(deepest[i] * 100, 2),
+                'rsi_14d': _number(rsi[i], 1),
+                'beta_btc': _number(beta[i], 2),
+                'correlation_btc': _number(corr[i, benchmark], 2),
+            }
+
+        # Swap in the new results in one go
+        self.metrics = metrics
+        self.correlation = (list(self.ids), corr)
+        self.updated_at = time.time()
+        self.version += 1
+
+
+class AnalyticsUpdater(threading.Thread):
+    """Background thread that updates the shared analytics on a schedule"""
+    def __init__(self, analytics, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER):
+        super().__init__(name="market-analytics", daemon=True)
+        self.analytics = analytics
+        self.interval = interval
+        self.jitter = jitter
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.analytics.update()
+            except Exception as e:
+                print(f"Error updating market analytics: {str(e)}")
+            # Spread updates out so several processes don't poll in lockstep
+            self._stop_event.wait(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+# Process-wide analytics and their updater, shared by every session and advisor
+_analytics = None
+_updater = None
+_analytics_lock = threading.Lock()
+
+
+def get_market_analytics():
+    """Return the process-wide analytics, creating them (empty) on first use"""
+    global _analytics
+    if _analytics is None:
+        with _analytics_lock:
+            if _analytics is None:
+                _analytics = MarketAnalytics()
+    return _analytics
+
+
+def start_analytics(interval=DEFAULT_INTERVAL):
+    """Start the shared analytics updater if it isn't running yet"""
+    global _updater
+    analytics = get_market_analytics()
+    with _analytics_lock:
+        if _updater is None or not _updater.is_alive():
+            _updater = AnalyticsUpdater(analytics, interval)
+            _updater.start()
+        return _updater
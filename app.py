@@ -1,19 +1,23 @@
 import streamlit as st
 import os
-from agent import CryptoAdvisor
-import pycoingecko
-from pycoingecko import CoinGeckoAPI
+from advisor_client import ADVISOR_URL, RemoteAdvisor
+import market_data
+from market_refresher import start_refresher
+from analytics import DEFAULT_TOP_N, get_market_analytics, start_analytics
+from alerts import ALERT_UNIVERSE, alert_message, create_alert, get_alert_engine, start_alerts
+from price_store import get_price_store
+import chart_data
+from market_snapshot import get_market_snapshot
+from market_cache import DEFAULT_TTLS
+from currency import SUPPORTED_CURRENCIES, column_format, convert, display_currency, format_money
+from chat_store import get_chat_store, make_title
+from telemetry import start_metrics_server
 import pandas as pd
-import numpy as np
+import re
 import time
-import copy
-# Add import for plotly
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
-# We'll use only SpeechRecognition for microphone input
-
-# Initialize the CoinGecko API client
-cg = CoinGeckoAPI()
+import uuid
+# Plotly and the advisor (LangChain, Gemini) are imported where they're first needed, so the
+# market overview renders without loading them
 
 # Set up the Streamlit page
 st.set_page_config(
@@ -22,15 +26,64 @@ st.set_page_config(
     layout="wide"
 )
 
+# Keep hot market data warm in the background so page renders read from memory
+start_refresher()
+
+# Keep volatility, drawdown, RSI, correlation and beta for the top coins precomputed
+start_analytics()
+
+# Check every session's price alerts after each shared market poll
+start_alerts()
+
+# Expose Prometheus metrics locally when CRYPGENE_METRICS_PORT is set (no-op otherwise)
+start_metrics_server()
+
 # Initialize session state variables if they don't exist
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+# Saved chat this session is writing to; created with the first completed turn
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = None
+
+if "chat_history_page" not in st.session_state:
+    st.session_state.chat_history_page = 0
+
+# Owner id of this user's saved chats. It's kept in the page URL, so a reload or a bookmark
+# brings back the same chats, and the chat store only ever shows a user their own
+if "chat_owner" not in st.session_state:
+    chat_owner = st.query_params.get("user", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", chat_owner):
+        chat_owner = uuid.uuid4().hex
+        st.query_params["user"] = chat_owner
+    st.session_state.chat_owner = chat_owner
+
+# Owner id of this session's price alerts, and the last fired alert already shown
+if "alert_owner" not in st.session_state:
+    st.session_state.alert_owner = uuid.uuid4().hex
+    st.session_state.alerts_seen = 0
 
-if "crypto_advisor" not in st.session_state:
-    st.session_state.crypto_advisor = CryptoAdvisor()
+# This session's advisor, created on the first chat turn (or chat load)
+def get_advisor():
+    if "crypto_advisor" not in st.session_state:
+        # With CRYPGENE_ADVISOR_URL set, turns run on the advisor service instead of in this process
+        if ADVISOR_URL:
+            st.session_state.crypto_advisor = RemoteAdvisor()
+        else:
+            from agent import CryptoAdvisor
+            st.session_state.crypto_advisor = CryptoAdvisor()
+            # Lets the advisor set alerts asked for in chat and mention the ones that fired
+            st.session_state.crypto_advisor.alert_owner = st.session_state.alert_owner
+    return st.session_state.crypto_advisor
+    
+# Drop a chat turn that was interrupted before its first token arrived; the advisor
+# doesn't record such turns either, so this keeps both histories in sync
+def drop_interrupted_turn():
+    if (len(st.session_state.messages) >= 2 and st.session_state.messages[-1]["role"] == "assistant"
+            and not st.session_state.messages[-1]["content"]):
+        del st.session_state.messages[-2:]
+
+drop_interrupted_turn()
     
 # Add session state for selected coin and page view
 if "selected_coin" not in st.session_state:
@@ -40,50 +93,58 @@ if "selected_coin" not in st.session_state:
 if "page_view" not in st.session_state:
     st.session_state.page_view = "main"
 
-# Sidebar title
-st.sidebar.title("🔥 Trending Cryptos")
+# How often (in seconds) the self-refreshing fragments re-read the shared cache; each
+# matches the cache TTL of the data it shows, so a refresh never outruns the cache
+TRENDING_REFRESH_SECONDS = DEFAULT_TTLS['trending']
+MOVERS_REFRESH_SECONDS = DEFAULT_TTLS['coins_markets']
+GLOBAL_REFRESH_SECONDS = DEFAULT_TTLS['global']
+
+# Saved conversations listed per page in the sidebar
+CHAT_HISTORY_PAGE_SIZE = 10
+
+# Currency values are shown in; prices are always fetched in USD and converted locally
+def current_currency():
+    return display_currency(st.session_state.get("currency"))
+
+# Alert conditions offered in the sidebar (label -> move understood by alerts.create_alert);
+# prices are entered in the selected currency
+ALERT_CONDITIONS = {"Drops by %": "down", "Rises by %": "up", "Price above": "above", "Price below": "below"}
+
+# Chart ranges offered on the coin detail page (label -> days)
+CHART_RANGES = {"7D": 7, "30D": 30, "1Y": 365}
 
 # Function to get historical price data for a coin
-def get_coin_historical_data(coin_id):
+def get_coin_historical_data(coin_id, days=7):
     try:
-        # Calculate dates for 7-day period
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
+        # Calculate the start of the period as a Unix timestamp
+        to_timestamp = int(time.time())
+        from_timestamp = to_timestamp - days * 24 * 60 * 60
         
-        # Format dates as required by CoinGecko API (Unix timestamps)
-        from_timestamp = int(start_date.timestamp())
-        to_timestamp = int(end_date.timestamp())
-        
-        # Get market chart data
-        chart_data = cg.get_coin_market_chart_range_by_id(
-            id=coin_id,
-            vs_currency='usd',
-            from_timestamp=from_timestamp,
-            to_timestamp=to_timestamp
-        )
-        
-        # Extract price data
-        price_data = chart_data['prices']
-        dates = [datetime.fromtimestamp(price[0]/1000) for price in price_data]
-        prices = [price[1] for price in price_data]
-        
-        return dates, prices
+        # Read from the local price store; only the part we haven't stored yet is fetched
+        return get_price_store().get_range(coin_id, from_timestamp, to_timestamp)
     except Exception as e:
         st.error(f"Error fetching historical data: {str(e)}")
         return [], []
 
-# Function to display coin details on a dedicated page
-def show_coin_details(coin_id, coin_symbol, market_cap_rank):
+# Function to display coin details on a dedicated page; as a fragment, switching the chart
+# range or type or opening "About" reruns only this page, not the sidebar
+@st.fragment
+def show_coin_details(coin_id):
     try:
-        # Get detailed coin data
-        coin_data = cg.get_coin_by_id(coin_id, localization=False, market_data=True)
+        # Get the slim market record for this coin (one /coins/markets call, cached)
+        coins = market_data.get_coins_by_ids([coin_id])
+        if not coins:
+            raise ValueError(f"No market data found for '{coin_id}'")
+        coin_data = coins[0]
         
         # Extract relevant information
         name = coin_data['name']
-        symbol = coin_data['symbol'].upper()
-        current_price = coin_data['market_data']['current_price']['usd']
-        market_cap = coin_data['market_data']['market_cap']['usd']
-        price_change_24h = coin_data['market_data']['price_change_percentage_24h']
+        symbol = coin_data['symbol']
+        market_cap_rank = coin_data['market_cap_rank'] or 'N/A'
+        current_price = coin_data['current_price'] or 0
+        market_cap = coin_data['market_cap'] or 0
+        price_change_24h = coin_data['price_change_24h'] or 0
+        currency = current_currency()
         
         # Create a header with back button
         col1, col2 = st.columns([1, 5])
@@ -101,31 +162,77 @@ def show_coin_details(coin_id, coin_symbol, market_cap_rank):
         # Display basic metrics in columns
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Current Price", f"${current_price:,.2f}", f"{price_change_24h:+.2f}%")
+            st.metric("Current Price", format_money(current_price, currency), f"{price_change_24h:+.2f}%")
         with col2:
-            st.metric("Market Cap", f"${market_cap:,.0f}")
+            st.metric("Market Cap", format_money(market_cap, currency, 0))
         with col3:
             st.metric("Rank", f"#{market_cap_rank}")
         
+        # Analytics are precomputed in the background for the top coins; just read them here
+        stats = get_market_analytics().get(coin_id)
+        if stats:
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                volatility = stats['volatility_30d']
+                st.metric("Volatility (30d)", f"{volatility:.0f}%" if volatility is not None else "N/A",
+                          help="Annualized volatility of hourly returns")
+            with col2:
+                drawdown = stats['drawdown_30d']
+                st.metric("From 30d High", f"{drawdown:+.1f}%" if drawdown is not None else "N/A")
+            with col3:
+                rsi = stats['rsi_14d']
+                st.metric("RSI (14d)", f"{rsi:.0f}" if rsi is not None else "N/A")
+            with col4:
+                beta = stats['beta_btc']
+                st.metric("Beta vs BTC", f"{beta:.2f}" if beta is not None else "N/A")
+        elif coin_data['market_cap_rank'] and coin_data['market_cap_rank'] <= DEFAULT_TOP_N:
+            st.caption("Analytics for this coin are still being computed.")
+        
         # Get historical data for chart
-        st.subheader("7-Day Price Chart")
-        dates, prices = get_coin_historical_data(coin_id)
+        st.subheader("Price Chart")
+        range_col, type_col = st.columns([3, 2])
+        with range_col:
+            range_label = st.radio("Range", list(CHART_RANGES), horizontal=True, key=f"chart_range_{coin_id}",
+                                   label_visibility="collapsed")
+        with type_col:
+            chart_type = st.radio("Chart type", ["Line", "Candles"], horizontal=True, key=f"chart_type_{coin_id}",
+                                  label_visibility="collapsed")
+        timestamps, prices = get_coin_historical_data(coin_id, CHART_RANGES[range_label])
         
-        if dates and prices:
-            # Create a line chart with Plotly
+        if len(timestamps) and len(prices):
+            # One vectorized multiply; the stored history stays in USD
+            prices = convert(prices, currency)
+            import plotly.graph_objects as go
             fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=dates,
-                y=prices,
-                mode='lines',
-                name=f'{symbol} Price',
-                line=dict(color='#1f77b4', width=2)
-            ))
+            if chart_type == "Candles":
+                # Resample into candles sized so the chart stays within a fixed number of bars
+                candles = chart_data.ohlc(timestamps, prices)
+                fig.add_trace(go.Candlestick(
+                    x=pd.to_datetime(candles['time'], unit='ms'),
+                    open=candles['open'],
+                    high=candles['high'],
+                    low=candles['low'],
+                    close=candles['close'],
+                    name=f'{symbol} Price'
+                ))
+                fig.update_layout(xaxis_rangeslider_visible=False)
+            else:
+                # Downsample to a fixed point budget so payload size doesn't grow with the range
+                timestamps, prices = chart_data.downsample(timestamps, prices)
+                
+                # Create a line chart with Plotly
+                fig.add_trace(go.Scatter(
+                    x=pd.to_datetime(timestamps, unit='ms'),
+                    y=prices,
+                    mode='lines',
+                    name=f'{symbol} Price',
+                    line=dict(color='#1f77b4', width=2)
+                ))
             
             # Customize the layout
             fig.update_layout(
                 xaxis_title="Date",
-                yaxis_title="Price (USD)",
+                yaxis_title=f"Price ({currency.upper()})",
                 height=400,
                 margin=dict(l=0, r=0, t=10, b=0),
                 hovermode="x unified"
@@ -137,144 +244,406 @@ def show_coin_details(coin_id, coin_symbol, market_cap_rank):
             st.warning("Could not load historical price data for chart")
             
         # Add additional information
-        if 'description' in coin_data and 'en' in coin_data['description'] and coin_data['description']['en']:
-            with st.expander("About " + name):
-                st.markdown(coin_data['description']['en'])
+        # The description needs the full /coins/{id} payload, so only fetch it on request
+        if st.toggle("About " + name, key=f"about_{coin_id}"):
+            coin_info = market_data.get_coin_by_id(
+                coin_id, localization=False, tickers=False, market_data=False,
+                community_data=False, developer_data=False
+            )
+            description = coin_info.get('description', {}).get('en')
+            if description:
+                st.markdown(description)
+            else:
+                st.info("No description available.")
                 
     except Exception as e:
         st.error(f"Error loading coin details: {str(e)}")
+        if st.button("← Back to Main Page"):
+            st.session_state.selected_coin = None
+            st.session_state.page_view = "main"
+            st.rerun()
+
+# Market overview table: universe sizes, rows per page and column formatting
+MARKET_TABLE_SIZES = [250, 500, 1000]
+MARKET_TABLE_PAGE_SIZE = 50
+MARKET_TABLE_MONEY_COLUMNS = ['current_price', 'market_cap', 'total_volume']
+
+def market_table_columns(currency):
+    money = column_format(currency)
+    code = currency.upper()
+    return {
+        'market_cap_rank': st.column_config.NumberColumn("Rank", format="%d"),
+        'name': st.column_config.TextColumn("Name"),
+        'symbol': st.column_config.TextColumn("Symbol"),
+        'current_price': st.column_config.NumberColumn(f"Price ({code})", format=money),
+        'price_change_percentage_24h': st.column_config.NumberColumn("24h Change (%)", format="%+.2f%%"),
+        'market_cap': st.column_config.NumberColumn(f"Market Cap ({code})", format=money),
+        'total_volume': st.column_config.NumberColumn("Volume (24h)", format=money),
+    }
 
-# Get trending coins data in the sidebar (more compact)
-try:
-    trending_data = cg.get_search_trending()
-    trending_coins = trending_data['coins'][:5]  # Get top 5 trending coins
+# Function to display a compact, clickable card for each coin in a snapshot slice
+def show_coin_cards(coins, key_prefix):
+    currency = current_currency()
+    for coin in coins.itertuples(index=False):
+        price = coin.current_price if pd.notna(coin.current_price) else 0
+        price_change = coin.price_change_percentage_24h if pd.notna(coin.price_change_percentage_24h) else 0
+        
+        # Create a more compact card-like container for each coin
+        with st.container():
+            # Use smaller columns with adjusted ratios to reduce gap
+            col1, col2, col3 = st.columns([0.4, 0.6, 1.0])
+            with col1:
+                # Reduce image size and add negative margin to reduce gap
+                if pd.notna(coin.image):
+                    st.image(coin.image, width=25)
+            with col2:
+                # Inline price display with smaller font and reduced padding
+                st.write(f"<span style='font-size:0.9em; margin-left:-10px; display:block'>{format_money(price, currency)} <span style='color:{'green' if price_change >= 0 else 'red'}'>{price_change:+.2f}%</span></span>", unsafe_allow_html=True)
+            with col3:
+                # Make the coin name more compact
+                coin_name = f"**{coin.name}**"
+                if st.button(coin_name, key=f"view_{key_prefix}_{coin.id}", use_container_width=True):
+                    st.session_state.selected_coin = coin.id
+                    st.session_state.page_view = "coin_detail"
+                    st.rerun()
+            # Thinner separator
+            st.markdown("<hr style='margin:3px 0px; height:1px'>", unsafe_allow_html=True)
+
+# Trending coins in the sidebar (more compact); refreshes on its own timer from the shared cache
+@st.fragment(run_every=TRENDING_REFRESH_SECONDS)
+def show_trending_coins():
+    try:
+        trending_data = market_data.get_search_trending()
+        trending_coins = trending_data['coins'][:5]  # Get top 5 trending coins
+        
+        # Create an even more compact display for trending coins with clickable names
+        for coin in trending_coins:
+            coin_info = coin['item']
+            cols = st.columns([1, 4])
+            with cols[0]:
+                st.image(coin_info['thumb'], width=25)
+            with cols[1]:
+                # Make the coin name clickable instead of having a separate button
+                coin_name = f"**{coin_info['name']}** ({coin_info['symbol'].upper()}) #{coin_info['market_cap_rank']}"
+                if st.button(coin_name, key=f"view_{coin_info['id']}", use_container_width=True):
+                    st.session_state.selected_coin = coin_info['id']
+                    st.session_state.page_view = "coin_detail"
+                    st.rerun()
+    except Exception as e:
+        st.error(f"Could not fetch trending coins: {str(e)}")
+
+# Price alerts in the sidebar. The shared engine checks every session's rules after each market
+# poll, so this fragment's timer only reads memory: new alerts pop up as toasts without any
+# extra upstream request
+@st.fragment(run_every=MOVERS_REFRESH_SECONDS)
+def show_alerts():
+    engine = get_alert_engine()
+    owner = st.session_state.alert_owner
     
-    # Create an even more compact display for trending coins with clickable names
-    for coin in trending_coins:
-        coin_info = coin['item']
-        cols = st.sidebar.columns([1, 4])
-        with cols[0]:
-            st.image(coin_info['thumb'], width=25)
-        with cols[1]:
-            # Make the coin name clickable instead of having a separate button
-            coin_name = f"**{coin_info['name']}** ({coin_info['symbol'].upper()}) #{coin_info['market_cap_rank']}"
-            if st.button(coin_name, key=f"view_{coin_info['id']}", use_container_width=True):
-                st.session_state.selected_coin = coin_info['id']
-                st.session_state.page_view = "coin_detail"
-                st.rerun()
-except Exception as e:
-    st.sidebar.error(f"Could not fetch trending coins: {str(e)}")
-
-# New Chat and Save Chat buttons (moved below trending coins)
-st.sidebar.markdown("---")
-st.sidebar.subheader("💬 Chat Controls")
-col1, col2 = st.sidebar.columns(2)
-with col1:
-    # In your "New Chat" button handler
+    for alert in engine.fired_since(owner, st.session_state.alerts_seen):
+        st.toast(f"🔔 {alert_message(alert)}")
+        st.session_state.alerts_seen = alert['seq']
+    
+    with st.expander("🔔 Price Alerts"):
+        for rule in engine.rules(owner):
+            rule_col, remove_col = st.columns([4, 1])
+            with rule_col:
+                st.caption(rule['label'])
+            with remove_col:
+                if st.button("✕", key=f"remove_alert_{rule['id']}"):
+                    engine.remove(owner, rule['id'])
+                    st.rerun(scope="fragment")
+        
+        try:
+            snapshot = get_market_snapshot(ALERT_UNIVERSE)
+        except Exception as e:
+            st.error(f"Could not load coins: {str(e)}")
+            return
+        names = dict(zip(snapshot.df['id'], snapshot.df['name'] + " (" + snapshot.df['symbol'] + ")"))
+        with st.form("add_alert", border=False):
+            coin_id = st.selectbox("Coin", list(names), format_func=lambda coin_id: str(names[coin_id]))
+            condition = st.selectbox("When", list(ALERT_CONDITIONS))
+            currency = current_currency()
+            value = st.number_input(f"Value (% or price in {currency.upper()})", min_value=0.0, value=5.0)
+            if st.form_submit_button("Add Alert", use_container_width=True):
+                try:
+                    create_alert(owner, coin_id, ALERT_CONDITIONS[condition], value, currency=currency)
+                    st.rerun(scope="fragment")
+                except ValueError as e:
+                    st.error(str(e))
+        st.caption("You can also ask in the chat, e.g. \"tell me when ETH drops 5%\".")
+
+# Persist a completed chat turn, starting a saved conversation with the first one; returns
+# True if a conversation was created
+def save_turn(query, response):
+    # Turns interrupted before the first token aren't kept anywhere
+    if not response:
+        return False
+    
+    store = get_chat_store()
+    owner = st.session_state.chat_owner
+    turn = [{"role": "user", "content": query}, {"role": "assistant", "content": response}]
+    created = st.session_state.conversation_id is None
+    if not created and not store.append_messages(owner, st.session_state.conversation_id, turn):
+        # The conversation was deleted (e.g. from another tab), so carry on in a new one
+        created = True
+    if created:
+        st.session_state.conversation_id = store.create_conversation(owner, make_title(query))
+        store.append_messages(owner, st.session_state.conversation_id, turn)
+    return created
+
+# Start a fresh chat; the current one is already saved turn by turn
+def start_new_chat():
+    st.session_state.messages = []
+    st.session_state.conversation_id = None
+    
+    # Reset the conversation memory in the advisor, if this session has one yet
+    if "crypto_advisor" in st.session_state:
+        st.session_state.crypto_advisor.reset_conversation()
+
+# Chat controls and saved conversations in the sidebar. Only one page of conversations (and a
+# short preview of each) is read from the chat store; full messages are loaded on "Load".
+# Paging, searching and deleting only rerun this fragment; starting or loading a chat changes
+# the chat tab, so those rerun the whole app
+@st.fragment
+def show_chat_history():
+    # New Chat button (moved below trending coins); every turn is saved as it completes
+    st.markdown("---")
+    st.subheader("💬 Chat Controls")
     if st.button("New Chat", use_container_width=True):
-        # Save current conversation to history if not empty
-        if st.session_state.messages:
-            # Get timestamp for chat identification
-            timestamp = time.strftime("%Y-%m-%d %H:%M")
+        start_new_chat()
+        st.rerun()
+    
+    # Display conversation history in the sidebar
+    st.markdown("---")
+    st.subheader("💬 Chat History")
+    
+    store = get_chat_store()
+    owner = st.session_state.chat_owner
+    search_text = st.text_input("Search chats", key="chat_search", placeholder="Search past chats...",
+                                label_visibility="collapsed")
+    if search_text:
+        chats = store.search(owner, search_text, CHAT_HISTORY_PAGE_SIZE)
+    else:
+        page_count = max(1, -(-store.count_conversations(owner) // CHAT_HISTORY_PAGE_SIZE))
+        page = min(st.session_state.chat_history_page, page_count - 1)
+        chats = store.list_conversations(owner, page, CHAT_HISTORY_PAGE_SIZE)
+    
+    # Display past conversations with ability to load them
+    if chats:
+        previews = store.previews(owner, [chat["id"] for chat in chats])
+        for chat in chats:
+            timestamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(chat["updated_at"]))
+            # Create an expander for each past conversation
+            with st.expander(f"{chat['title']} ({timestamp})"):
+                # Show a preview of the conversation
+                for msg in previews[chat["id"]]:
+                    role_icon = "👤" if msg["role"] == "user" else "🤖"
+                    content_preview = msg["content"][:30] + "..." if len(msg["content"]) > 30 else msg["content"]
+                    st.markdown(f"{role_icon} {content_preview}")
+                
+                # Show load and delete buttons for this chat
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button("Load", key=f"load_{chat['id']}", use_container_width=True):
+                        messages = store.get_messages(owner, chat["id"])
+                        st.session_state.messages = messages
+                        st.session_state.conversation_id = chat["id"]
+                        # Bring the advisor's memory in line with the loaded chat
+                        get_advisor().load_conversation(messages)
+                        st.rerun()
+                with col2:
+                    if st.button("Delete", key=f"delete_{chat['id']}", use_container_width=True):
+                        store.delete_conversation(owner, chat["id"])
+                        if chat["id"] == st.session_state.conversation_id:
+                            start_new_chat()
+                            st.rerun()
+                        st.rerun(scope="fragment")
+        
+        # Older/newer pages of the listing
+        if not search_text and page_count > 1:
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("← Newer", disabled=page == 0, use_container_width=True):
+                    st.session_state.chat_history_page = page - 1
+                    st.rerun(scope="fragment")
+            with col2:
+                if st.button("Older →", disabled=page >= page_count - 1, use_container_width=True):
+                    st.session_state.chat_history_page = page + 1
+                    st.rerun(scope="fragment")
+            st.caption(f"Page {page + 1} of {page_count}")
+    elif search_text:
+        st.info("No saved conversations match your search.")
+    else:
+        st.info("No saved conversations yet. Start chatting and your conversations will be saved here!")
+
+# One page of the market table; paging reruns only this fragment and reads the shared snapshot
+@st.fragment
+def show_market_table(n_coins):
+    with st.spinner("Loading market data..."):
+        try:
+            page_col, _ = st.columns([1, 1])
+            with page_col:
+                page_count = -(-n_coins // MARKET_TABLE_PAGE_SIZE)
+                page_number = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1,
+                                              key="market_table_page")
             
-            # Extract first user message for title (or use default)
-            first_user_message = next((msg["content"] for msg in st.session_state.messages if msg["role"] == "user"), "New Conversation")
-            chat_title = first_user_message[:20] + "..." if len(first_user_message) > 20 else first_user_message
+            # Typed, columnar snapshot built once per refresh
+            snapshot = get_market_snapshot(n_coins)
+            currency = current_currency()
             
-            # Create a chat record with title and messages
-            chat_record = {
-                "title": chat_title,
-                "timestamp": timestamp,
-                "messages": copy.deepcopy(st.session_state.messages)
-            }
+            # Check if we received valid data
+            if len(snapshot) == 0:
+                st.error("No data received from CoinGecko API. Please try again later.")
+            else:
+                # Display one page of the table; values stay numeric so columns sort correctly,
+                # and formatting is left to the column config
+                page = snapshot.page(page_number, MARKET_TABLE_PAGE_SIZE)
+                # Convert the page's money columns in one vectorized step (the shared snapshot stays in USD)
+                page = page.assign(**{column: convert(page[column], currency) for column in MARKET_TABLE_MONEY_COLUMNS})
+                columns = market_table_columns(currency)
+                st.dataframe(
+                    page,
+                    column_order=list(columns),
+                    column_config=columns,
+                    hide_index=True,
+                    use_container_width=True,
+                    height=500
+                )
+        except Exception as e:
+            st.error(f"Error loading market data: {str(e)}")
+
+# Top 5 gainers, losers and volume leaders, re-read from the snapshot as the refresher updates it
+@st.fragment(run_every=MOVERS_REFRESH_SECONDS)
+def show_top_movers(n_coins):
+    try:
+        snapshot = get_market_snapshot(n_coins)
+        gainers_tab, losers_tab, volume_tab = st.tabs(["🚀 Top 5 Gainers", "📉 Top 5 Losers", "💧 Top 5 Volume"])
+        with gainers_tab:
+            show_coin_cards(snapshot.top_gainers(5), "gainer")
+        with losers_tab:
+            show_coin_cards(snapshot.top_losers(5), "loser")
+        with volume_tab:
+            show_coin_cards(snapshot.volume_leaders(5), "volume")
+    except Exception as e:
+        st.error(f"Error loading market data: {str(e)}")
+
+# Global market statistics, refreshed on their own timer
+@st.fragment(run_every=GLOBAL_REFRESH_SECONDS)
+def show_global_stats():
+    st.subheader("🌎 Global Market Statistics")
+    
+    with st.spinner("Loading global market data..."):
+        try:
+            # Get global market data
+            global_data = market_data.get_global()
             
-            # Add to chat history
-            st.session_state.chat_history.append(chat_record)
-        
-        # Clear current messages for new chat
-        st.session_state.messages = []
+            # Extract statistics with robust error handling
+            # Total Market Cap
+            total_market_cap = 0
+            if global_data and 'total_market_cap' in global_data:
+                market_cap_data = global_data['total_market_cap']
+                if isinstance(market_cap_data, dict) and 'usd' in market_cap_data:
+                    total_market_cap = market_cap_data['usd']
+            
+            # Total Volume
+            total_volume = 0
+            if global_data and 'total_volume' in global_data:
+                volume_data = global_data['total_volume']
+                if isinstance(volume_data, dict) and 'usd' in volume_data:
+                    total_volume = volume_data['usd']
+            
+            # Market Cap Change
+            market_cap_change = 0
+            if global_data and 'market_cap_change_percentage_24h_usd' in global_data:
+                market_cap_change = global_data['market_cap_change_percentage_24h_usd']
+            
+            # Display metrics in vertical layout
+            currency = current_currency()
+            st.metric("💰 Total Market Cap", format_money(total_market_cap, currency, 0))
+            st.metric("📊 24h Trading Volume", format_money(total_volume, currency, 0))
+            st.metric("📈 Market Cap Change (24h)", f"{market_cap_change:+.2f}%", delta_color="normal")
+
+        except Exception as e:
+            st.error(f"Could not fetch global market data: {str(e)}")
+
+# Chat with the advisor; a chat turn reruns only this fragment, so it makes no market data
+# calls for the rest of the page
+@st.fragment
+def show_chat():
+    drop_interrupted_turn()
+    
+    # Chat section
+    st.header("Chat with CrypGene")
+    
+    # Create a container for chat messages
+    chat_container = st.container()
+    
+    # Create a container for the input box, which will stay at the bottom
+    input_container = st.container()
+    
+    # Add speech input option
+    with input_container:
+        # Regular text input - now using full width
+        prompt = st.chat_input("Ask me anything about crypto investments or any other investments...", key="chat_input")
+    
+    # Display current chat messages in the chat container
+    with chat_container:
+        if not st.session_state.messages and not prompt:
+            # Show welcome message if no messages
+            st.info("👋 Welcome! Ask me anything about cryptocurrency investments.")
         
-        # Reset the conversation memory in the advisor
-        st.session_state.crypto_advisor.reset_conversation()
+        # Display all messages
+        for message in st.session_state.messages:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
         
-        st.rerun()
-with col2:
-    if st.button("Save Chat", use_container_width=True):
-        if st.session_state.messages:
-            # Get timestamp for chat identification
-            timestamp = time.strftime("%Y-%m-%d %H:%M")
+        if prompt:
+            # Add user message to chat history
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"):
+                st.markdown(prompt)
             
-            # Extract first user message for title (or use default)
-            first_user_message = next((msg["content"] for msg in st.session_state.messages if msg["role"] == "user"), "New Conversation")
-            chat_title = first_user_message[:20] + "..." if len(first_user_message) > 20 else first_user_message
+            # Add the assistant message up front and fill it in as tokens arrive, so a
+            # reply interrupted by another interaction keeps what was already shown
+            assistant_message = {"role": "assistant", "content": ""}
+            st.session_state.messages.append(assistant_message)
             
-            # Create a chat record with title and messages
-            chat_record = {
-                "title": chat_title,
-                "timestamp": timestamp,
-                "messages": copy.deepcopy(st.session_state.messages)
-            }
+            def record_chunks(chunks):
+                for chunk in chunks:
+                    assistant_message["content"] += chunk
+                    yield chunk
             
-            # Add to chat history
-            st.session_state.chat_history.append(chat_record)
-            st.sidebar.success("Chat saved to history!")
-            time.sleep(1)
-            st.rerun()
-
-# Display conversation history in the sidebar
-st.sidebar.markdown("---")
-st.sidebar.subheader("💬 Chat History")
-
-# Display past conversations with ability to load them
-if st.session_state.chat_history:
-    for idx, chat in enumerate(st.session_state.chat_history):
-        # Create an expander for each past conversation
-        with st.sidebar.expander(f"{chat['title']} ({chat['timestamp']})"):
-            # Show a preview of the conversation
-            for i, msg in enumerate(chat["messages"][:3]):  # Show first 3 messages as preview
-                role_icon = "👤" if msg["role"] == "user" else "🤖"
-                content_preview = msg["content"][:30] + "..." if len(msg["content"]) > 30 else msg["content"]
-                st.markdown(f"{role_icon} {content_preview}")
+            advisor = get_advisor()
+            advisor.currency = current_currency()
             
-            # Show load and delete buttons for this chat
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Load", key=f"load_{idx}", use_container_width=True):
-                    st.session_state.messages = copy.deepcopy(chat["messages"])
-                    st.rerun()
-            with col2:
-                if st.button("Delete", key=f"delete_{idx}", use_container_width=True):
-                    st.session_state.chat_history.pop(idx)
-                    st.rerun()
-else:
-    st.sidebar.info("No saved conversations yet. Start chatting and save your conversations!")
+            # Stream the response from the advisor agent; whatever was shown gets saved, even
+            # if another interaction interrupts the stream
+            try:
+                with st.chat_message("assistant"):
+                    st.write_stream(record_chunks(advisor.stream_response(prompt)))
+            finally:
+                created = save_turn(prompt, assistant_message["content"])
+            
+            # Rerun just the chat to update the UI; a newly saved conversation also has to
+            # show up in the sidebar, so that turn reruns the whole app
+            if created:
+                st.rerun()
+            st.rerun(scope="fragment")
+
+# Sidebar: trending coins, then chat controls and history
+with st.sidebar:
+    # Changing the currency reruns the whole app, so every section picks it up
+    st.selectbox("Currency", list(SUPPORTED_CURRENCIES), format_func=str.upper, key="currency")
+    st.title("🔥 Trending Cryptos")
+    show_trending_coins()
+    show_alerts()
+    show_chat_history()
 
 # Main content area - conditionally show main page or coin detail page
 if st.session_state.page_view == "coin_detail" and st.session_state.selected_coin:
-    # Find the selected coin info
-    try:
-        # Try to find in trending coins first
-        trending_data = cg.get_search_trending()
-        trending_coins = trending_data['coins'][:5]
-        selected_coin_info = next((coin['item'] for coin in trending_coins if coin['item']['id'] == st.session_state.selected_coin), None)
-        
-        # If not found in trending, get the coin data directly
-        if not selected_coin_info:
-            coin_data = cg.get_coin_by_id(st.session_state.selected_coin)
-            selected_coin_info = {
-                'id': coin_data['id'],
-                'symbol': coin_data['symbol'],
-                'market_cap_rank': coin_data.get('market_cap_rank', 'N/A')
-            }
-        
-        # Show the coin details page
-        show_coin_details(selected_coin_info['id'], selected_coin_info['symbol'], selected_coin_info['market_cap_rank'])
-    except Exception as e:
-        st.error(f"Error loading coin details: {str(e)}")
-        if st.button("← Back to Main Page"):
-            st.session_state.selected_coin = None
-            st.session_state.page_view = "main"
-            st.rerun()
+    # Show the coin details page; its header comes from the coin's own market record
+    show_coin_details(st.session_state.selected_coin)
 else:
     # Main app layout
     st.title("CrypGene - Your AI Crypto Advisor 👨🏽‍💼")
@@ -286,172 +655,24 @@ else:
     with tab1:
         st.header("Cryptocurrency Market Overview")
         
-        # Simple progress indicator for coin data
-        with st.spinner("Loading market data..."):
-            try:
-                # Fetch the top 50 coins by market cap
-                coins_data = cg.get_coins_markets(
-                    vs_currency='usd',
-                    order='market_cap_desc',
-                    per_page=50,
-                    page=1,
-                    sparkline=False
-                )
-                
-                # Check if we received valid data
-                if not coins_data or len(coins_data) == 0:
-                    st.error("No data received from CoinGecko API. Please try again later.")
-                else:
-                    # Create a simple table with basic data
-                    data = []
-                    for coin in coins_data:
-                        # Extract only necessary data with safe defaults
-                        rank = coin.get('market_cap_rank', 'N/A')
-                        name = coin.get('name', 'Unknown')
-                        symbol = coin.get('symbol', '').upper()
-                        price = coin.get('current_price', 0)
-                        price_change = coin.get('price_change_percentage_24h', 0)
-                        market_cap = coin.get('market_cap', 0)
-                        volume = coin.get('total_volume', 0)
-                        
-                        data.append({
-                            'Rank': rank,
-                            'Name': name,
-                            'Symbol': symbol,
-                            'Price (USD)': f"${price:,.2f}" if price else "$0.00",
-                            '24h Change (%)': f"{price_change:+.2f}%" if price_change else "0.00%",
-                            'Market Cap (USD)': f"${market_cap:,.0f}" if market_cap else "$0",
-                            'Volume (24h)': f"${volume:,.0f}" if volume else "$0"
-                        })
-                    
-                    # Create DataFrame and display
-                    df = pd.DataFrame(data)
-                    
-                    # Display the dataframe without selection functionality
-                    st.dataframe(df, use_container_width=True, height=500)
-                    
-                    # Create two columns for Top Gainers and Global Market Statistics in vertical parallel layout
-                    col_left, col_right = st.columns([1, 1])
-                    
-                    # Left column: Top 5 Gainers
-                    with col_left:
-                        st.subheader("🚀 Top 5 Gainers")
-                        
-                        # Sort the data by price change percentage (descending) and get top 5
-                        gainers_data = sorted(coins_data, key=lambda x: x.get('price_change_percentage_24h', 0) or 0, reverse=True)[:5]
-                        
-                        # Display each gainer in a more compact vertical layout
-                        for coin in gainers_data:
-                            # Extract data with safe defaults
-                            name = coin.get('name', 'Unknown')
-                            symbol = coin.get('symbol', '').upper()
-                            price = coin.get('current_price', 0)
-                            price_change = coin.get('price_change_percentage_24h', 0)
-                            coin_id = coin.get('id', '')
-                            market_cap_rank = coin.get('market_cap_rank', 'N/A')
-                            
-                            # Create a more compact card-like container for each coin
-                            with st.container():
-                                # Use smaller columns with adjusted ratios to reduce gap
-                                col1, col2, col3 = st.columns([0.4, 0.6, 1.0])
-                                with col1:
-                                    # Reduce image size and add negative margin to reduce gap
-                                    st.image(coin.get('image', ''), width=25)
-                                with col2:
-                                    # Inline price display with smaller font and reduced padding
-                                    st.write(f"<span style='font-size:0.9em; margin-left:-10px; display:block'>${price:,.2f} <span style='color:{'green' if price_change >= 0 else 'red'}'>{price_change:+.2f}%</span></span>", unsafe_allow_html=True)
-                                with col3:
-                                    # Make the coin name more compact
-                                    coin_name = f"**{name}**"
-                                    if st.button(coin_name, key=f"view_gainer_{coin_id}", use_container_width=True):
-                                        st.session_state.selected_coin = coin_id
-                                        st.session_state.page_view = "coin_detail"
-                                        st.rerun()
-                                # Thinner separator
-                                st.markdown("<hr style='margin:3px 0px; height:1px'>", unsafe_allow_html=True)
-                    
-                    # Right column: Global Market Statistics
-                    with col_right:
-                        st.subheader("🌎 Global Market Statistics")
-                        
-                        with st.spinner("Loading global market data..."):
-                            try:
-                                # Get global market data
-                                global_data = cg.get_global()
-                                
-                                # Extract statistics with robust error handling
-                                # Total Market Cap
-                                total_market_cap = 0
-                                if global_data and 'total_market_cap' in global_data:
-                                    market_cap_data = global_data['total_market_cap']
-                                    if isinstance(market_cap_data, dict) and 'usd' in market_cap_data:
-                                        total_market_cap = market_cap_data['usd']
-                                
-                                # Total Volume
-                                total_volume = 0
-                                if global_data and 'total_volume' in global_data:
-                                    volume_data = global_data['total_volume']
-                                    if isinstance(volume_data, dict) and 'usd' in volume_data:
-                                        total_volume = volume_data['usd']
-                                
-                                # Market Cap Change
-                                market_cap_change = 0
-                                if global_data and 'market_cap_change_percentage_24h_usd' in global_data:
-                                    market_cap_change = global_data['market_cap_change_percentage_24h_usd']
-                                
-                                # Display metrics in vertical layout
-                                st.metric("💰 Total Market Cap", f"${total_market_cap:,.0f}")
-                                st.metric("📊 24h Trading Volume", f"${total_volume:,.0f}")
-                                st.metric("📈 Market Cap Change (24h)", f"{market_cap_change:+.2f}%", delta_color="normal")
-
-                            except Exception as e:
-                                st.error(f"Could not fetch global market data: {str(e)}")
-                    
-            except Exception as e:
-                st.error(f"Error loading market data: {str(e)}")
-                                                
-            except Exception as e:
-                st.error(f"Could not fetch global market data: {str(e)}")
+        # Choose how many coins to page through (fetched 250 at a time and shared by all sessions);
+        # this changes every section of the tab, so it stays outside the fragments
+        size_col, _ = st.columns([1, 1])
+        with size_col:
+            n_coins = st.selectbox("Show top", MARKET_TABLE_SIZES, index=0, key="market_table_size")
+        
+        show_market_table(n_coins)
+        
+        # Create two columns for Top Movers and Global Market Statistics in vertical parallel layout
+        col_left, col_right = st.columns([1, 1])
+        with col_left:
+            show_top_movers(n_coins)
+        with col_right:
+            show_global_stats()
 
     # Tab 2: AI Advisor
     with tab2:
-        # Chat section
-        st.header("Chat with CrypGene")
-        
-        # Create a container for chat messages
-        chat_container = st.container()
-        
-        # Create a container for the input box, which will stay at the bottom
-        input_container = st.container()
-        
-        # Add speech input option
-        with input_container:
-            # Regular text input - now using full width
-            prompt = st.chat_input("Ask me anything about crypto investments or any other investments...", key="chat_input")
-            
-            if prompt:
-                # Add user message to chat history
-                st.session_state.messages.append({"role": "user", "content": prompt})
-                
-                # Get response from the advisor agent
-                response = st.session_state.crypto_advisor.get_response(prompt)
-                
-                # Add assistant response to chat history
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-                # Force a rerun to update the UI
-                st.rerun()
-        
-        # Display current chat messages in the chat container
-        with chat_container:
-            if not st.session_state.messages:
-                # Show welcome message if no messages
-                st.info("👋 Welcome! Ask me anything about cryptocurrency investments.")
-            
-            # Display all messages
-            for message in st.session_state.messages:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+        show_chat()
 
 # Add disclaimer at the bottom of the application
 st.markdown("---")
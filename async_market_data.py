@@ -0,0 +1,170 @@
+# Asyncio access to CoinGecko endpoints over a pooled aiohttp session,
+# sharing the same process-wide cache (and cache keys) as market_data
+import asyncio
+import weakref
+
+import aiohttp
+
+import telemetry
+from coingecko_gateway import (
+    COINGECKO_API_URL, PRIORITY_CHAT, backoff_seconds, endpoint_label, get_gateway, retry_after_seconds,
+)
+from market_cache import get_market_cache, make_key
+from market_data import slim_market_record
+
+# Per-call timeout (in seconds) for upstream requests
+DEFAULT_TIMEOUT = 10
+
+# Maximum number of pooled keep-alive connections per event loop
+DEFAULT_POOL_SIZE = 20
+
+
+class AsyncCoinGeckoClient:
+    def __init__(self, base_url=COINGECKO_API_URL, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, cache=None,
+                 gateway=None):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        # Share the sync gateway's rate limit, retry policy and API key so both paths
+        # together stay within one upstream quota
+        self.gateway = gateway or get_gateway()
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache = cache or get_market_cache()
+        self._session = None
+        # Requests currently in flight on this loop, so concurrent misses share one call
+        self._inflight = {}
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(
+                base_url=self.base_url,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.gateway.headers,
+            )
+        return self._session
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _acquire(self, priority):
+        # Wait for a rate limit token without blocking the event loop
+        while True:
+            wait = self.gateway.bucket.try_acquire(priority)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def request(self, path, params=None, timeout=None, priority=PRIORITY_CHAT):
+        """GET an API path through the shared rate limit and return the decoded JSON body"""
+        session = await self._get_session()
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        max_retries = self.gateway.max_retries
+        endpoint = endpoint_label(path)
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt == max_retries
+            with telemetry.span("rate_limit_wait", endpoint=endpoint):
+                await self._acquire(priority)
+            self.gateway.requests += 1
+            try:
+                with telemetry.span("coingecko", endpoint=endpoint):
+                    async with session.get(path, params=params, **kwargs) as response:
+                        telemetry.count("crypgene_upstream_requests_total", endpoint=endpoint, status=response.status)
+                        if response.status == 429 or response.status >= 500:
+                            delay = retry_after_seconds(response)
+                            if delay is None:
+                                delay = backoff_seconds(attempt)
+                            if response.status == 429:
+                                self.gateway.rate_limited += 1
+                                telemetry.count("crypgene_upstream_rate_limited_total", endpoint=endpoint)
+                                self.gateway.bucket.pause(delay)
+                            if last_attempt:
+                                response.raise_for_status()
+                        else:
+                            response.raise_for_status()
+                            return await response.json()
+            except aiohttp.ClientConnectionError:
+                telemetry.count("crypgene_upstream_requests_total", endpoint=endpoint, status="connection_error")
+                if last_attempt:
+                    raise
+                delay = backoff_seconds(attempt)
+            self.gateway.retries += 1
+            telemetry.count("crypgene_upstream_retries_total", endpoint=endpoint)
+            await asyncio.sleep(delay)
+
+    async def _cached(self, endpoint, key, fetch):
+        # Serve from the shared cache, or run fetch() once for all concurrent callers in every process
+        value = self.cache.get(endpoint, key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get((endpoint, key))
+        if task is None:
+            # With a shared backend, the cache also makes the other worker processes wait for
+            # this fetch (or this one wait for theirs), as the sync path does
+            task = asyncio.ensure_future(self.cache.afetch(endpoint, key, fetch))
+            self._inflight[(endpoint, key)] = task
+            task.add_done_callback(lambda _: self._inflight.pop((endpoint, key), None))
+
+        # shield() so one caller timing out doesn't cancel the request for everyone else
+        return await asyncio.shield(task)
+
+    async def get_global(self, timeout=None):
+        """Get global crypto market data (cached)"""
+        async def fetch():
+            return (await self.request("global", timeout=timeout))["data"]
+        return await self._cached('global', make_key(), fetch)
+
+    async def search(self, query, timeout=None):
+        """Search coins, exchanges and categories by name (cached)"""
+        query = query.strip().lower()
+
+        async def fetch():
+            return await self.request("search", {"query": query}, timeout=timeout)
+        return await self._cached('search', make_key(query), fetch)
+
+    async def get_coins_by_ids(self, coin_ids, vs_currency='usd', timeout=None):
+        """Get slim market records for many coins with a single /coins/markets call (cached per coin)"""
+        results = {}
+        missing = []
+        for coin_id in dict.fromkeys(coin_ids):
+            record = self.cache.get('coin_market', make_key(coin_id, vs_currency))
+            if record is None:
+                missing.append(coin_id)
+            else:
+                results[coin_id] = record
+
+        if missing:
+            batch = tuple(sorted(missing))
+
+            async def fetch():
+                coins = await self.request("coins/markets", {
+                    "vs_currency": vs_currency,
+                    "ids": ",".join(batch),
+                    "per_page": len(batch),
+                    "sparkline": "false",
+                    "price_change_percentage": "7d,30d",
+                }, timeout=timeout)
+                return [slim_market_record(coin) for coin in coins]
+
+            for record in await self._cached('coin_market_batch', make_key(batch, vs_currency), fetch):
+                self.cache.set('coin_market', make_key(record['id'], vs_currency), record)
+                results[record['id']] = record
+
+        # Preserve the caller's order; ids CoinGecko doesn't know are left out
+        return [results[coin_id] for coin_id in dict.fromkeys(coin_ids) if coin_id in results]
+
+
+# One client (and connection pool) per event loop, shared by every conversation on it
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the CoinGecko client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncCoinGeckoClient()
+    return client
@@ -0,0 +1,223 @@
+# Local stand-in for the CoinGecko API that replays recorded fixtures, for offline benchmarks
+#
+# Run it on its own with `python -m benchmarks.fake_coingecko --port 8765` and point the app
+# at it with COINGECKO_API_URL=http://127.0.0.1:8765/api/v3/
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.latency import Latency
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "coingecko.json")
+
+API_PREFIX = "/api/v3/"
+
+# Spacing of the synthetic price history served for market_chart/range, in seconds
+CHART_STEP = 60 * 60
+
+
+def load_fixtures(path=FIXTURES_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def price_history(coin, from_timestamp, to_timestamp, step=CHART_STEP):
+    """Deterministic hourly prices around a coin's current price, aligned to the hour"""
+    start = -(-int(from_timestamp) // step) * step
+    points = []
+    for ts in range(start, int(to_timestamp) + 1, step):
+        # A couple of slow waves, seeded by the coin id so every coin looks different
+        phase = sum(map(ord, coin["id"]))
+        wobble = 0.04 * math.sin(ts / 86400 + phase) + 0.02 * math.sin(ts / 7200 + phase)
+        points.append([ts * 1000, coin["current_price"] * (1 + wobble)])
+    return points
+
+
+def endpoint_name(path):
+    """Path with the coin id replaced, so calls are counted per endpoint"""
+    parts = path.split("/")
+    if parts[0] == "coins" and len(parts) >= 2 and parts[1] not in ("list", "markets"):
+        parts[1] = "{id}"
+    return "/".join(parts)
+
+
+class FakeCoinGecko:
+    """Fixture-backed API with configurable latency and failure injection"""
+    def __init__(self, fixtures=None, latency=0.05, jitter=0.5, error_rate=0.0, rate_limit_rate=0.0, seed=0,
+                 latency_distribution=None):
+        self.fixtures = fixtures or load_fixtures()
+        self.markets = {coin["id"]: coin for coin in self.fixtures["coins_markets"]}
+        # Mean response time in seconds, varied by +/- jitter (as a fraction of it), unless a
+        # benchmarks.latency.Latency distribution is given
+        self.latency = latency
+        self.jitter = jitter
+        self.latency_distribution = latency_distribution
+        # Fraction of requests answered with a 500, and with a 429
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _roll(self):
+        # Returns a number deciding the outcome, and the response delay in seconds
+        with self._lock:
+            roll = self._random.random()
+            if self.latency_distribution is not None:
+                return roll, self.latency_distribution.sample(self._random)
+            return roll, self.latency * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def handle(self, path, params):
+        """Return (status, headers, body) for an API path and its query parameters"""
+        with self._lock:
+            self.calls[endpoint_name(path)] += 1
+
+        roll, delay = self._roll()
+        time.sleep(delay)
+        if roll < self.rate_limit_rate:
+            return 429, {"Retry-After": "1"}, {"status": {"error_code": 429, "error_message": "rate limited"}}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, {}, {"error": "internal error"}
+
+        try:
+            body = self.route(path, params)
+        except KeyError as e:
+            return 404, {}, {"error": f"not found: {e}"}
+        return 200, {}, body
+
+    def route(self, path, params):
+        if path == "global":
+            return self.fixtures["global"]
+        if path == "search/trending":
+            return self.fixtures["trending"]
+        if path == "exchange_rates":
+            return self.fixtures["exchange_rates"]
+        if path == "search":
+            query = params.get("query", "").lower()
+            return {"coins": [
+                {"id": c["id"], "name": c["name"], "symbol": c["symbol"].upper(), "market_cap_rank": c["market_cap_rank"]}
+                for c in self.markets.values()
+                if query and (query in c["name"].lower() or query == c["symbol"])
+            ]}
+        if path == "coins/list":
+            return [{"id": c["id"], "symbol": c["symbol"], "name": c["name"]} for c in self.markets.values()]
+        if path == "coins/markets":
+            return self.coins_markets(params)
+
+        parts = path.split("/")
+        if parts[0] == "coins" and len(parts) == 2:
+            coin = self.markets[parts[1]]
+            return {"id": coin["id"], "symbol": coin["symbol"], "name": coin["name"],
+                    "description": {"en": self.fixtures["descriptions"].get(coin["id"], "")}}
+        if parts[0] == "coins" and parts[2:] == ["market_chart", "range"]:
+            coin = self.markets[parts[1]]
+            return {"prices": price_history(coin, float(params["from"]), float(params["to"]))}
+        raise KeyError(path)
+
+    def coins_markets(self, params):
+        coins = list(self.markets.values())
+        if params.get("ids"):
+            wanted = params["ids"].split(",")
+            coins = [self.markets[coin_id] for coin_id in wanted if coin_id in self.markets]
+        per_page = int(params.get("per_page", 100))
+        page = int(params.get("page", 1))
+        return coins[(page - 1) * per_page:page * per_page]
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if not url.path.startswith(API_PREFIX):
+                status, headers, body = 404, {}, {"error": "unknown path"}
+            else:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, headers, body = api.handle(url.path[len(API_PREFIX):].strip("/"), params)
+
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            # Keep benchmark output readable
+            pass
+
+    return Handler
+
+
+class FakeCoinGeckoServer:
+    """Serve a FakeCoinGecko on a local port from a background thread"""
+    def __init__(self, api=None, host="127.0.0.1", port=0):
+        self.api = api or FakeCoinGecko()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.api))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-coingecko", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded CoinGecko fixtures locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean response time in seconds")
+    parser.add_argument("--latency-distribution", type=Latency.parse,
+                        help="response time distribution, e.g. lognormal:0.1:0.6 (overrides --latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    args = parser.parse_args()
+
+    api = FakeCoinGecko(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                        latency_distribution=args.latency_distribution)
+    server = FakeCoinGeckoServer(api, args.host, args.port)
+    print(f"Fake CoinGecko API at {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
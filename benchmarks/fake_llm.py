@@ -0,0 +1,72 @@
+# Deterministic stand-in for the Gemini chat model, so benchmarks run offline and repeatably
+import hashlib
+import random
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Shared source of randomness for sampled latencies (replies are seeded by the prompt instead)
+_latency_random = random.Random(0)
+
+# Words the fake replies are made of
+VOCABULARY = (
+    "you know bitcoin ethereum market price volatility risk diversify long term hodl chart trend "
+    "support resistance fees wallet exchange stablecoin liquidity momentum sentiment cycle"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Replies with words picked from a hash of the prompt, paced like a streaming LLM"""
+    # Reply length, and the simulated time to first token and between tokens (seconds)
+    reply_words: int = 40
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+
+    # Optional benchmarks.latency.Latency distributions used instead of the fixed times above
+    first_token_distribution: Optional[Any] = None
+    token_distribution: Optional[Any] = None
+
+    # Number of calls made, for benchmark reports
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "crypgene-fake"
+
+    def _reply(self, messages: List[BaseMessage]) -> List[str]:
+        # The same prompt always gets the same answer
+        prompt = "\n".join(str(message.content) for message in messages)
+        seed = int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "big")
+        rng = random.Random(seed)
+        self.calls += 1
+        return [rng.choice(VOCABULARY) for _ in range(self.reply_words)]
+
+    def _first_token_delay(self) -> float:
+        if self.first_token_distribution is None:
+            return self.first_token_latency
+        return self.first_token_distribution.sample(_latency_random)
+
+    def _token_delay(self) -> float:
+        if self.token_distribution is None:
+            return self.token_latency
+        return self.token_distribution.sample(_latency_random)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        words = self._reply(messages)
+        time.sleep(self._first_token_delay() + sum(self._token_delay() for _ in words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        words = self._reply(messages)
+        time.sleep(self._first_token_delay())
+        for i, word in enumerate(words):
+            time.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,60 @@
+# Latency distributions for the offline stand-ins, written as short specs on the command line:
+#
+#   0.05                  always 50 ms
+#   uniform:0.02:0.08     anywhere between 20 and 80 ms
+#   lognormal:0.3:0.5     median 300 ms with a long right tail (sigma 0.5), like most real APIs
+#   exp:0.1               exponential with a 100 ms mean
+import math
+import random
+
+
+class Latency:
+    """A latency distribution that can be sampled in seconds"""
+    KINDS = {"fixed": 1, "uniform": 2, "lognormal": 2, "exp": 1}
+
+    def __init__(self, kind, *params):
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"bad latency distribution: {kind}:{':'.join(map(str, params))}")
+        if any(param < 0 for param in params):
+            raise ValueError("latency parameters must not be negative")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec):
+        """Build a distribution from a spec such as "0.05" or "lognormal:0.3:0.5" """
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, *params = str(spec).strip().split(":")
+        try:
+            if not params:
+                return cls("fixed", float(kind))
+            return cls(kind, *(float(param) for param in params))
+        except ValueError as e:
+            raise ValueError(f"bad latency distribution '{spec}' ({e})") from None
+
+    def sample(self, rng=random):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return median * math.exp(rng.gauss(0, sigma)) if median else 0.0
+        mean = self.params[0]
+        return rng.expovariate(1 / mean) if mean else 0.0
+
+    def mean(self):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return sum(self.params) / 2
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return median * math.exp(sigma ** 2 / 2)
+        return self.params[0]
+
+    def __str__(self):
+        if self.kind == "fixed":
+            return f"{self.params[0]:g}"
+        return ":".join([self.kind, *(f"{param:g}" for param in self.params)])
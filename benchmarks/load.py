@@ -0,0 +1,467 @@
+# Capacity planning: replays conversations against many concurrent CryptoAdvisor sessions, with
+# CoinGecko and Gemini replaced by local stand-ins whose latencies follow configurable
+# distributions (see benchmarks/latency.py), and steps up the number of users to show where one
+# box saturates: throughput, latency, time spent queueing for a turn slot, memory per session
+# and how many upstream calls each turn costs.
+#
+#   python -m benchmarks.load                                   # synthetic users, 1 to 64
+#   python -m benchmarks.load --users 8,32,128 --think exp:5 --llm-first-token lognormal:0.8:0.6
+#   python -m benchmarks.load --chat-store data/chat_history.sqlite3 --slo 4
+#   python -m benchmarks.load --mode async --users 64,256    # aget_response on one event loop
+#   python -m benchmarks.load --mode processes --processes 4 # like uvicorn --workers 4
+#
+# Every user replays one transcript, turn after turn, pausing for a think time in between. At
+# most --slots turns run at once per process (the service's CRYPGENE_MAX_CONCURRENT_TURNS);
+# the rest queue for a slot, and that wait is reported as the queueing delay.
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.fake_coingecko import FakeCoinGecko, FakeCoinGeckoServer
+from benchmarks.latency import Latency
+from benchmarks.run import configure_environment, percentiles, reset_caches
+from benchmarks.workloads import GENERAL_QUESTIONS, MARKET_QUESTIONS, PRICE_QUESTIONS
+
+DEFAULT_USERS = "1,2,4,8,16,32,64"
+
+# Turns in flight per process, as in service.py
+DEFAULT_SLOTS = int(os.getenv("CRYPGENE_MAX_CONCURRENT_TURNS", "32"))
+
+# Mix of synthetic questions: mostly price lookups, as in the app's chat history
+SYNTHETIC_MIX = ((PRICE_QUESTIONS, 0.6), (MARKET_QUESTIONS, 0.25), (GENERAL_QUESTIONS, 0.15))
+
+# Width of the bars in the saturation chart
+CHART_WIDTH = 40
+
+
+def synthetic_transcripts(users, turns, seed=0):
+    """One transcript of `turns` questions per user, drawn from the question pools"""
+    rng = random.Random(seed)
+    pools, weights = zip(*SYNTHETIC_MIX)
+    return [[rng.choice(rng.choices(pools, weights)[0]) for _ in range(turns)] for _ in range(users)]
+
+
+def load_transcripts(path):
+    """Read transcripts from JSON: a list of conversations, each a list of user queries or of
+    {"role", "content"} messages (assistant messages are skipped)"""
+    with open(path, "r", encoding="utf-8") as f:
+        conversations = json.load(f)
+    transcripts = []
+    for conversation in conversations:
+        if isinstance(conversation, dict):
+            conversation = conversation.get("messages", [])
+        queries = [m if isinstance(m, str) else m["content"] for m in conversation
+                   if isinstance(m, str) or m.get("role") == "user"]
+        if queries:
+            transcripts.append(queries)
+    return transcripts
+
+
+def chat_store_transcripts(path, limit):
+    """The user side of the most recent conversations in a chat history database"""
+    from chat_store import ChatStore
+    store = ChatStore(path)
+    # Every user's chats, most recent first
+    conversations = sorted(
+        ((owner, conversation) for owner in store.owners()
+         for conversation in store.list_conversations(owner, page_size=limit)),
+        key=lambda item: item[1]["updated_at"], reverse=True)[:limit]
+    transcripts = []
+    for owner, conversation in conversations:
+        queries = [m["content"] for m in store.get_messages(owner, conversation["id"]) if m["role"] == "user"]
+        if queries:
+            transcripts.append(queries)
+    return transcripts
+
+
+def transcripts_for(users, source, turns):
+    """Give every user a transcript, reusing recorded ones round-robin when there are fewer"""
+    if source is None:
+        return synthetic_transcripts(users, turns)
+    return [source[i % len(source)][:turns] if turns else source[i % len(source)] for i in range(users)]
+
+
+class Recorder:
+    """Per-turn samples from all users of one run, in seconds"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.ttfts = []
+        self.queue_delays = []
+        self.service_times = []
+        self.errors = 0
+
+    def add(self, submitted, started, first_token, finished, failed):
+        with self.lock:
+            self.latencies.append(finished - submitted)
+            self.queue_delays.append(started - submitted)
+            self.service_times.append(finished - started)
+            if first_token is not None:
+                self.ttfts.append(first_token - submitted)
+            self.errors += failed
+
+
+def run_threads(advisors, transcripts, slots, think, seed, recorder, error_prefix):
+    """One thread per user streaming its turns, at most `slots` turns at once"""
+    semaphore = threading.BoundedSemaphore(slots)
+
+    def user(i):
+        rng = random.Random(seed + i)
+        for query in transcripts[i]:
+            time.sleep(think.sample(rng))
+            submitted = time.perf_counter()
+            with semaphore:
+                started = time.perf_counter()
+                first_token = None
+                chunks = []
+                for chunk in advisors[i].stream_response(query):
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    chunks.append(chunk)
+            finished = time.perf_counter()
+            recorder.add(submitted, started, first_token or finished, finished,
+                         "".join(chunks).startswith(error_prefix))
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(len(advisors))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_async(advisors, transcripts, slots, think, seed, recorder, error_prefix):
+    """One task per user on a single event loop, as the service runs them"""
+    async def user(i, semaphore):
+        rng = random.Random(seed + i)
+        for query in transcripts[i]:
+            await asyncio.sleep(think.sample(rng))
+            submitted = time.perf_counter()
+            async with semaphore:
+                started = time.perf_counter()
+                response = await advisors[i].aget_response(query)
+            finished = time.perf_counter()
+            # aget_response doesn't stream, so there's no separate time to first token
+            recorder.add(submitted, started, None, finished, response.startswith(error_prefix))
+
+    async def main():
+        semaphore = asyncio.Semaphore(slots)
+        await asyncio.gather(*(user(i, semaphore) for i in range(len(advisors))))
+
+    asyncio.run(main())
+
+
+RUNNERS = {"threads": run_threads, "async": run_async}
+
+
+def span_totals(name):
+    """(count, total seconds) recorded for a telemetry span so far"""
+    import telemetry
+    count, total = 0, 0.0
+    for h in telemetry.get_registry().snapshot()["histograms"]:
+        if h["name"] == "crypgene_span_seconds" and h["labels"].get("span") == name:
+            count += h["count"]
+            total += h["sum"]
+    return count, total
+
+
+def run_users(transcripts, mode, slots, think, llm_settings, track_memory, seed=0):
+    """Replay transcripts, one concurrent user each, in this process; returns raw samples"""
+    import telemetry
+    from agent import CryptoAdvisor, error_response
+    from benchmarks.fake_llm import FakeChatModel
+
+    telemetry.configure(enabled=True)
+    telemetry.get_registry().clear()
+    reset_caches()
+    error_prefix = error_response("").split("(Error")[0]
+    llm = FakeChatModel(**llm_settings)
+
+    if track_memory:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0] if track_memory else 0
+    advisors = []
+    for _ in transcripts:
+        advisor = CryptoAdvisor()
+        advisor.llm = llm
+        advisors.append(advisor)
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    RUNNERS[mode](advisors, transcripts, slots, think, seed, recorder, error_prefix)
+    wall = time.perf_counter() - start
+
+    # Memory still held while every session is alive, conversation history included
+    memory = peak = 0
+    if track_memory:
+        memory_after, memory_peak = tracemalloc.get_traced_memory()
+        memory, peak = memory_after - memory_before, memory_peak - memory_before
+        tracemalloc.stop()
+
+    rate_limit_waits, rate_limit_wait_s = span_totals("rate_limit_wait")
+    return {
+        "latencies": recorder.latencies,
+        "ttfts": recorder.ttfts,
+        "queue_delays": recorder.queue_delays,
+        "service_times": recorder.service_times,
+        "errors": recorder.errors,
+        "wall_s": wall,
+        "llm_calls": llm.calls,
+        "retained_bytes": memory,
+        "peak_bytes": peak,
+        "rate_limit_waits": rate_limit_waits,
+        "rate_limit_wait_s": rate_limit_wait_s,
+    }
+
+
+def _run_users_quietly(args):
+    # Entry point of the worker processes in processes mode
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_users(*args)
+
+
+def merge(parts):
+    """Combine the samples of several worker processes"""
+    merged = {key: [] for key in ("latencies", "ttfts", "queue_delays", "service_times")}
+    for part in parts:
+        for key in merged:
+            merged[key].extend(part[key])
+    for key in ("errors", "llm_calls", "retained_bytes", "peak_bytes", "rate_limit_waits", "rate_limit_wait_s"):
+        merged[key] = sum(part[key] for part in parts)
+    merged["wall_s"] = max(part["wall_s"] for part in parts)
+    return merged
+
+
+def summarize(users, raw, upstream_calls, upstream_by_endpoint):
+    turns = len(raw["latencies"])
+    wall = raw["wall_s"]
+    latency = percentiles(raw["latencies"])
+    ttft = percentiles(raw["ttfts"])
+    queue = percentiles(raw["queue_delays"])
+    service = percentiles(raw["service_times"])
+    return {
+        "users": users,
+        "turns": turns,
+        "errors": raw["errors"],
+        "wall_s": round(wall, 3),
+        "throughput_tps": round(turns / wall, 2) if wall else 0.0,
+        "latency_p50_ms": latency[50],
+        "latency_p95_ms": latency[95],
+        "latency_p99_ms": latency[99],
+        "ttft_p95_ms": ttft[95] if raw["ttfts"] else None,
+        # Time waiting for a turn slot, and time spent in the turn once it had one
+        "queue_p50_ms": queue[50],
+        "queue_p95_ms": queue[95],
+        "service_p50_ms": service[50],
+        "service_p95_ms": service[95],
+        # Time turns spent waiting on the gateway's CoinGecko rate limit
+        "rate_limit_wait_ms_per_turn": round(raw["rate_limit_wait_s"] * 1000 / turns, 1) if turns else 0.0,
+        # Upstream calls each turn caused, after caching and request coalescing
+        "upstream_calls": upstream_calls,
+        "upstream_per_turn": round(upstream_calls / turns, 3) if turns else 0.0,
+        "upstream_by_endpoint": upstream_by_endpoint,
+        "llm_calls": raw["llm_calls"],
+        "llm_per_turn": round(raw["llm_calls"] / turns, 3) if turns else 0.0,
+        "retained_kb_per_session": round(raw["retained_bytes"] / 1024 / users, 1) if raw["retained_bytes"] else None,
+        "peak_kb": round(raw["peak_bytes"] / 1024, 1) if raw["peak_bytes"] else None,
+    }
+
+
+def run_level(users, args, source, api, llm_settings):
+    transcripts = transcripts_for(users, source, args.turns)
+    api.reset_counts()
+    run_args = (args.mode if args.mode != "processes" else "threads", args.slots, args.think, llm_settings,
+                not args.no_memory)
+    if args.mode == "processes":
+        # Users are spread over the workers; each has its own caches, rate limit and slots
+        context = multiprocessing.get_context("spawn")
+        shares = [transcripts[i::args.processes] for i in range(args.processes)]
+        jobs = [(share, *run_args, args.seed + i) for i, share in enumerate(shares) if share]
+        with context.Pool(len(jobs)) as pool:
+            raw = merge(pool.map(_run_users_quietly, jobs))
+    else:
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with log:
+            raw = run_users(transcripts, *run_args, args.seed)
+    return summarize(users, raw, api.total_calls(), dict(sorted(api.calls.items())))
+
+
+def marginal_session_kb(levels):
+    """Memory each extra session adds, from a straight-line fit over the levels (None if it can't)"""
+    points = [(r["users"], r["retained_kb_per_session"] * r["users"]) for r in levels
+              if r["retained_kb_per_session"] is not None]
+    if len({users for users, _ in points}) < 2:
+        return None
+    users, retained = np.array(points, dtype=np.float64).T
+    slope, _ = np.polyfit(users, retained, 1)
+    return round(float(slope), 1)
+
+
+def capacity(levels, slo_ms):
+    """Most users served with p95 latency within the SLO and no errors, or None"""
+    fitting = [r["users"] for r in levels if r["latency_p95_ms"] <= slo_ms and not r["errors"]]
+    return max(fitting) if fitting else None
+
+
+def saturation_point(levels, gain=0.1):
+    """First level after which adding users raised throughput by less than `gain` (relative)"""
+    for previous, current in zip(levels, levels[1:]):
+        if previous["throughput_tps"] and current["throughput_tps"] < previous["throughput_tps"] * (1 + gain):
+            return previous["users"]
+    return None
+
+
+def bar(value, peak, width=CHART_WIDTH):
+    return "#" * max(1, round(width * value / peak)) if peak and value else ""
+
+
+def print_report(levels, slo_ms):
+    header = f"{'users':>5} {'turns':>5} {'err':>4} {'tps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft95':>8} " \
+             f"{'queue95':>8} {'svc95':>8} {'up/turn':>8} {'KB/sess':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in levels:
+        ttft = r["ttft_p95_ms"] if r["ttft_p95_ms"] is not None else "-"
+        memory = r["retained_kb_per_session"] if r["retained_kb_per_session"] is not None else "-"
+        print(f"{r['users']:>5} {r['turns']:>5} {r['errors']:>4} {r['throughput_tps']:>7} {r['latency_p50_ms']:>8} "
+              f"{r['latency_p95_ms']:>8} {r['latency_p99_ms']:>8} {ttft:>8} {r['queue_p95_ms']:>8} "
+              f"{r['service_p95_ms']:>8} {r['upstream_per_turn']:>8} {memory:>8}")
+
+    # Saturation curves: throughput flattens and latency climbs once the box is full
+    peak_tps = max(r["throughput_tps"] for r in levels)
+    peak_latency = max(r["latency_p95_ms"] for r in levels)
+    print("\nThroughput (turns/s)")
+    for r in levels:
+        print(f"{r['users']:>5} {bar(r['throughput_tps'], peak_tps):<{CHART_WIDTH}} {r['throughput_tps']}")
+    print("\np95 latency (ms), of which queueing")
+    for r in levels:
+        total = bar(r["latency_p95_ms"], peak_latency)
+        queued = "=" * min(len(total), round(CHART_WIDTH * r["queue_p95_ms"] / peak_latency)) if peak_latency else ""
+        print(f"{r['users']:>5} {(queued + total[len(queued):]):<{CHART_WIDTH}} "
+              f"{r['latency_p95_ms']} ({r['queue_p95_ms']} queued)")
+
+    print()
+    knee = saturation_point(levels)
+    if knee is not None:
+        print(f"Throughput stops scaling past {knee} users")
+    fits = capacity(levels, slo_ms)
+    if fits is None:
+        print(f"No level kept p95 latency within {slo_ms:g} ms without errors")
+    else:
+        print(f"Capacity at p95 <= {slo_ms:g} ms: {fits} concurrent users")
+    marginal = marginal_session_kb(levels)
+    if marginal is not None:
+        print(f"Each extra session holds about {marginal} KB")
+
+
+def parse_users(text):
+    levels = sorted({int(part) for part in text.split(",") if part.strip()})
+    if not levels or levels[0] < 1:
+        raise argparse.ArgumentTypeError("users must be positive integers, e.g. 1,4,16")
+    return levels
+
+
+def latency_spec(text):
+    try:
+        return Latency.parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find how many concurrent chat users one CrypGene box can serve")
+    parser.add_argument("--users", type=parse_users, default=parse_users(DEFAULT_USERS),
+                        help=f"comma-separated concurrency levels to step through (default: {DEFAULT_USERS})")
+    parser.add_argument("--mode", choices=["threads", "async", "processes"], default="threads",
+                        help="stream_response on threads, aget_response on one event loop, or threads in "
+                             "several worker processes")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2, help="worker processes (processes mode)")
+    parser.add_argument("--slots", type=int, default=DEFAULT_SLOTS, help="turns in flight per process")
+    parser.add_argument("--turns", type=int, default=5,
+                        help="turns per user (synthetic), or a cap on replayed ones (0 replays them all)")
+    parser.add_argument("--transcripts", help="JSON file of conversations to replay")
+    parser.add_argument("--chat-store", help="replay the user turns of a chat history database")
+    parser.add_argument("--conversations", type=int, default=200, help="conversations read from --chat-store")
+    parser.add_argument("--think", type=latency_spec, default=Latency.parse("0"),
+                        help="pause before each turn, e.g. exp:5 (default: none, i.e. closed loop)")
+    parser.add_argument("--latency", type=latency_spec, default=Latency.parse("uniform:0.025:0.075"),
+                        help="fake CoinGecko response time distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of CoinGecko requests failing with 500")
+    parser.add_argument("--rate-limit", type=float, default=50.0, help="gateway requests per second")
+    parser.add_argument("--llm-first-token", type=latency_spec, default=Latency.parse("0.3"),
+                        help="fake LLM time to first token distribution")
+    parser.add_argument("--llm-token", type=latency_spec, default=Latency.parse("0.01"),
+                        help="fake LLM time per token distribution")
+    parser.add_argument("--slo", type=float, default=2.0, help="p95 latency target in seconds, for the capacity line")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (faster, no memory figures)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    args = parser.parse_args(argv)
+    if args.mode == "processes" and not args.no_memory:
+        print("Memory figures are per worker process and summed across them")
+
+    source = None
+    if args.transcripts:
+        source = load_transcripts(args.transcripts)
+    elif args.chat_store:
+        source = chat_store_transcripts(args.chat_store, args.conversations)
+    if source is not None and not source:
+        print("No conversations with user messages to replay")
+        return 1
+
+    config = {
+        "mode": args.mode,
+        "processes": args.processes if args.mode == "processes" else 1,
+        "slots": args.slots,
+        "turns": args.turns,
+        "transcripts": args.transcripts or args.chat_store or "synthetic",
+        "think": str(args.think),
+        "latency": str(args.latency),
+        "error_rate": args.error_rate,
+        "rate_limit": args.rate_limit,
+        "llm_first_token": str(args.llm_first_token),
+        "llm_token": str(args.llm_token),
+    }
+    llm_settings = {"first_token_distribution": args.llm_first_token, "token_distribution": args.llm_token}
+
+    api = FakeCoinGecko(error_rate=args.error_rate, latency_distribution=args.latency)
+    with FakeCoinGeckoServer(api) as server, tempfile.TemporaryDirectory() as data_dir:
+        # Worker processes inherit this environment
+        configure_environment(server.url, args.rate_limit, data_dir)
+
+        # Build the local coin index up front (and on disk, for worker processes), so the first
+        # level isn't charged for it
+        from coin_index import get_coin_index
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_coin_index()
+
+        levels = []
+        for users in args.users:
+            result = run_level(users, args, source, api, llm_settings)
+            levels.append(result)
+            print(f"{users} users: {result['throughput_tps']} turns/s, p95 {result['latency_p95_ms']} ms",
+                  file=sys.stderr)
+
+    print_report(levels, args.slo * 1000)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "levels": levels, "capacity_users": capacity(levels, args.slo * 1000),
+                       "saturation_users": saturation_point(levels),
+                       "marginal_session_kb": marginal_session_kb(levels)}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
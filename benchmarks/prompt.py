@@ -0,0 +1,187 @@
+# Prompt preparation benchmark: CPU time and prompt tokens spent on each turn before the LLM is
+# called. It compares a prompt template and data block rendered from scratch every turn (how the
+# advisor used to build prompts) with the prepared prompt and shared data snippets in
+# prepared_prompt.py. Both run over the same sessions, questions and recorded market data,
+# fully offline.
+#
+#   python -m benchmarks.prompt
+#   python -m benchmarks.prompt --sessions 200 --turns 12 --currency eur
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_coingecko import FakeCoinGecko, FakeCoinGeckoServer, load_fixtures
+from benchmarks.run import configure_environment
+from benchmarks.workloads import GENERAL_QUESTIONS, MARKET_QUESTIONS, PRICE_QUESTIONS
+
+# Answer recorded for every turn; its length is typical of the advisor's 80-word replies
+REPLY = ("You know, it's like riding a wave: prices move fast, so keep an eye on the trend, "
+         "size your position so a dip doesn't hurt, and never invest more than you can afford to lose. ") * 2
+
+
+def legacy_data_block(crypto_data, currency):
+    """The verbose data block, rebuilt with string concatenation on every turn"""
+    from currency import format_money
+    if isinstance(crypto_data, list):
+        return "".join(legacy_data_block(coin, currency) for coin in crypto_data)
+    code = currency.upper()
+    if 'current_price' in crypto_data:
+        block = f"\n\nLatest data for {crypto_data['name']} ({crypto_data['symbol']}):\n"
+        block += f"Current Price: {format_money(crypto_data['current_price'], currency)} {code}\n"
+        if crypto_data.get('price_change_24h') is not None:
+            change = crypto_data['price_change_24h']
+            block += f"24h Change: {'up' if change > 0 else 'down'} {abs(change):.2f}%\n"
+        for label, field in (("7d", 'price_change_7d'), ("30d", 'price_change_30d')):
+            if crypto_data.get(field) is not None:
+                block += f"{label} Change: {crypto_data[field]:+.2f}%\n"
+        if crypto_data.get('market_cap') is not None:
+            block += f"Market Cap: {format_money(crypto_data['market_cap'], currency, 0)} {code}\n"
+        return block
+    block = "\n\nLatest Global Crypto Market Data:\n"
+    block += f"Total Market Cap: {format_money(crypto_data['total_market_cap'], currency, 0)} {code}\n"
+    block += f"24h Market Change: {crypto_data['market_cap_change_percentage_24h_usd']:.2f}%\n"
+    block += f"Active Cryptocurrencies: {crypto_data['active_cryptocurrencies']}\n"
+    return block
+
+
+def legacy_template(system_message):
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    return ChatPromptTemplate.from_messages([
+        ("system", system_message),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}"),
+    ])
+
+
+def make_sessions(sessions, turns, coins, global_data, seed=0):
+    """(question, market data) pairs for every turn of every session"""
+    rng = random.Random(seed)
+    # Popular coins come up far more often, as in real traffic
+    weights = [1 / (rank + 1) for rank in range(len(coins))]
+    scripts = []
+    for _ in range(sessions):
+        script = []
+        for _ in range(turns):
+            roll = rng.random()
+            if roll < 0.6:
+                script.append((rng.choice(PRICE_QUESTIONS), rng.choices(coins, weights)[0]))
+            elif roll < 0.7:
+                script.append(("Compare them", rng.sample(coins[:5], 2)))
+            elif roll < 0.85:
+                script.append((rng.choice(MARKET_QUESTIONS), global_data))
+            else:
+                script.append((rng.choice(GENERAL_QUESTIONS), None))
+        scripts.append(script)
+    return scripts
+
+
+def prompt_tokens(prompt_value):
+    from agent import message_text
+    from conversation_memory import estimate_tokens
+    return sum(estimate_tokens(message_text(message)) for message in prompt_value.to_messages())
+
+
+def replay(scripts, build):
+    """Build every turn's prompt with build(memory, query, data); returns (cpu seconds, tokens)"""
+    from conversation_memory import ConversationMemory
+    cpu = 0.0
+    tokens = []
+    for script in scripts:
+        memory = ConversationMemory()
+        for query, data in script:
+            start = time.process_time()
+            prompt_value, data_context = build(memory, query, data)
+            cpu += time.process_time() - start
+            tokens.append(prompt_tokens(prompt_value))
+            memory.add_turn(query, REPLY, data_context)
+    return cpu, tokens
+
+
+def run(scripts, currency):
+    from agent import SYSTEM_MESSAGE
+    from prepared_prompt import SnippetCache, data_block, get_prepared_prompt, system_prefix
+    from conversation_memory import estimate_tokens
+
+    template = legacy_template(SYSTEM_MESSAGE)
+
+    def legacy(memory, query, data):
+        data_context = legacy_data_block(data, currency) if data else ""
+        # The history used to be rebuilt for every prompt
+        memory._messages = None
+        return template.invoke({"history": memory.messages(), "input": query + data_context}), data_context
+
+    prepared = get_prepared_prompt(SYSTEM_MESSAGE)
+    snippets = SnippetCache()
+
+    def prepared_turn(memory, query, data):
+        data_context = data_block(data, currency, snippets) if data else ""
+        return prepared.render(memory.messages(), query + data_context), data_context
+
+    turns = sum(len(script) for script in scripts)
+    results = {}
+    for name, build in (("legacy", legacy), ("prepared", prepared_turn)):
+        cpu, tokens = replay(scripts, build)
+        results[name] = {
+            "turns": turns,
+            "cpu_us_per_turn": round(cpu / turns * 1e6, 1),
+            "tokens_per_turn": round(sum(tokens) / turns, 1),
+        }
+    results["prepared"]["snippets"] = snippets.stats()
+    # Tokens at the head of every prompt that Gemini can serve from its cache
+    results["legacy"]["static_prefix_tokens"] = estimate_tokens(SYSTEM_MESSAGE)
+    results["prepared"]["static_prefix_tokens"] = estimate_tokens(system_prefix(SYSTEM_MESSAGE))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure per-turn prompt preparation cost")
+    parser.add_argument("--sessions", type=int, default=100, help="conversations replayed")
+    parser.add_argument("--turns", type=int, default=8, help="turns per conversation")
+    parser.add_argument("--currency", default="usd", help="currency the data is quoted in")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures()
+    api = FakeCoinGecko(fixtures, latency=0.0)
+    with FakeCoinGeckoServer(api) as server, tempfile.TemporaryDirectory() as data_dir:
+        # Only used for the exchange rates when --currency isn't the base currency
+        configure_environment(server.url, 50.0, data_dir)
+        from agent import global_summary
+        from currency import display_currency
+        from market_data import slim_market_record
+
+        coins = [slim_market_record(coin) for coin in fixtures["coins_markets"]]
+        global_data = global_summary(fixtures["global"]["data"])
+        scripts = make_sessions(args.sessions, args.turns, coins, global_data, args.seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            currency = display_currency(args.currency)
+            results = run(scripts, currency)
+
+    legacy, prepared = results["legacy"], results["prepared"]
+    print(f"{'':<10} {'CPU us/turn':>12} {'tokens/turn':>12} {'static prefix':>14}")
+    print("-" * 51)
+    for name, r in results.items():
+        print(f"{name:<10} {r['cpu_us_per_turn']:>12} {r['tokens_per_turn']:>12} {r['static_prefix_tokens']:>14}")
+    cpu_saved = 1 - prepared["cpu_us_per_turn"] / legacy["cpu_us_per_turn"] if legacy["cpu_us_per_turn"] else 0.0
+    tokens_saved = legacy["tokens_per_turn"] - prepared["tokens_per_turn"]
+    snippets = prepared["snippets"]
+    lookups = snippets["hits"] + snippets["misses"]
+    print(f"\nPrompt preparation CPU: {cpu_saved:.0%} less per turn")
+    print(f"Prompt size: {tokens_saved:.1f} fewer tokens per turn ({tokens_saved * legacy['turns']:,.0f} over the run)")
+    if lookups:
+        print(f"Data snippets: {snippets['entries']} rendered, reused for {snippets['hits'] / lookups:.0%} of lookups")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
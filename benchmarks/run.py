@@ -0,0 +1,243 @@
+# Offline benchmark runner: replays scripted workloads against CryptoAdvisor with CoinGecko and
+# Gemini replaced by local stand-ins, reports latency, throughput, upstream calls and memory, and
+# fails when results regress against a stored baseline.
+#
+#   python -m benchmarks.run                      # run every workload, compare with the baseline
+#   python -m benchmarks.run --save-baseline      # record the current results as the baseline
+#   python -m benchmarks.run -w price_lookups --latency 0.2 --error-rate 0.05
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fake_coingecko import FakeCoinGecko, FakeCoinGeckoServer
+from benchmarks.workloads import WORKLOADS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Relative change past which a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Metrics checked against the baseline, and whether higher values are worse. Only counts are
+# gated: with the fixtures and the fake chat model they're the same on every machine, while
+# latency, throughput and memory are reported but vary too much between machines to compare
+CHECKED_METRICS = {
+    "errors": True,
+    "upstream_per_turn": True,
+    "llm_per_turn": True,
+}
+
+
+def percentiles(values, qs=(50, 95, 99)):
+    if not values:
+        return {q: 0.0 for q in qs}
+    points = np.percentile(np.asarray(values, dtype=np.float64) * 1000, qs)
+    return {q: round(float(p), 1) for q, p in zip(qs, points)}
+
+
+def configure_environment(server_url, rate_limit, data_dir):
+    # Must run before agent/market_data are imported: the gateway reads these at import time
+    os.environ["COINGECKO_API_URL"] = server_url
+    os.environ["COINGECKO_RATE_LIMIT"] = str(rate_limit)
+    os.environ["CRYPGENE_DATA_DIR"] = data_dir
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+
+def reset_caches():
+    """Start every workload cold, so its numbers don't depend on what ran before"""
+    from market_cache import get_market_cache
+    from response_cache import get_response_cache
+    get_market_cache().invalidate()
+    get_response_cache().clear()
+
+
+def run_session(advisor, queries, error_prefix):
+    """Run one conversation through stream_response; returns (latencies, ttfts, errors)"""
+    latencies, ttfts, errors = [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        first_token = None
+        chunks = []
+        for chunk in advisor.stream_response(query):
+            if first_token is None:
+                first_token = time.perf_counter()
+            chunks.append(chunk)
+        latencies.append(time.perf_counter() - start)
+        ttfts.append((first_token or time.perf_counter()) - start)
+        if "".join(chunks).startswith(error_prefix):
+            errors += 1
+    return latencies, ttfts, errors
+
+
+def run_workload(workload, api, llm_settings):
+    from agent import CryptoAdvisor, error_response
+    from benchmarks.fake_llm import FakeChatModel
+
+    reset_caches()
+    api.reset_counts()
+    error_prefix = error_response("").split("(Error")[0]
+
+    llm = FakeChatModel(**llm_settings)
+    advisors = []
+    for _ in workload.sessions:
+        advisor = CryptoAdvisor()
+        advisor.llm = llm
+        advisors.append(advisor)
+
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(workload.sessions)) as pool:
+        results = list(pool.map(lambda args: run_session(*args, error_prefix), zip(advisors, workload.sessions)))
+    wall = time.perf_counter() - start
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+
+    latencies = [latency for result in results for latency in result[0]]
+    ttfts = [ttft for result in results for ttft in result[1]]
+    latency = percentiles(latencies)
+    ttft = percentiles(ttfts)
+    return {
+        "sessions": len(workload.sessions),
+        "turns": len(latencies),
+        "errors": sum(result[2] for result in results),
+        "wall_s": round(wall, 3),
+        "throughput_tps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_p50_ms": latency[50],
+        "latency_p95_ms": latency[95],
+        "latency_p99_ms": latency[99],
+        "ttft_p50_ms": ttft[50],
+        "ttft_p95_ms": ttft[95],
+        "upstream_calls": api.total_calls(),
+        "upstream_by_endpoint": dict(sorted(api.calls.items())),
+        "upstream_per_turn": round(api.total_calls() / len(latencies), 3) if latencies else 0.0,
+        "llm_calls": llm.calls,
+        "llm_per_turn": round(llm.calls / len(latencies), 3) if latencies else 0.0,
+        # Memory still held by the sessions after the workload, and the high-water mark during it
+        "retained_kb": round((memory_after - memory_before) / 1024, 1),
+        "peak_kb": round((memory_peak - memory_before) / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return a list of human-readable regressions against the baseline results"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric, higher_is_worse in CHECKED_METRICS.items():
+            if metric not in expected:
+                continue
+            old, new = expected[metric], result[metric]
+            change = (new - old) / old if old else (1.0 if new != old else 0.0)
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            if worse:
+                regressions.append(f"{name}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_report(results):
+    header = f"{'workload':<20} {'turns':>5} {'err':>4} {'tps':>7} {'p50':>8} {'p95':>8} {'p99':>8} " \
+             f"{'ttft95':>8} {'upstream':>8} {'llm':>5} {'peak KB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<20} {r['turns']:>5} {r['errors']:>4} {r['throughput_tps']:>7} {r['latency_p50_ms']:>8} "
+              f"{r['latency_p95_ms']:>8} {r['latency_p99_ms']:>8} {r['ttft_p95_ms']:>8} "
+              f"{r['upstream_calls']:>8} {r['llm_calls']:>5} {r['peak_kb']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run CrypGene's offline benchmarks")
+    parser.add_argument("-w", "--workload", action="append", choices=sorted(WORKLOADS),
+                        help="workload to run (repeatable; default: all)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake CoinGecko mean response time (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of CoinGecko requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of CoinGecko requests failing with 429")
+    parser.add_argument("--rate-limit", type=float, default=50.0, help="gateway requests per second")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="fake LLM time to first token (s)")
+    parser.add_argument("--llm-token", type=float, default=0.01, help="fake LLM time per token (s)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--no-baseline", action="store_true",
+                        help="only report the results, without comparing them to a baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative regression")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    args = parser.parse_args(argv)
+
+    config = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "rate_limit": args.rate_limit,
+        "llm_first_token": args.llm_first_token,
+        "llm_token": args.llm_token,
+    }
+    llm_settings = {"first_token_latency": args.llm_first_token, "token_latency": args.llm_token}
+    names = args.workload or list(WORKLOADS)
+
+    api = FakeCoinGecko(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    with FakeCoinGeckoServer(api) as server, tempfile.TemporaryDirectory() as data_dir:
+        configure_environment(server.url, args.rate_limit, data_dir)
+        tracemalloc.start()
+
+        # Build the local coin index up front, so the first workload isn't charged for it
+        from coin_index import get_coin_index
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_coin_index()
+
+        results = {}
+        for name in names:
+            log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with log:
+                results[name] = run_workload(WORKLOADS[name], api, llm_settings)
+
+        tracemalloc.stop()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if args.no_baseline:
+        return 0
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        # A missing baseline must not pass the gate silently
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one, "
+              f"or pass --no-baseline to skip the comparison")
+        return 1
+
+    if baseline.get("config") != config:
+        print("\nWarning: baseline was recorded with different settings, comparison may be meaningless")
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+    if regressions:
+        print("\nRegressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# Cold start benchmark: how long a fresh Python process takes to import what each entry point
+# needs, and to render app.py's first page (against the fake CoinGecko server). Every sample
+# runs in a new interpreter, so nothing is already imported or cached.
+#
+#   python -m benchmarks.startup                  # import times and first render
+#   python -m benchmarks.startup --repeat 10 --detail
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fake_coingecko import FakeCoinGecko, FakeCoinGeckoServer
+from benchmarks.run import configure_environment
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code timed in a fresh interpreter for each import scenario
+IMPORT_TARGETS = {
+    # What the market overview needs; it should never pull in LangChain or Gemini
+    "market_overview": "import market_data, market_snapshot, market_refresher, price_store, chat_store, "
+                       "advisor_client",
+    # The first chat turn: the advisor, plus the shared LLM client and prompt it builds on first use
+    "first_chat_turn": "import agent; agent.CryptoAdvisor().prompt; agent.get_llm()",
+    "service": "import service",
+}
+
+# Modules that must not be loaded by the time the first page has rendered
+DEFERRED_MODULES = ("langchain_google_genai", "langchain_core", "plotly")
+
+_IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+_RENDER_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file("app.py", default_timeout={timeout})
+app.run()
+rendered = time.perf_counter()
+print(json.dumps({{
+    "streamlit_import_s": imported - start,
+    "render_s": rendered - imported,
+    "exceptions": [str(e.value) for e in app.exception],
+    "loaded": [name for name in {deferred!r} if name in sys.modules],
+}}))
+sys.stdout.flush()
+# The app's background refresher would keep the interpreter alive
+os._exit(0)
+"""
+
+
+def run_python(code, args=()):
+    result = subprocess.run([sys.executable, *args, "-c", code], cwd=REPO_ROOT, capture_output=True,
+                            text=True, env=os.environ.copy())
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return result
+
+
+def time_import(code, repeat):
+    """Median and best wall time (ms) to run code in a fresh interpreter"""
+    samples = []
+    for _ in range(repeat):
+        output = run_python(_IMPORT_SCRIPT.format(code=code)).stdout.strip().splitlines()
+        samples.append(float(output[-1]) * 1000)
+    return {"median_ms": round(statistics.median(samples), 1), "min_ms": round(min(samples), 1)}
+
+
+def slowest_imports(code, limit=10):
+    """Top-level modules that took longest to import (cumulative ms), from -X importtime"""
+    stderr = run_python(code, ("-X", "importtime")).stderr
+    totals = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; only count the modules imported directly
+        if name.startswith(" ") and not name.startswith("  ") and cumulative.strip().isdigit():
+            totals.append((int(cumulative) / 1000, name.strip()))
+    return [(name, round(ms, 1)) for ms, name in sorted(totals, reverse=True)[:limit]]
+
+
+def time_first_render(repeat, timeout):
+    samples = []
+    for _ in range(repeat):
+        output = run_python(_RENDER_SCRIPT.format(timeout=timeout, deferred=DEFERRED_MODULES))
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    renders = [sample["render_s"] * 1000 for sample in samples]
+    last = samples[-1]
+    return {
+        "median_ms": round(statistics.median(renders), 1),
+        "min_ms": round(min(renders), 1),
+        "streamlit_import_ms": round(statistics.median(s["streamlit_import_s"] for s in samples) * 1000, 1),
+        "exceptions": last["exceptions"],
+        "deferred_modules_loaded": last["loaded"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure CrypGene's import time and first render")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--detail", action="store_true", help="also list the slowest imports per scenario")
+    parser.add_argument("--skip-render", action="store_true", help="only measure imports")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake CoinGecko mean response time (s)")
+    parser.add_argument("--render-timeout", type=float, default=120, help="seconds allowed for the first render")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = {"imports": {}}
+    api = FakeCoinGecko(latency=args.latency)
+    with FakeCoinGeckoServer(api) as server, tempfile.TemporaryDirectory() as data_dir:
+        # Subprocesses inherit this environment
+        configure_environment(server.url, 50.0, data_dir)
+
+        print(f"{'scenario':<20} {'median ms':>10} {'min ms':>10}")
+        print("-" * 42)
+        for name, code in IMPORT_TARGETS.items():
+            result = results["imports"][name] = time_import(code, args.repeat)
+            print(f"{name:<20} {result['median_ms']:>10} {result['min_ms']:>10}")
+            if args.detail:
+                result["slowest"] = slowest_imports(code)
+                for module, ms in result["slowest"]:
+                    print(f"    {module:<36} {ms:>8} ms")
+
+        if not args.skip_render:
+            render = results["first_render"] = time_first_render(args.repeat, args.render_timeout)
+            print(f"{'first_render':<20} {render['median_ms']:>10} {render['min_ms']:>10}")
+            print(f"\nStreamlit itself took {render['streamlit_import_ms']} ms to import (not included above)")
+            if render["exceptions"]:
+                print(f"First render raised: {render['exceptions']}")
+            if render["deferred_modules_loaded"]:
+                print(f"Loaded before they were needed: {', '.join(render['deferred_modules_loaded'])}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    render = results.get("first_render", {})
+    return 1 if render.get("exceptions") or render.get("deferred_modules_loaded") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
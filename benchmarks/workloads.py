@@ -0,0 +1,59 @@
+# Scripted conversations the benchmark runner replays against CryptoAdvisor
+from collections import namedtuple
+
+# sessions: one list of user queries per conversation; conversations run concurrently,
+# the turns of each one in order
+Workload = namedtuple("Workload", ["name", "description", "sessions"])
+
+PRICE_QUESTIONS = [
+    "What's the price of bitcoin?",
+    "How much is ethereum worth right now?",
+    "Is solana up today?",
+    "What is the price of doge?",
+    "Should I buy cardano at this price?",
+    "How is chainlink doing?",
+    "Compare bitcoin and ethereum",
+    "What's the market cap of xrp?",
+]
+
+MARKET_QUESTIONS = [
+    "How is the crypto market doing today?",
+    "What's the total market cap right now?",
+    "Is the market trending up or down?",
+    "How much volume is the market seeing?",
+]
+
+GENERAL_QUESTIONS = [
+    "What is a blockchain?",
+    "How do I keep my coins safe?",
+    "What's the difference between a hot and a cold wallet?",
+    "Is staking worth it?",
+]
+
+
+def _cycle(questions, n, offset=0):
+    return [questions[(offset + i) % len(questions)] for i in range(n)]
+
+
+WORKLOADS = {
+    "price_lookups": Workload(
+        "price_lookups",
+        "single conversation asking about coin prices",
+        [_cycle(PRICE_QUESTIONS, 16)],
+    ),
+    "market_questions": Workload(
+        "market_questions",
+        "single conversation asking about the overall market",
+        [_cycle(MARKET_QUESTIONS, 8)],
+    ),
+    "long_conversation": Workload(
+        "long_conversation",
+        "one 40-turn conversation mixing price, market and general questions",
+        [_cycle(PRICE_QUESTIONS + MARKET_QUESTIONS + GENERAL_QUESTIONS, 40)],
+    ),
+    "concurrent_sessions": Workload(
+        "concurrent_sessions",
+        "16 conversations of 5 turns each, running at the same time",
+        [_cycle(PRICE_QUESTIONS + MARKET_QUESTIONS, 5, offset=i) for i in range(16)],
+    ),
+}
@@ -0,0 +1,201 @@
+# Shared second-level stores for MarketDataCache, so several worker processes share one cache
+#
+# Pick one with CRYPGENE_CACHE_BACKEND:
+#   memory (default)  each process keeps its own cache, nothing is shared
+#   sqlite            one SQLite file (memory-mapped, WAL) shared by every process on the box
+#   redis             a Redis-compatible server at CRYPGENE_CACHE_URL, shared across boxes
+import abc
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from storage import data_path
+
+# SQLite file used by the sqlite backend unless CRYPGENE_CACHE_PATH says otherwise
+DEFAULT_SQLITE_FILE = "market_cache.sqlite3"
+
+# Bytes of the SQLite file mapped into memory, so hot reads skip read() syscalls
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+
+# Expired rows are purged from the SQLite file once every this many writes
+SQLITE_PURGE_EVERY = 256
+
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+
+# Prefix for every key this app writes to a shared store
+NAMESPACE = "crypgene:cache:"
+
+
+def shared_key(endpoint, key):
+    """Stable cross-process name for a cache entry; the endpoint stays readable for invalidation"""
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+    return f"{endpoint}:{digest}"
+
+
+# msgpack is imported on first use, so the default in-process mode doesn't load it
+def pack(value, expires_at, stored_at):
+    import msgpack
+    return msgpack.packb([stored_at, expires_at, value], use_bin_type=True)
+
+
+def unpack(blob):
+    """Return (value, expires_at, stored_at) from a packed entry"""
+    import msgpack
+    stored_at, expires_at, value = msgpack.unpackb(blob, raw=False, strict_map_key=False)
+    return value, expires_at, stored_at
+
+
+class CacheBackend(abc.ABC):
+    """Interface for shared stores; times are wall-clock (time.time()) seconds"""
+    name = "base"
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return (value, expires_at, stored_at), or None; may return expired entries still kept"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl, keep_for):
+        """Store a value that is fresh for ttl seconds and kept (as stale) for keep_for seconds"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def acquire_lock(self, key, timeout):
+        """Take a cross-process lock that expires after timeout seconds; return a token or None"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def release_lock(self, key, token):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_prefix(self, prefix):
+        """Drop every entry whose key starts with prefix ("" drops everything)"""
+        raise NotImplementedError
+
+
+class SQLiteBackend(CacheBackend):
+    """Cache shared through a local SQLite file; needs no service running"""
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("CRYPGENE_CACHE_PATH") or data_path(DEFAULT_SQLITE_FILE)
+        # One connection per thread, as in the chat store
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connect()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, blob BLOB NOT NULL, "
+                         "keep_until REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT NOT NULL, "
+                         "expires_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT blob FROM entries WHERE key = ? AND keep_until > ?", (key, time.time())
+        ).fetchone()
+        return unpack(row[0]) if row else None
+
+    def set(self, key, value, ttl, keep_for):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, blob, keep_until) VALUES (?, ?, ?)",
+                         (key, pack(value, now + ttl, now), now + keep_for))
+            self._writes += 1
+            if self._writes % SQLITE_PURGE_EVERY == 0:
+                conn.execute("DELETE FROM entries WHERE keep_until <= ?", (now,))
+
+    def acquire_lock(self, key, timeout):
+        now = time.time()
+        token = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            # Both statements run in one write transaction, so only one process can win
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO locks (key, token, expires_at) VALUES (?, ?, ?)",
+                                  (key, token, now + timeout))
+        return token if cursor.rowcount == 1 else None
+
+    def release_lock(self, key, token):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    def delete_prefix(self, prefix):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+
+# Deletes a lock only if it still holds our token, so we never release someone else's lock
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend(CacheBackend):
+    """Cache shared through a Redis-compatible server"""
+    name = "redis"
+
+    def __init__(self, url=None, namespace=NAMESPACE):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The redis cache backend needs the 'redis' package (pip install redis)") from e
+        self.client = redis.Redis.from_url(url or os.getenv("CRYPGENE_CACHE_URL", DEFAULT_REDIS_URL))
+        self.namespace = namespace
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+
+    def get(self, key):
+        blob = self.client.get(self.namespace + key)
+        return unpack(blob) if blob is not None else None
+
+    def set(self, key, value, ttl, keep_for):
+        now = time.time()
+        self.client.set(self.namespace + key, pack(value, now + ttl, now), px=max(1, int(keep_for * 1000)))
+
+    def acquire_lock(self, key, timeout):
+        token = uuid.uuid4().hex
+        acquired = self.client.set(f"{self.namespace}lock:{key}", token, nx=True, px=max(1, int(timeout * 1000)))
+        return token if acquired else None
+
+    def release_lock(self, key, token):
+        self._release(keys=[f"{self.namespace}lock:{key}"], args=[token])
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=f"{self.namespace}{prefix}*", count=500))
+        for i in range(0, len(keys), 500):
+            self.client.unlink(*keys[i:i + 500])
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "redis": RedisBackend,
+}
+
+
+def get_cache_backend(name=None):
+    """Create the shared backend named by CRYPGENE_CACHE_BACKEND, or None for in-process only"""
+    name = (name or os.getenv("CRYPGENE_CACHE_BACKEND", "memory")).lower()
+    if name == "memory":
+        return None
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown cache backend '{name}'; use one of: memory, {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
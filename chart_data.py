@@ -0,0 +1,118 @@
+# Vectorized chart data preparation: downsampling and OHLC resampling with NumPy
+import numpy as np
+
+# Points sent to the browser per line chart, whatever the requested range
+DEFAULT_MAX_POINTS = 800
+
+# Upper bound on candles per candlestick chart
+DEFAULT_MAX_CANDLES = 120
+
+# Candle widths to pick from, in milliseconds
+OHLC_INTERVALS = [
+    5 * 60 * 1000,
+    15 * 60 * 1000,
+    60 * 60 * 1000,
+    4 * 60 * 60 * 1000,
+    24 * 60 * 60 * 1000,
+    7 * 24 * 60 * 60 * 1000,
+]
+
+
+def lttb(x, y, threshold=DEFAULT_MAX_POINTS):
+    """Largest-triangle-three-buckets downsampling; returns the indices of the points to keep"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # First and last points are always kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pick the point in this bucket forming the largest triangle with a and the average
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def minmax_decimate(y, n_buckets=DEFAULT_MAX_POINTS // 2):
+    """Keep the min and max of each bucket (in time order); returns indices of the points to keep"""
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+
+    y = np.asarray(y)
+    size = n // n_buckets
+    usable = size * n_buckets
+    buckets = y[:usable].reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    lows = offsets + buckets.argmin(axis=1)
+    highs = offsets + buckets.argmax(axis=1)
+
+    indices = np.concatenate([lows, highs, [n - 1]])
+    if usable < n:
+        tail = np.arange(usable, n)
+        indices = np.concatenate([indices, tail[[y[usable:].argmin(), y[usable:].argmax()]]])
+    return np.unique(indices)
+
+
+def downsample(timestamps, prices, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """Reduce a series to at most about max_points points for plotting"""
+    if len(timestamps) <= max_points:
+        return timestamps, prices
+    if method == "minmax":
+        indices = minmax_decimate(prices, max_points // 2)
+    else:
+        indices = lttb(timestamps, prices, max_points)
+    return np.asarray(timestamps)[indices], np.asarray(prices)[indices]
+
+
+def choose_ohlc_interval(timestamps, max_candles=DEFAULT_MAX_CANDLES):
+    """Pick the narrowest candle width that keeps the chart within max_candles"""
+    if len(timestamps) < 2:
+        return OHLC_INTERVALS[0]
+    span = int(timestamps[-1]) - int(timestamps[0])
+    for interval in OHLC_INTERVALS:
+        if span / interval <= max_candles:
+            return interval
+    return OHLC_INTERVALS[-1]
+
+
+def ohlc(timestamps, prices, interval=None):
+    """Resample a sorted price series into candles; returns a dict of equal-length arrays"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if len(timestamps) == 0:
+        empty = np.empty(0)
+        return {"time": np.empty(0, dtype=np.int64), "open": empty, "high": empty, "low": empty, "close": empty}
+
+    interval = interval or choose_ohlc_interval(timestamps)
+
+    # Start index of every candle, from the points where the bucket number changes
+    buckets = timestamps // interval
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+    ends = np.append(starts[1:], len(prices))
+
+    return {
+        "time": buckets[starts] * interval,
+        "open": prices[starts],
+        "high": np.maximum.reduceat(prices, starts),
+        "low": np.minimum.reduceat(prices, starts),
+        "close": prices[ends - 1],
+    }
@@ -0,0 +1,245 @@
+# Persistent chat history: conversations and messages in a local SQLite database (WAL mode).
+# Every conversation belongs to an owner id, and each user only ever sees their own.
+import sqlite3
+import threading
+import time
+
+from storage import data_path
+
+# Conversations per page in the sidebar listing
+DEFAULT_PAGE_SIZE = 10
+
+# Messages shown as a preview of each listed conversation
+PREVIEW_MESSAGES = 3
+
+# Longest conversation title, taken from the first user message
+TITLE_CHARS = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation_id, id);
+"""
+
+# Created once the owner column is known to exist (databases from before it get it added)
+INDEX_SCHEMA = """
+DROP INDEX IF EXISTS conversations_updated;
+CREATE INDEX IF NOT EXISTS conversations_owner ON conversations (owner, updated_at DESC);
+"""
+
+# Full-text index over message contents, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    content, content='messages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def chat_store_path():
+    return data_path("chats.sqlite3")
+
+
+def make_title(text, limit=TITLE_CHARS):
+    """Conversation title from its first user message"""
+    text = " ".join(text.split())
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def like_pattern(text):
+    """Substring pattern for LIKE ... ESCAPE '\\' that treats % and _ in text literally"""
+    escaped = text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    words = [word.replace('"', '') for word in text.split()]
+    return " ".join(f'"{word}"*' for word in words if word)
+
+
+class ChatStore:
+    """Append-only store of conversations, shared by every session in the process; every
+    read, search and delete is scoped to one owner"""
+    def __init__(self, path=None):
+        self.path = path or chat_store_path()
+        # sqlite3 connections can't be shared across threads, and Streamlit runs each
+        # session in its own thread, so every thread gets its own connection
+        self._local = threading.local()
+        self.has_fts = self._create_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            # WAL lets sessions keep reading while another one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(conversations)")]
+            if "owner" not in columns:
+                # Conversations saved before owners existed belong to nobody, so nobody sees them
+                conn.execute("ALTER TABLE conversations ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+            conn.executescript(INDEX_SCHEMA)
+        try:
+            with conn:
+                conn.executescript(FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to a plain substring scan
+            return False
+
+    def create_conversation(self, owner, title):
+        """Start a conversation for an owner and return its id"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO conversations (owner, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (owner, title, now, now)
+            )
+        return cursor.lastrowid
+
+    def append_messages(self, owner, conversation_id, messages):
+        """Append [{"role", "content"}, ...] to one of an owner's conversations in one transaction;
+        returns False if the owner has no such conversation (e.g. it was deleted)"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE conversations SET updated_at = ?, message_count = message_count + ? "
+                "WHERE id = ? AND owner = ?",
+                (now, len(messages), conversation_id, owner)
+            )
+            if not cursor.rowcount:
+                return False
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                [(conversation_id, m["role"], m["content"], now) for m in messages]
+            )
+        return True
+
+    def get_messages(self, owner, conversation_id, limit=None):
+        """Return one of an owner's conversations in order, optionally only the first `limit` messages"""
+        rows = self._connect().execute(
+            "SELECT m.role, m.content FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+            "WHERE m.conversation_id = ? AND c.owner = ? ORDER BY m.id LIMIT ?",
+            (conversation_id, owner, -1 if limit is None else limit)
+        )
+        return [{"role": row["role"], "content": row["content"]} for row in rows]
+
+    def count_conversations(self, owner):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM conversations WHERE owner = ?", (owner,)
+        ).fetchone()[0]
+
+    def list_conversations(self, owner, page=0, page_size=DEFAULT_PAGE_SIZE):
+        """Return one 0-based page of an owner's conversations, most recently updated first"""
+        rows = self._connect().execute(
+            "SELECT id, title, created_at, updated_at, message_count FROM conversations "
+            "WHERE owner = ? ORDER BY updated_at DESC, id DESC LIMIT ? OFFSET ?",
+            (owner, page_size, page * page_size)
+        )
+        return [dict(row) for row in rows]
+
+    def owners(self):
+        """Every owner with saved conversations, for offline tools such as the load benchmark"""
+        rows = self._connect().execute("SELECT DISTINCT owner FROM conversations")
+        return [row["owner"] for row in rows]
+
+    def previews(self, owner, conversation_ids, n=PREVIEW_MESSAGES):
+        """Return {conversation_id: first n messages} for a page of an owner's conversations in one query"""
+        if not conversation_ids:
+            return {}
+        placeholders = ",".join("?" * len(conversation_ids))
+        rows = self._connect().execute(
+            "SELECT conversation_id, role, content FROM ("
+            "  SELECT m.conversation_id, m.role, m.content, m.id,"
+            "         ROW_NUMBER() OVER (PARTITION BY m.conversation_id ORDER BY m.id) AS n"
+            "  FROM messages m JOIN conversations c ON c.id = m.conversation_id"
+            f"  WHERE m.conversation_id IN ({placeholders}) AND c.owner = ?"
+            ") WHERE n <= ? ORDER BY id",
+            (*conversation_ids, owner, n)
+        )
+        previews = {conversation_id: [] for conversation_id in conversation_ids}
+        for row in rows:
+            previews[row["conversation_id"]].append({"role": row["role"], "content": row["content"]})
+        return previews
+
+    def search(self, owner, text, limit=DEFAULT_PAGE_SIZE):
+        """Return an owner's conversations with a message matching `text`, best match first"""
+        query = fts_query(text)
+        if not query:
+            return []
+        conn = self._connect()
+        if self.has_fts:
+            rows = conn.execute(
+                "SELECT c.id, c.title, c.created_at, c.updated_at, c.message_count, MIN(hits.score) AS score "
+                "FROM (SELECT rowid, rank AS score FROM messages_fts WHERE messages_fts MATCH ?) hits "
+                "JOIN messages m ON m.id = hits.rowid "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE c.owner = ? GROUP BY c.id ORDER BY score LIMIT ?",
+                (query, owner, limit)
+            )
+        else:
+            rows = conn.execute(
+                "SELECT DISTINCT c.id, c.title, c.created_at, c.updated_at, c.message_count "
+                "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE c.owner = ? AND m.content LIKE ? ESCAPE '\\' ORDER BY c.updated_at DESC LIMIT ?",
+                (owner, like_pattern(text), limit)
+            )
+        return [{key: row[key] for key in ("id", "title", "created_at", "updated_at", "message_count")}
+                for row in rows]
+
+    def delete_conversation(self, owner, conversation_id):
+        """Delete one of an owner's conversations and its messages"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM messages WHERE conversation_id IN "
+                "(SELECT id FROM conversations WHERE id = ? AND owner = ?)",
+                (conversation_id, owner)
+            )
+            conn.execute("DELETE FROM conversations WHERE id = ? AND owner = ?", (conversation_id, owner))
+
+
+# Process-wide store shared by every session
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_chat_store():
+    """Return the process-wide chat store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ChatStore()
+    return _store
@@ -0,0 +1,229 @@
+# Local index of every CoinGecko coin for resolving names and symbols without a network call
+import json
+import os
+import threading
+import time
+
+import market_data
+from coingecko_gateway import PRIORITY_BACKGROUND
+from storage import data_path
+
+# Rebuild the index from /coins/list once a day
+INDEX_MAX_AGE = 24 * 60 * 60
+
+# Wait this long (in seconds) before retrying a failed rebuild
+REBUILD_RETRY_DELAY = 60 * 60
+
+# Number of top coins (by market cap) whose rank is used to disambiguate symbols
+RANKED_COINS = 250
+
+# Common names that don't match a CoinGecko id, name or symbol directly
+ALIASES = {
+    "binance": "binancecoin",
+    "bnb": "binancecoin",
+    "ether": "ethereum",
+    "doge": "dogecoin",
+    "xrp": "ripple",
+    "shib": "shiba-inu",
+    "matic": "matic-network",
+    "avax": "avalanche-2",
+}
+
+# Well-known coins (id, symbol, name), in market cap order, resolved from this static table
+# while the full index can't be built
+FALLBACK_COINS = (
+    ("bitcoin", "btc", "Bitcoin"),
+    ("ethereum", "eth", "Ethereum"),
+    ("tether", "usdt", "Tether"),
+    ("binancecoin", "bnb", "BNB"),
+    ("solana", "sol", "Solana"),
+    ("usd-coin", "usdc", "USDC"),
+    ("ripple", "xrp", "XRP"),
+    ("dogecoin", "doge", "Dogecoin"),
+    ("cardano", "ada", "Cardano"),
+    ("tron", "trx", "TRON"),
+    ("avalanche-2", "avax", "Avalanche"),
+    ("shiba-inu", "shib", "Shiba Inu"),
+    ("chainlink", "link", "Chainlink"),
+    ("polkadot", "dot", "Polkadot"),
+    ("matic-network", "matic", "Polygon"),
+    ("litecoin", "ltc", "Litecoin"),
+)
+
+# Words that are also the symbol or name of some obscure coin; never treated as a
+# coin mention when scanning free text (an explicit lookup still resolves them)
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "best", "buy", "can", "coin", "compare", "cost", "crypto",
+    "current", "data", "do", "for", "from", "get", "good", "how", "i", "if", "in", "is", "it",
+    "market", "me", "much", "my", "now", "of", "on", "or", "price", "sell", "should", "stats",
+    "the", "this", "to", "today", "value", "vs", "what", "when", "which", "will", "with", "worth",
+    "you",
+}
+
+# Longest multi-word coin name matched when scanning free text (e.g. "shiba inu")
+MAX_NAME_WORDS = 3
+
+
+class CoinIndex:
+    def __init__(self, coins, ranks=None, built_at=None):
+        # coins: iterable of (id, symbol, name); ranks: id -> market cap rank
+        self.ranks = dict(ranks or {})
+        self.built_at = built_at or time.time()
+        self.names = {}
+        self.by_id = {}
+        self.by_name = {}
+        self.by_symbol = {}
+
+        # Sort so that the best-ranked coin wins when several share a symbol or name
+        def priority(coin):
+            return (self.ranks.get(coin[0], float("inf")), len(coin[0]), coin[0])
+
+        for coin_id, symbol, name in sorted(coins, key=priority):
+            self.names[coin_id] = (symbol.upper(), name)
+            self.by_id[coin_id] = coin_id
+            self.by_name.setdefault(name.lower(), coin_id)
+            self.by_symbol.setdefault(symbol.lower(), coin_id)
+
+        self.aliases = {alias: coin_id for alias, coin_id in ALIASES.items() if coin_id in self.by_id}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def lookup(self, term):
+        """Resolve a coin id, name, symbol or alias to a CoinGecko id, or None"""
+        term = term.strip().lower()
+        return self.aliases.get(term) \
+            or self.by_id.get(term) \
+            or self.by_name.get(term) \
+            or self.by_symbol.get(term)
+
+    def find_coins(self, words):
+        """Return ids of coins mentioned in a list of lowercase words, in order of appearance"""
+        found = []
+        i = 0
+        while i < len(words):
+            # Prefer the longest multi-word name starting at this word
+            for size in range(min(MAX_NAME_WORDS, len(words) - i), 0, -1):
+                term = " ".join(words[i:i + size])
+                coin_id = self._mention(term)
+                if coin_id:
+                    if coin_id not in found:
+                        found.append(coin_id)
+                    i += size
+                    break
+            else:
+                i += 1
+        return found
+
+    def _mention(self, term):
+        # Only well-known coins count as mentions in free text, to avoid matching
+        # everyday words against the thousands of obscure coins in the index
+        if term in STOPWORDS:
+            return None
+        coin_id = self.lookup(term)
+        if coin_id and (term in self.aliases or coin_id in self.ranks):
+            return coin_id
+        return None
+
+    def to_dict(self):
+        return {
+            "built_at": self.built_at,
+            "ranks": self.ranks,
+            "coins": [[coin_id, symbol, name] for coin_id, (symbol, name) in self.names.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["coins"], data.get("ranks"), data.get("built_at"))
+
+    @classmethod
+    def build(cls):
+        """Build a fresh index from /coins/list and the top coins by market cap"""
+        coins = [(coin["id"], coin["symbol"], coin["name"]) for coin in market_data.get_coins_list()]
+        top = market_data.get_coins_markets(per_page=RANKED_COINS, priority=PRIORITY_BACKGROUND)
+        ranks = {coin["id"]: coin.get("market_cap_rank") or i + 1 for i, coin in enumerate(top)}
+        return cls(coins, ranks)
+
+
+def index_path():
+    return data_path("coin_index.json")
+
+
+def load_index(path=None):
+    """Load a persisted index from disk, or return None if there isn't a usable one"""
+    path = path or index_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return CoinIndex.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_index(index, path=None):
+    """Persist an index to disk atomically"""
+    path = path or index_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def fallback_index():
+    """Index of the well-known coins and aliases only, usable without any network call"""
+    ranks = {coin[0]: rank for rank, coin in enumerate(FALLBACK_COINS, start=1)}
+    # built_at=0 marks it as out of date, so nothing mistakes it for a real index
+    return CoinIndex(FALLBACK_COINS, ranks, built_at=0)
+
+
+# Process-wide index, loaded lazily on first use
+_index = None
+_fallback = None
+_index_lock = threading.Lock()
+_last_rebuild_attempt = 0.0
+
+
+def _refresh_index():
+    global _index
+    try:
+        index = CoinIndex.build()
+        save_index(index)
+        _index = index
+    except Exception as e:
+        print(f"Error refreshing coin index: {str(e)}")
+
+
+def get_coin_index():
+    """Return the shared coin index, loading it from disk or building it on first use"""
+    global _index, _fallback, _last_rebuild_attempt
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = load_index()
+                if index is None:
+                    # Nothing on disk yet: build synchronously, but after a failure only retry
+                    # once REBUILD_RETRY_DELAY has passed, answering from the static table meanwhile
+                    now = time.time()
+                    if now - _last_rebuild_attempt <= REBUILD_RETRY_DELAY:
+                        return _fallback
+                    _last_rebuild_attempt = now
+                    try:
+                        index = CoinIndex.build()
+                    except Exception as e:
+                        print(f"Error building coin index: {str(e)}")
+                        _fallback = _fallback or fallback_index()
+                        return _fallback
+                    try:
+                        save_index(index)
+                    except OSError as e:
+                        print(f"Error saving coin index: {str(e)}")
+                _index = index
+
+    # Rebuild a day-old index in the background; keep serving the current one meanwhile
+    now = time.time()
+    if now - _index.built_at > INDEX_MAX_AGE and now - _last_rebuild_attempt > REBUILD_RETRY_DELAY:
+        with _index_lock:
+            if now - _last_rebuild_attempt > REBUILD_RETRY_DELAY:
+                _last_rebuild_attempt = now
+                threading.Thread(target=_refresh_index, name="coin-index-refresh", daemon=True).start()
+
+    return _index
@@ -0,0 +1,263 @@
+# Central gateway for all CoinGecko traffic: rate limiting, priorities, retries and pooling
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import telemetry
+
+# Point this at a local stub server for tests and benchmarks
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3/")
+
+# Requests per second allowed upstream, and how many may be sent back to back
+DEFAULT_RATE = float(os.getenv("COINGECKO_RATE_LIMIT", "0.5"))
+DEFAULT_BURST = 5
+
+# Retry policy for 429s, 5xx responses and connection errors
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+
+# Priority classes: lower values are served first when requests queue for the rate limit
+PRIORITY_CHAT = 0        # data quoted in an advisor answer
+PRIORITY_PAGE = 1        # data the current page needs to render
+PRIORITY_BACKGROUND = 2  # sidebar extras and background refreshes
+
+
+class TokenBucket:
+    """Thread-safe token bucket where queued callers are served in priority order"""
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        # A zero rate would never refill (and divides by zero in _wait_time), and a bucket
+        # that can't hold one token never hands any out
+        if not rate > 0:
+            raise ValueError(f"CoinGecko rate limit must be a positive number of requests per second "
+                             f"(COINGECKO_RATE_LIMIT), got {rate!r}")
+        if not capacity >= 1:
+            raise ValueError(f"CoinGecko burst must be at least one request, got {capacity!r}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        # Must be called with the condition held
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _wait_time(self, now):
+        # Seconds until a token is available; must be called with the condition held
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, priority=PRIORITY_PAGE):
+        """Block until a token is available and no higher-priority caller is waiting"""
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._wait_time(now)
+                    if self._waiters[0] == ticket and wait == 0:
+                        self.tokens -= 1
+                        return
+                    self._cond.wait(wait if self._waiters[0] == ticket else None)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def try_acquire(self, priority=PRIORITY_PAGE):
+        """Take a token without blocking; return 0 on success or the seconds to wait before retrying"""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._wait_time(now)
+            # Don't jump ahead of blocked callers with the same or a higher priority
+            if self._waiters and self._waiters[0][0] <= priority:
+                return max(wait, 1 / self.rate)
+            if wait == 0:
+                self.tokens -= 1
+            return wait
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while, e.g. after the server sent Retry-After"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self._cond.notify_all()
+
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header (seconds or HTTP date), or return None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt, base=DEFAULT_BACKOFF, cap=DEFAULT_MAX_BACKOFF):
+    """Exponential backoff with jitter for the given retry attempt (0-based)"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def endpoint_label(path):
+    """API path with the coin id replaced, so metrics stay per endpoint rather than per coin"""
+    parts = path.strip("/").split("/")
+    if parts[0] == "coins" and len(parts) >= 2 and parts[1] not in ("list", "markets"):
+        parts[1] = "{id}"
+    return "/".join(parts)
+
+
+def _query_params(params):
+    # Encode booleans and lists the way the CoinGecko API expects them
+    encoded = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif isinstance(value, (list, tuple)):
+            value = ",".join(str(v) for v in value)
+        encoded[key] = value
+    return encoded
+
+
+class CoinGeckoGateway:
+    def __init__(self, base_url=COINGECKO_API_URL, api_key=None, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 max_retries=DEFAULT_MAX_RETRIES, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+
+        # One pooled keep-alive session for every request in the process
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.headers = {}
+        api_key = api_key or os.getenv("COINGECKO_API_KEY")
+        if api_key:
+            self.headers["x-cg-demo-api-key"] = api_key
+        self.session.headers.update(self.headers)
+
+        # Counters for monitoring upstream health
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def request(self, path, params=None, priority=PRIORITY_PAGE):
+        """GET an API path through the rate limiter, retrying 429s, 5xx and connection errors"""
+        url = self.base_url + path
+        params = _query_params(params or {})
+        endpoint = endpoint_label(path)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            with telemetry.span("rate_limit_wait", endpoint=endpoint):
+                self.bucket.acquire(priority)
+            self.requests += 1
+            try:
+                with telemetry.span("coingecko", endpoint=endpoint):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                telemetry.count("crypgene_upstream_requests_total", endpoint=endpoint, status="connection_error")
+                if last_attempt:
+                    raise
+                self.retries += 1
+                telemetry.count("crypgene_upstream_retries_total", endpoint=endpoint)
+                time.sleep(backoff_seconds(attempt))
+                continue
+
+            telemetry.count("crypgene_upstream_requests_total", endpoint=endpoint, status=response.status_code)
+            if response.status_code == 429 or response.status_code >= 500:
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = backoff_seconds(attempt)
+                if response.status_code == 429:
+                    # Everyone shares the same upstream quota, so hold back all callers
+                    self.rate_limited += 1
+                    telemetry.count("crypgene_upstream_rate_limited_total", endpoint=endpoint)
+                    self.bucket.pause(delay)
+                if last_attempt:
+                    response.raise_for_status()
+                self.retries += 1
+                telemetry.count("crypgene_upstream_retries_total", endpoint=endpoint)
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def stats(self):
+        return {'requests': self.requests, 'retries': self.retries, 'rate_limited': self.rate_limited}
+
+    # Endpoint helpers, named after their pycoingecko equivalents
+
+    def get_coins_markets(self, vs_currency, priority=PRIORITY_PAGE, **kwargs):
+        return self.request("coins/markets", {"vs_currency": vs_currency, **kwargs}, priority)
+
+    def get_global(self, priority=PRIORITY_PAGE):
+        return self.request("global", priority=priority)["data"]
+
+    def get_search_trending(self, priority=PRIORITY_BACKGROUND):
+        return self.request("search/trending", priority=priority)
+
+    def get_exchange_rates(self, priority=PRIORITY_BACKGROUND):
+        return self.request("exchange_rates", priority=priority)["rates"]
+
+    def search(self, query, priority=PRIORITY_PAGE):
+        return self.request("search", {"query": query}, priority)
+
+    def get_coins_list(self, priority=PRIORITY_BACKGROUND):
+        return self.request("coins/list", priority=priority)
+
+    def get_coin_by_id(self, coin_id, priority=PRIORITY_PAGE, **kwargs):
+        return self.request(f"coins/{coin_id}", kwargs, priority)
+
+    def get_coin_market_chart_range_by_id(self, coin_id, vs_currency, from_timestamp, to_timestamp,
+                                          priority=PRIORITY_PAGE):
+        return self.request(f"coins/{coin_id}/market_chart/range", {
+            "vs_currency": vs_currency,
+            "from": from_timestamp,
+            "to": to_timestamp,
+        }, priority)
+
+
+# Process-wide gateway shared by app.py, agent.py and the background refresher
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the process-wide CoinGecko gateway, creating it on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = CoinGeckoGateway()
+    return _gateway
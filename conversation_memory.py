@@ -0,0 +1,112 @@
+# Bounded conversation memory: recent turns verbatim, older turns folded into a rolling summary.
+# LangChain's message classes are only imported once a history is built, so importing this
+# module (or agent, which imports it) doesn't load langchain_core.
+
+# Approximate prompt budget (in tokens) for the conversation history sent with each turn
+DEFAULT_TOKEN_BUDGET = 1500
+
+# Only the most recent turns keep their injected market data; older data is stale anyway
+DEFAULT_TURNS_WITH_DATA = 1
+
+# Cap on the rolling summary itself, so it can't grow without limit either
+DEFAULT_SUMMARY_TOKENS = 300
+
+# Longest excerpt of a single message kept in the rolling summary
+SUMMARY_EXCERPT_CHARS = 160
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about 4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def _excerpt(text, limit=SUMMARY_EXCERPT_CHARS):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def extractive_summary(summary, turn):
+    """Fold one turn into the rolling summary without an LLM call"""
+    line = f"- User asked: {_excerpt(turn.query)} / CrypGene said: {_excerpt(turn.response)}"
+    return f"{summary}\n{line}" if summary else line
+
+
+class Turn:
+    """One exchange: the raw user query, the market data injected for it, and the reply"""
+    __slots__ = ("query", "data_context", "response")
+
+    def __init__(self, query, response, data_context=""):
+        self.query = query
+        self.response = response
+        self.data_context = data_context or ""
+
+
+class ConversationMemory:
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, turns_with_data=DEFAULT_TURNS_WITH_DATA,
+                 summary_tokens=DEFAULT_SUMMARY_TOKENS, summarizer=extractive_summary):
+        self.token_budget = token_budget
+        self.turns_with_data = turns_with_data
+        self.summary_tokens = summary_tokens
+        # summarizer(summary, turn) -> new summary; swap in an LLM-backed one if needed
+        self.summarizer = summarizer
+
+        self.turns = []
+        self.summary = ""
+        # History messages, built once per change instead of on every prompt
+        self._messages = None
+
+    def __len__(self):
+        return len(self.turns)
+
+    def clear(self):
+        """Forget every turn and the summary"""
+        self.turns = []
+        self.summary = ""
+        self._messages = None
+
+    def add_turn(self, query, response, data_context=""):
+        """Record a turn, then compact older turns until the history fits the budget"""
+        self.turns.append(Turn(query, response, data_context))
+        self._compact()
+        self._messages = None
+
+    def messages(self):
+        """Return the history to send with the next prompt"""
+        if self._messages is not None:
+            return list(self._messages)
+        from langchain_core.messages import AIMessage, HumanMessage
+        messages = []
+        if self.summary:
+            messages.append(HumanMessage(content=f"Summary of our earlier conversation:\n{self.summary}"))
+            messages.append(AIMessage(content="Got it, I'll keep that in mind."))
+
+        data_from = len(self.turns) - self.turns_with_data
+        for i, turn in enumerate(self.turns):
+            content = turn.query + turn.data_context if i >= data_from else turn.query
+            messages.append(HumanMessage(content=content))
+            messages.append(AIMessage(content=turn.response))
+        self._messages = messages
+        return list(messages)
+
+    def token_count(self):
+        """Estimated size of messages() in tokens"""
+        total = estimate_tokens(self.summary) if self.summary else 0
+        data_from = len(self.turns) - self.turns_with_data
+        for i, turn in enumerate(self.turns):
+            total += estimate_tokens(turn.query) + estimate_tokens(turn.response)
+            if i >= data_from:
+                total += estimate_tokens(turn.data_context)
+        return total
+
+    def _compact(self):
+        # Always keep the latest turn verbatim, even if it alone exceeds the budget
+        while len(self.turns) > 1 and self.token_count() > self.token_budget:
+            self.summary = self.summarizer(self.summary, self.turns.pop(0))
+
+        # Drop the oldest summary lines once the summary itself outgrows its cap
+        while self.summary and estimate_tokens(self.summary) > self.summary_tokens:
+            lines = self.summary.split("\n")
+            if len(lines) == 1:
+                self.summary = _excerpt(self.summary, self.summary_tokens * 4)
+                break
+            self.summary = "\n".join(lines[1:])
@@ -0,0 +1,125 @@
+# Display currencies: every price is fetched once in USD and converted locally with the
+# exchange rate table from CoinGecko's /exchange_rates, so other currencies cost no extra
+# upstream requests or cache entries
+import threading
+
+import numpy as np
+
+import market_data
+
+# Currency every market data request is made in
+BASE_CURRENCY = 'usd'
+
+# Currencies offered in the app (code -> symbol); any fiat code in the rate table also works
+SUPPORTED_CURRENCIES = {
+    'usd': '$',
+    'eur': '€',
+    'gbp': '£',
+    'inr': '₹',
+    'jpy': '¥',
+    'cad': 'CA$',
+    'aud': 'A$',
+}
+
+# Scales used by format_compact_money, largest first
+COMPACT_SUFFIXES = ((1e12, 'T'), (1e9, 'B'), (1e6, 'M'))
+
+# Streamlit's built-in money formats, where one exists for the currency
+COLUMN_FORMATS = {'usd': 'dollar', 'eur': 'euro', 'jpy': 'yen'}
+
+
+class FxTable:
+    """Rates from the base currency to every fiat currency, as one NumPy vector"""
+    def __init__(self, rates):
+        # CoinGecko quotes every currency against BTC; dividing by the base currency's
+        # quote turns that into "units of X per base unit"
+        fiat = {code: rate for code, rate in rates.items() if rate.get('type') == 'fiat'}
+        self.codes = sorted(fiat)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.units = {code: fiat[code].get('unit') or code.upper() for code in self.codes}
+        btc_quotes = np.array([fiat[code]['value'] for code in self.codes], dtype=np.float64)
+        self.per_base = btc_quotes / btc_quotes[self.index[BASE_CURRENCY]]
+
+    def __contains__(self, currency):
+        return currency in self.index
+
+    def rate(self, currency):
+        """Units of currency per unit of the base currency"""
+        return float(self.per_base[self.index[currency]])
+
+
+# Table built from the cached rates, rebuilt only when the refresher replaces them
+_table = None
+_table_source = None
+_table_lock = threading.Lock()
+
+
+def get_fx_table():
+    """Return the shared rate table, or None if the rates can't be loaded"""
+    global _table, _table_source
+    try:
+        rates = market_data.get_exchange_rates()
+    except Exception as e:
+        print(f"Error fetching exchange rates: {str(e)}")
+        return None
+    with _table_lock:
+        # The cache hands out the same dict until a refresh replaces it
+        if rates is not _table_source:
+            _table = FxTable(rates)
+            _table_source = rates
+        return _table
+
+
+def display_currency(currency):
+    """The currency to show values in: the requested one, or the base one if it has no rate"""
+    currency = (currency or BASE_CURRENCY).lower()
+    if currency == BASE_CURRENCY:
+        return currency
+    table = get_fx_table()
+    return currency if table is not None and currency in table else BASE_CURRENCY
+
+
+def convert(values, currency):
+    """Convert base currency amounts (a number, NumPy array or pandas object) to currency"""
+    if currency == BASE_CURRENCY:
+        return values
+    table = get_fx_table()
+    if table is None or currency not in table:
+        raise ValueError(f"No exchange rate for '{currency}'")
+    return values * table.rate(currency)
+
+
+def to_base(value, currency):
+    """Convert an amount entered in currency back to the base currency"""
+    if currency == BASE_CURRENCY:
+        return value
+    table = get_fx_table()
+    if table is None or currency not in table:
+        raise ValueError(f"No exchange rate for '{currency}'")
+    return value / table.rate(currency)
+
+
+def symbol(currency):
+    if currency in SUPPORTED_CURRENCIES:
+        return SUPPORTED_CURRENCIES[currency]
+    table = get_fx_table()
+    return table.units.get(currency, currency.upper()) if table is not None else currency.upper()
+
+
+def format_money(value, currency, decimals=2):
+    """Format a base currency amount in currency, e.g. "€1,234.56" """
+    return f"{symbol(currency)}{convert(value, currency):,.{decimals}f}"
+
+
+def format_compact_money(value, currency):
+    """Format a large base currency amount briefly, e.g. "$1.32T" or "€845.2B" """
+    amount = convert(value, currency)
+    for threshold, suffix in COMPACT_SUFFIXES:
+        if abs(amount) >= threshold:
+            return f"{symbol(currency)}{amount / threshold:,.2f}{suffix}"
+    return f"{symbol(currency)}{amount:,.0f}"
+
+
+def column_format(currency):
+    """Streamlit NumberColumn format for amounts already converted to currency"""
+    return COLUMN_FORMATS.get(currency, f"{symbol(currency)}%.2f")
@@ -0,0 +1,364 @@
+# Shared, thread-safe cache for CoinGecko market data
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import telemetry
+from cache_backends import get_cache_backend, shared_key
+
+# Time-to-live (in seconds) for each CoinGecko endpoint we cache
+DEFAULT_TTLS = {
+    'coins_markets': 60,
+    'global': 120,
+    'trending': 300,
+    'search': 3600,
+    'coins_list': 3600,
+    'coin': 300,
+    'coin_market': 60,
+    'coin_market_batch': 60,
+    'exchange_rates': 600,
+}
+
+# Fallback TTL for endpoints without an explicit entry
+DEFAULT_TTL = 300
+
+# Upper bound on the number of cached responses kept in memory
+DEFAULT_MAX_ENTRIES = 1024
+
+# How long (in seconds) an expired entry may still be served while it is being refreshed
+DEFAULT_MAX_STALE = 300
+
+# How long (in seconds) a cross-process fetch lock is held at most, covering the gateway's retries
+DEFAULT_LOCK_TIMEOUT = 30
+
+# How often (in seconds) to check the shared backend while another process fetches an entry
+SHARED_POLL_INTERVAL = 0.05
+
+# TTL (in seconds) for a stale value taken from the shared backend while another process refreshes it
+SHARED_STALE_TTL = 1.0
+
+# Sentinel used to tell a cache miss apart from a cached None
+_MISSING = object()
+
+
+def make_key(*args, **kwargs):
+    """Build a hashable cache key from call arguments"""
+    def freeze(value):
+        if isinstance(value, (list, tuple, set)):
+            return tuple(freeze(v) for v in value)
+        if isinstance(value, dict):
+            return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+        return value
+
+    return (freeze(args), freeze(kwargs))
+
+
+class _Flight:
+    """An upstream request that is currently in progress"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class MarketDataCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttls=None, default_ttl=DEFAULT_TTL,
+                 max_stale=DEFAULT_MAX_STALE, backend=None, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        # Entries are kept in LRU order: (endpoint, key) -> (value, expires_at)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        # Optional store shared with other processes (see cache_backends); this process's
+        # entries stay in front of it, so hits don't pay for a round trip or deserialization
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        self._backend_failed = False
+
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+
+        # Simple counters, useful when tuning TTLs
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def ttl_for(self, endpoint):
+        """Return the TTL in seconds configured for an endpoint"""
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, endpoint, key, default=None):
+        """Return a fresh cached value, or default if missing or expired"""
+        with self._lock:
+            value = self._lookup(endpoint, key)
+        if value is _MISSING and self.backend is not None:
+            value = self._load_shared(endpoint, key)
+        return default if value is _MISSING else value
+
+    def set(self, endpoint, key, value, ttl=None):
+        """Store a value for an endpoint, evicting the least recently used entries"""
+        if ttl is None:
+            ttl = self.ttl_for(endpoint)
+        with self._lock:
+            self._store(endpoint, key, value, ttl)
+        if self.backend is not None:
+            self._backend_call("set", shared_key(endpoint, key), value, ttl, ttl + self.max_stale)
+
+    def get_or_fetch(self, endpoint, key, fetch, ttl=None):
+        """Return the cached value or call fetch() once, even under concurrent misses"""
+        with self._lock:
+            value = self._lookup(endpoint, key)
+            if value is not _MISSING:
+                return value
+
+            flight = self._inflight.get((endpoint, key))
+            if flight is not None:
+                # A refresh is already running; serve the expired value if it is recent enough
+                value = self._lookup_stale(endpoint, key)
+                if value is not _MISSING:
+                    return value
+            leader = flight is None
+            if leader:
+                flight = self._inflight[(endpoint, key)] = _Flight()
+
+        if leader:
+            return self._lead_flight(endpoint, key, flight, fetch, ttl, min_fresh=0)
+        return self._join_flight(flight)
+
+    def refresh(self, endpoint, key, fetch, ttl=None):
+        """Fetch a new value and store it, regardless of what is cached"""
+        with self._lock:
+            flight = self._inflight.get((endpoint, key))
+            leader = flight is None
+            if leader:
+                flight = self._inflight[(endpoint, key)] = _Flight()
+
+        if leader:
+            # Another process refreshing the same entry within the last half TTL counts as ours
+            refresh_ttl = self.ttl_for(endpoint) if ttl is None else ttl
+            return self._lead_flight(endpoint, key, flight, fetch, ttl, min_fresh=refresh_ttl / 2)
+        # Someone else is already fetching this key, reuse their result
+        return self._join_flight(flight)
+
+    def invalidate(self, endpoint=None):
+        """Drop cached entries for one endpoint, or everything if endpoint is None"""
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+            else:
+                for entry_key in [k for k in self._entries if k[0] == endpoint]:
+                    del self._entries[entry_key]
+        if self.backend is not None:
+            self._backend_call("delete_prefix", "" if endpoint is None else f"{endpoint}:")
+
+    def stats(self):
+        """Return a snapshot of cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'inflight': len(self._inflight),
+                'backend': self.backend.name if self.backend is not None else 'memory',
+            }
+
+    def _lookup(self, endpoint, key):
+        # Must be called with the lock held
+        entry = self._entries.get((endpoint, key))
+        if entry is None or time.monotonic() >= entry[1]:
+            self.misses += 1
+            telemetry.count("crypgene_cache_requests_total", cache="market", endpoint=endpoint, result="miss")
+            return _MISSING
+        self._entries.move_to_end((endpoint, key))
+        self.hits += 1
+        telemetry.count("crypgene_cache_requests_total", cache="market", endpoint=endpoint, result="hit")
+        return entry[0]
+
+    def _lookup_stale(self, endpoint, key):
+        # Must be called with the lock held
+        entry = self._entries.get((endpoint, key))
+        if entry is None or time.monotonic() >= entry[1] + self.max_stale:
+            return _MISSING
+        self.stale_hits += 1
+        telemetry.count("crypgene_cache_requests_total", cache="market", endpoint=endpoint, result="stale")
+        return entry[0]
+
+    def _lead_flight(self, endpoint, key, flight, fetch, ttl, min_fresh):
+        # Run the upstream request and publish its result to any waiting threads
+        if ttl is None:
+            ttl = self.ttl_for(endpoint)
+        try:
+            if self.backend is None:
+                flight.value = fetch()
+                shared = False
+            else:
+                flight.value, ttl, shared = self._fetch_shared(endpoint, key, fetch, ttl, min_fresh)
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            if shared:
+                # Already in the shared backend, only keep a local copy
+                with self._lock:
+                    self._store(endpoint, key, flight.value, ttl)
+            else:
+                self.set(endpoint, key, flight.value, ttl)
+            return flight.value
+        finally:
+            with self._lock:
+                self._inflight.pop((endpoint, key), None)
+            flight.done.set()
+
+    def _join_flight(self, flight):
+        # Wait for another thread's upstream request to finish
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _fetch_shared(self, endpoint, key, fetch, ttl, min_fresh):
+        # Cross-process single flight: reuse another process's fresh value, or fetch under a shared
+        # lock while the other processes wait (or serve stale). Returns (value, ttl, from_backend).
+        name = shared_key(endpoint, key)
+        entry = self._backend_call("get", name)
+        now = time.time()
+        if entry is not None and entry[1] - now > min_fresh:
+            self._count_shared(endpoint, "shared_hit")
+            return entry[0], entry[1] - now, True
+
+        token = self._backend_call("acquire_lock", name, self.lock_timeout)
+        if token is None and not self._backend_failed:
+            # Someone else holds the lock
+            if entry is not None:
+                self._count_shared(endpoint, "shared_stale")
+                return entry[0], SHARED_STALE_TTL, True
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(SHARED_POLL_INTERVAL)
+                entry = self._backend_call("get", name)
+                now = time.time()
+                if entry is not None and entry[1] > now:
+                    self._count_shared(endpoint, "shared_hit")
+                    return entry[0], entry[1] - now, True
+                if self._backend_failed:
+                    break
+            # The lock holder died or is stuck; fetch without the lock
+
+        try:
+            value = fetch()
+            # Store before unlocking, so waiters find the value as soon as the lock goes away
+            self._backend_call("set", name, value, ttl, ttl + self.max_stale)
+        finally:
+            if token is not None:
+                self._backend_call("release_lock", name, token)
+        return value, ttl, True
+
+    async def afetch(self, endpoint, key, fetch, ttl=None):
+        """Async counterpart of a get_or_fetch miss: await fetch() and store the value, taking the
+        shared backend's lock like _fetch_shared so only one process calls upstream"""
+        if ttl is None:
+            ttl = self.ttl_for(endpoint)
+        if self.backend is None:
+            value = await fetch()
+            self.set(endpoint, key, value, ttl)
+            return value
+
+        # SQLite and Redis calls block, so they run off the event loop
+        def call(method, *args):
+            return asyncio.to_thread(self._backend_call, method, *args)
+
+        name = shared_key(endpoint, key)
+        entry = await call("get", name)
+        now = time.time()
+        if entry is not None and entry[1] > now:
+            self._count_shared(endpoint, "shared_hit")
+            return self._keep_local(endpoint, key, entry[0], entry[1] - now)
+
+        token = await call("acquire_lock", name, self.lock_timeout)
+        if token is None and not self._backend_failed:
+            # Another process is fetching it; serve its stale value or wait for the fresh one
+            if entry is not None:
+                self._count_shared(endpoint, "shared_stale")
+                return self._keep_local(endpoint, key, entry[0], SHARED_STALE_TTL)
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(SHARED_POLL_INTERVAL)
+                entry = await call("get", name)
+                now = time.time()
+                if entry is not None and entry[1] > now:
+                    self._count_shared(endpoint, "shared_hit")
+                    return self._keep_local(endpoint, key, entry[0], entry[1] - now)
+                if self._backend_failed:
+                    break
+            # The lock holder died or is stuck; fetch without the lock
+
+        try:
+            value = await fetch()
+            # Store before unlocking, so waiters find the value as soon as the lock goes away
+            await call("set", name, value, ttl, ttl + self.max_stale)
+        finally:
+            if token is not None:
+                await call("release_lock", name, token)
+        return self._keep_local(endpoint, key, value, ttl)
+
+    def _keep_local(self, endpoint, key, value, ttl):
+        # Copy a value that is already in the shared backend into this process's cache
+        with self._lock:
+            self._store(endpoint, key, value, ttl)
+        return value
+
+    def _load_shared(self, endpoint, key):
+        # Fill this process's cache from a fresh entry in the shared backend, if there is one
+        entry = self._backend_call("get", shared_key(endpoint, key))
+        now = time.time()
+        if entry is None or entry[1] <= now:
+            return _MISSING
+        self._count_shared(endpoint, "shared_hit")
+        with self._lock:
+            self._store(endpoint, key, entry[0], entry[1] - now)
+        return entry[0]
+
+    def _backend_call(self, method, *args):
+        # The shared backend only saves upstream calls; if it is down, carry on with the local cache
+        try:
+            result = getattr(self.backend, method)(*args)
+        except Exception as e:
+            if not self._backend_failed:
+                print(f"Shared cache backend unavailable, using the local cache only: {str(e)}")
+            self._backend_failed = True
+            return None
+        self._backend_failed = False
+        return result
+
+    @staticmethod
+    def _count_shared(endpoint, result):
+        telemetry.count("crypgene_cache_requests_total", cache="market", endpoint=endpoint, result=result)
+
+    def _store(self, endpoint, key, value, ttl):
+        # Must be called with the lock held
+        self._entries[(endpoint, key)] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end((endpoint, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Process-wide cache shared by every Streamlit session and advisor instance
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_market_cache():
+    """Return the process-wide market data cache, creating it on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = MarketDataCache(backend=get_cache_backend())
+    return _shared_cache
@@ -0,0 +1,131 @@
+# Cached access to CoinGecko endpoints, shared by app.py and agent.py
+from coingecko_gateway import get_gateway, PRIORITY_PAGE, PRIORITY_BACKGROUND
+from market_cache import get_market_cache, make_key
+
+# All upstream calls go through the process-wide gateway (rate limit, retries, pooling).
+# `priority` only decides who goes first when requests queue for the rate limit,
+# so it is never part of a cache key.
+
+
+# Each *_request helper returns (endpoint, key, fetch) for one upstream call,
+# so the cached getters and the background refresher agree on cache keys
+
+def coins_markets_request(vs_currency='usd', order='market_cap_desc', per_page=50, page=1, sparkline=False,
+                          priority=PRIORITY_PAGE, **kwargs):
+    key = make_key(vs_currency, order, per_page, page, sparkline, **kwargs)
+    return 'coins_markets', key, lambda: get_gateway().get_coins_markets(
+        vs_currency=vs_currency,
+        order=order,
+        per_page=per_page,
+        page=page,
+        sparkline=sparkline,
+        priority=priority,
+        **kwargs
+    )
+
+
+def global_request(priority=PRIORITY_PAGE):
+    return 'global', make_key(), lambda: get_gateway().get_global(priority=priority)
+
+
+def trending_request(priority=PRIORITY_BACKGROUND):
+    return 'trending', make_key(), lambda: get_gateway().get_search_trending(priority=priority)
+
+
+def exchange_rates_request(priority=PRIORITY_BACKGROUND):
+    return 'exchange_rates', make_key(), lambda: get_gateway().get_exchange_rates(priority=priority)
+
+
+def get_coins_markets(**kwargs):
+    """Get the coins market listing (cached)"""
+    return get_market_cache().get_or_fetch(*coins_markets_request(**kwargs))
+
+
+def get_global(priority=PRIORITY_PAGE):
+    """Get global crypto market data (cached)"""
+    return get_market_cache().get_or_fetch(*global_request(priority))
+
+
+def get_search_trending(priority=PRIORITY_BACKGROUND):
+    """Get trending coins (cached)"""
+    return get_market_cache().get_or_fetch(*trending_request(priority))
+
+
+def get_exchange_rates(priority=PRIORITY_BACKGROUND):
+    """Get BTC-based exchange rates for fiat and crypto currencies (cached)"""
+    return get_market_cache().get_or_fetch(*exchange_rates_request(priority))
+
+
+def search(query, priority=PRIORITY_PAGE):
+    """Search coins, exchanges and categories by name (cached)"""
+    query = query.strip().lower()
+    return get_market_cache().get_or_fetch(
+        'search', make_key(query),
+        lambda: get_gateway().search(query, priority=priority)
+    )
+
+
+def get_coins_list(priority=PRIORITY_BACKGROUND):
+    """Get the id, symbol and name of every coin CoinGecko lists (cached)"""
+    return get_market_cache().get_or_fetch(
+        'coins_list', make_key(),
+        lambda: get_gateway().get_coins_list(priority=priority)
+    )
+
+
+def get_coin_by_id(coin_id, priority=PRIORITY_PAGE, **kwargs):
+    """Get full coin data by id (cached)"""
+    return get_market_cache().get_or_fetch(
+        'coin', make_key(coin_id, **kwargs),
+        lambda: get_gateway().get_coin_by_id(coin_id, priority=priority, **kwargs)
+    )
+
+
+def slim_market_record(coin):
+    # Keep only the fields the app and advisor actually use
+    return {
+        'id': coin['id'],
+        'name': coin['name'],
+        'symbol': coin['symbol'].upper(),
+        'market_cap_rank': coin.get('market_cap_rank'),
+        'current_price': coin.get('current_price'),
+        'market_cap': coin.get('market_cap'),
+        'price_change_24h': coin.get('price_change_percentage_24h'),
+        'price_change_7d': coin.get('price_change_percentage_7d_in_currency'),
+        'price_change_30d': coin.get('price_change_percentage_30d_in_currency'),
+    }
+
+
+def get_coins_by_ids(coin_ids, vs_currency='usd', priority=PRIORITY_PAGE):
+    """Get slim market records for many coins with a single /coins/markets call (cached per coin)"""
+    cache = get_market_cache()
+    results = {}
+    missing = []
+    for coin_id in dict.fromkeys(coin_ids):
+        record = cache.get('coin_market', make_key(coin_id, vs_currency))
+        if record is None:
+            missing.append(coin_id)
+        else:
+            results[coin_id] = record
+
+    if missing:
+        # Fetch every coin we don't have yet in one request instead of one /coins/{id} each
+        batch = tuple(sorted(missing))
+        records = cache.get_or_fetch(
+            'coin_market_batch', make_key(batch, vs_currency),
+            lambda: [slim_market_record(coin) for coin in get_gateway().get_coins_markets(
+                vs_currency=vs_currency,
+                ids=','.join(batch),
+                per_page=len(batch),
+                sparkline=False,
+                price_change_percentage='7d,30d',
+                priority=priority
+            )]
+        )
+        for record in records:
+            cache.set('coin_market', make_key(record['id'], vs_currency), record)
+            results[record['id']] = record
+
+    # Preserve the caller's order; ids CoinGecko doesn't know are left out
+    return [results[coin_id] for coin_id in dict.fromkeys(coin_ids) if coin_id in results]
+
@@ -0,0 +1,132 @@
+# Background thread that keeps hot market data endpoints warm in the shared cache
+import random
+import threading
+import time
+
+import market_data
+from coingecko_gateway import PRIORITY_BACKGROUND
+from market_cache import get_market_cache
+
+# How often (in seconds) each hot endpoint is re-polled; kept below the cache TTLs
+DEFAULT_INTERVALS = {
+    'coins_markets': 45,
+    'global': 90,
+    'trending': 240,
+    'exchange_rates': 540,
+}
+
+# Backoff after upstream errors: doubles per consecutive failure up to the cap
+DEFAULT_MAX_BACKOFF = 300
+DEFAULT_JITTER = 0.2
+
+
+class RefreshJob:
+    """One cache entry that the refresher re-polls on a schedule"""
+    def __init__(self, endpoint, key, fetch, interval):
+        self.endpoint = endpoint
+        self.key = key
+        self.fetch = fetch
+        self.interval = interval
+        self.next_run = 0.0
+        self.failures = 0
+        self.last_error = None
+
+
+class MarketDataRefresher(threading.Thread):
+    def __init__(self, cache=None, max_backoff=DEFAULT_MAX_BACKOFF, jitter=DEFAULT_JITTER):
+        super().__init__(name="market-data-refresher", daemon=True)
+        self.cache = cache or get_market_cache()
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.jobs = []
+        self.listeners = []
+        self._jobs_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+
+    def add_job(self, endpoint, key, fetch, interval):
+        """Register an endpoint to refresh every `interval` seconds"""
+        job = RefreshJob(endpoint, key, fetch, interval)
+        with self._jobs_lock:
+            self.jobs.append(job)
+        self._wakeup.set()
+        return job
+
+    def add_listener(self, endpoint, callback):
+        """Call callback(endpoint, key, value) after each successful refresh of an endpoint"""
+        with self._jobs_lock:
+            self.listeners.append((endpoint, callback))
+
+    def stop(self):
+        """Ask the refresher thread to exit"""
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self._jobs_lock:
+                due = min(self.jobs, key=lambda j: j.next_run) if self.jobs else None
+
+            # Sleep until the next job is due, or until a new job is added
+            delay = due.next_run - time.monotonic() if due else None
+            if delay is None or delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+
+            self._run_job(due)
+
+    def _run_job(self, job):
+        try:
+            value = self.cache.refresh(job.endpoint, job.key, job.fetch)
+        except Exception as e:
+            job.failures += 1
+            job.last_error = e
+            backoff = min(self.max_backoff, job.interval * 2 ** (job.failures - 1))
+            job.next_run = time.monotonic() + self._jittered(backoff)
+            print(f"Error refreshing {job.endpoint} (attempt {job.failures}): {str(e)}")
+        else:
+            job.failures = 0
+            job.last_error = None
+            job.next_run = time.monotonic() + self._jittered(job.interval)
+            self._notify(job, value)
+
+    def _notify(self, job, value):
+        with self._jobs_lock:
+            listeners = [callback for endpoint, callback in self.listeners if endpoint == job.endpoint]
+        for callback in listeners:
+            # A failing listener mustn't stop the refresh schedule
+            try:
+                callback(job.endpoint, job.key, value)
+            except Exception as e:
+                print(f"Error in {job.endpoint} refresh listener: {str(e)}")
+
+    def _jittered(self, seconds):
+        # Spread refreshes out so several processes don't poll in lockstep
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+# Process-wide refresher, started once no matter how many sessions call start_refresher()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_refresher(intervals=None):
+    """Start the shared refresher for the app's hot endpoints if it isn't running yet"""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return _refresher
+
+        intervals = {**DEFAULT_INTERVALS, **(intervals or {})}
+        refresher = MarketDataRefresher()
+        # Refreshes queue behind chat and page requests for the shared rate limit
+        refresher.add_job(*market_data.coins_markets_request(per_page=250, priority=PRIORITY_BACKGROUND),
+                          intervals['coins_markets'])
+        refresher.add_job(*market_data.global_request(PRIORITY_BACKGROUND), intervals['global'])
+        refresher.add_job(*market_data.trending_request(PRIORITY_BACKGROUND), intervals['trending'])
+        refresher.add_job(*market_data.exchange_rates_request(PRIORITY_BACKGROUND), intervals['exchange_rates'])
+        refresher.start()
+
+        _refresher = refresher
+        return refresher
@@ -0,0 +1,96 @@
+# Typed, columnar snapshot of the coins market listing, built once per refresh and shared
+import threading
+
+import numpy as np
+import pandas as pd
+
+import market_data
+
+# CoinGecko returns at most 250 coins per /coins/markets page
+PAGE_SIZE = 250
+
+# Largest universe the overview can page through
+MAX_COINS = 1000
+
+# Columns kept from the API payload, with their dtypes
+COLUMNS = {
+    'id': 'string',
+    'name': 'string',
+    'symbol': 'string',
+    'image': 'string',
+    'market_cap_rank': 'Int64',
+    'current_price': 'float64',
+    'price_change_percentage_24h': 'float64',
+    'market_cap': 'float64',
+    'total_volume': 'float64',
+}
+
+
+class MarketSnapshot:
+    """Top-N coins as a DataFrame with numeric dtypes; treat it as read-only, it is shared"""
+    def __init__(self, coins):
+        frame = pd.DataFrame.from_records(coins, columns=list(COLUMNS)) if coins else pd.DataFrame(columns=list(COLUMNS))
+        self.df = frame.astype(COLUMNS)
+        self.df['symbol'] = self.df['symbol'].str.upper()
+
+    def __len__(self):
+        return len(self.df)
+
+    def page(self, page_number, page_size=50):
+        """Rows for one 1-based page of the table"""
+        start = (page_number - 1) * page_size
+        return self.df.iloc[start:start + page_size]
+
+    def _top(self, column, n, largest=True):
+        # nlargest/nsmallest select the top rows without sorting the whole frame
+        values = self.df[column].dropna()
+        picked = values.nlargest(n) if largest else values.nsmallest(n)
+        return self.df.loc[picked.index]
+
+    def top_gainers(self, n=5):
+        return self._top('price_change_percentage_24h', n)
+
+    def top_losers(self, n=5):
+        return self._top('price_change_percentage_24h', n, largest=False)
+
+    def volume_leaders(self, n=5):
+        return self._top('total_volume', n)
+
+    def prices(self):
+        """Current prices as a NumPy array aligned with self.df"""
+        return self.df['current_price'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def market_pages(n_coins, vs_currency='usd'):
+    """Fetch (through the shared cache) the /coins/markets pages covering the top n_coins"""
+    n_coins = min(n_coins, MAX_COINS)
+    pages = -(-n_coins // PAGE_SIZE)
+    return [
+        market_data.get_coins_markets(vs_currency=vs_currency, per_page=PAGE_SIZE, page=page)
+        for page in range(1, pages + 1)
+    ]
+
+
+# Snapshots keyed by (n_coins, vs_currency), rebuilt only when the cached pages change
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_market_snapshot(n_coins=PAGE_SIZE, vs_currency='usd'):
+    """Return the shared snapshot of the top n_coins, rebuilding it after each refresh"""
+    pages = market_pages(n_coins, vs_currency)
+    # The cache hands out the same list objects until a refresh replaces them
+    version = tuple(id(page) for page in pages)
+
+    key = (n_coins, vs_currency)
+    with _snapshots_lock:
+        cached = _snapshots.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[2]
+
+    coins = [coin for page in pages for coin in page][:n_coins]
+    snapshot = MarketSnapshot(coins)
+    with _snapshots_lock:
+        # Hold on to the pages so their ids can't be reused while this entry is alive
+        _snapshots[key] = (version, pages, snapshot)
+    return snapshot
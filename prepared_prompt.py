@@ -0,0 +1,179 @@
+# Prepared prompts: the parts of a turn's prompt that don't change from turn to turn are built
+# once. The system prefix is one immutable message at the head of every prompt, so Gemini can
+# reuse its cached prefix, and each market data block is rendered once per version of the data
+# it quotes and shared by every session quoting the same data.
+import textwrap
+import threading
+from collections import OrderedDict
+
+import telemetry
+from analytics import get_market_analytics
+from currency import BASE_CURRENCY, convert, display_currency, format_compact_money, format_money
+
+# Upper bound on rendered data snippets kept in memory
+DEFAULT_MAX_SNIPPETS = 4096
+
+# Coin record fields a coin snippet quotes; together they are that coin's data version
+COIN_FIELDS = ('id', 'name', 'symbol', 'current_price', 'price_change_24h', 'price_change_7d',
+               'price_change_30d', 'market_cap')
+
+# Fields of global_summary() a global snippet quotes
+GLOBAL_FIELDS = ('total_market_cap', 'market_cap_change_percentage_24h_usd', 'active_cryptocurrencies')
+
+
+def system_prefix(system_message):
+    """The system message without the source code's indentation, which only costs tokens"""
+    return textwrap.dedent(system_message).strip()
+
+
+class PreparedPrompt:
+    """A prompt whose system prefix is built once; each turn only adds history and the input"""
+    def __init__(self, system_message):
+        from langchain_core.messages import HumanMessage, SystemMessage
+        from langchain_core.prompt_values import ChatPromptValue
+        self.system_text = system_prefix(system_message)
+        # Shared by every prompt, so the prefix sent to Gemini is byte-for-byte identical
+        self.system = SystemMessage(content=self.system_text)
+        self._human = HumanMessage
+        self._value = ChatPromptValue
+
+    def render(self, history, text):
+        """The prompt for one turn: system prefix, conversation history, then the new input"""
+        return self._value(messages=[self.system, *history, self._human(content=text)])
+
+
+class SnippetCache:
+    """Rendered data blocks, keyed by the data they quote, shared by every session"""
+    def __init__(self, max_entries=DEFAULT_MAX_SNIPPETS):
+        self.max_entries = max_entries
+        self._snippets = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """Return the snippet for key, rendering it with render() on a miss"""
+        with self._lock:
+            snippet = self._snippets.get(key)
+            if snippet is not None:
+                self._snippets.move_to_end(key)
+                self.hits += 1
+                telemetry.count("crypgene_cache_requests_total", cache="snippet", endpoint=key[0], result="hit")
+                return snippet
+            self.misses += 1
+        telemetry.count("crypgene_cache_requests_total", cache="snippet", endpoint=key[0], result="miss")
+
+        # Rendering is pure, so two sessions racing on the same miss just store the same text
+        snippet = render()
+        with self._lock:
+            self._snippets[key] = snippet
+            self._snippets.move_to_end(key)
+            while len(self._snippets) > self.max_entries:
+                self._snippets.popitem(last=False)
+        return snippet
+
+    def clear(self):
+        with self._lock:
+            self._snippets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._snippets), 'hits': self.hits, 'misses': self.misses}
+
+
+def data_block(crypto_data, currency=BASE_CURRENCY, cache=None):
+    """The market data block for coin data (one record or a list) or global market data"""
+    cache = cache or get_snippet_cache()
+    currency = display_currency(currency)
+    # The exchange rate is part of every snippet's version: a new rate table re-renders them
+    rate = convert(1.0, currency)
+    if isinstance(crypto_data, list):
+        return "".join(coin_snippet(coin, currency, rate, cache) for coin in crypto_data)
+    if 'name' in crypto_data and 'current_price' in crypto_data:
+        return coin_snippet(crypto_data, currency, rate, cache)
+    key = ('global', currency, rate, *(crypto_data.get(field) for field in GLOBAL_FIELDS))
+    return cache.get_or_render(key, lambda: render_global(crypto_data, currency))
+
+
+def coin_snippet(coin, currency, rate, cache):
+    analytics = get_market_analytics()
+    # Analytics are recomputed as a whole, so their version stands in for every coin's stats
+    key = ('coin', currency, rate, analytics.version, *(coin.get(field) for field in COIN_FIELDS))
+    return cache.get_or_render(key, lambda: render_coin(coin, analytics.get(coin.get('id')), currency))
+
+
+def render_coin(coin, stats, currency):
+    """One coin's data for the LLM, in as few tokens as stay unambiguous"""
+    code = currency.upper()
+    # CoinGecko has no price for delisted or illiquid coins
+    price = coin.get('current_price')
+    facts = [] if price is None else [f"Price: {format_money(price, currency)} {code}"]
+    for label, field in (("24h", 'price_change_24h'), ("7d", 'price_change_7d'), ("30d", 'price_change_30d')):
+        if coin.get(field) is not None:
+            facts.append(f"{label}: {coin[field]:+.2f}%")
+    if coin.get('market_cap') is not None:
+        facts.append(f"Market Cap: {format_compact_money(coin['market_cap'], currency)} {code}")
+
+    block = f"\n\nLatest data for {coin['name']} ({coin['symbol'].upper()}):\n{' | '.join(facts) or 'No price data'}\n"
+    if stats:
+        block += analytics_summary(stats, price, currency)
+    return block
+
+
+def analytics_summary(stats, current_price, currency=BASE_CURRENCY):
+    """A coin's precomputed analytics for the LLM, on one line; current_price may be None"""
+    facts = []
+    if stats['volatility_30d'] is not None:
+        facts.append(f"Volatility 30d: {stats['volatility_30d']:.0f}% annualized")
+    if stats['drawdown_30d'] is not None:
+        facts.append(f"Below 30d High: {abs(stats['drawdown_30d']):.1f}% (max drawdown {stats['max_drawdown_30d']:.1f}%)")
+    for days in (7, 30):
+        average = stats[f'ma_{days}d']
+        if average and current_price:
+            position = "above" if current_price >= average else "below"
+            facts.append(f"MA {days}d: {format_money(average, currency)} (price {position})")
+    if stats['rsi_14d'] is not None:
+        facts.append(f"RSI 14d: {stats['rsi_14d']:.0f}")
+    if stats['beta_btc'] is not None and stats['correlation_btc'] is not None:
+        facts.append(f"Beta vs BTC 30d: {stats['beta_btc']:.2f} (correlation {stats['correlation_btc']:.2f})")
+    return " | ".join(facts) + "\n" if facts else ""
+
+
+def render_global(data, currency):
+    """Global market data for the LLM"""
+    facts = []
+    if data.get('total_market_cap') is not None:
+        facts.append(f"Total Market Cap: {format_compact_money(data['total_market_cap'], currency)} {currency.upper()}")
+    if data.get('market_cap_change_percentage_24h_usd') is not None:
+        facts.append(f"24h: {data['market_cap_change_percentage_24h_usd']:+.2f}%")
+    if data.get('active_cryptocurrencies') is not None:
+        facts.append(f"Active Cryptocurrencies: {data['active_cryptocurrencies']:,}")
+    return "\n\nLatest Global Crypto Market Data:\n" + " | ".join(facts) + "\n"
+
+
+# Process-wide snippet cache, and the prepared prompt built on first use
+_snippet_cache = None
+_prepared = {}
+_lock = threading.Lock()
+
+
+def get_snippet_cache():
+    """Return the process-wide snippet cache, creating it on first use"""
+    global _snippet_cache
+    if _snippet_cache is None:
+        with _lock:
+            if _snippet_cache is None:
+                _snippet_cache = SnippetCache()
+    return _snippet_cache
+
+
+def get_prepared_prompt(system_message):
+    """Return the shared prepared prompt for a system message, building it on first use"""
+    prepared = _prepared.get(system_message)
+    if prepared is None:
+        with _lock:
+            prepared = _prepared.get(system_message)
+            if prepared is None:
+                prepared = _prepared[system_message] = PreparedPrompt(system_message)
+    return prepared
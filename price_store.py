@@ -0,0 +1,242 @@
+# On-disk columnar store of historical prices, fetched incrementally from CoinGecko
+#
+# CoinGecko's market_chart/range chooses the spacing of its points from the length of the range:
+# 5-minute points under a day, hourly up to 90 days, daily beyond that. So each coin is stored
+# in one tier per spacing, every request is served by the tier matching its length, and points
+# fetched for a short tail are thinned to the tier's spacing before they are appended.
+#
+# The store is the cache for this data, so it asks the gateway directly. Every worker process
+# on a machine shares the same files; updates to a series hold a file lock, so they never
+# interleave across processes.
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from coingecko_gateway import PRIORITY_PAGE, get_gateway
+from storage import get_data_dir
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, where only the in-process lock applies
+    fcntl = None
+
+# Don't ask upstream for a tail shorter than this (in seconds); recent enough is recent enough
+MIN_TAIL_SECONDS = 5 * 60
+
+# Column files per series: timestamps in milliseconds (int64) and prices (float64)
+TIMESTAMP_DTYPE = np.int64
+PRICE_DTYPE = np.float64
+
+DAY = 24 * 60 * 60
+
+# Tiers as (name, longest range served in seconds, spacing in seconds, history kept in seconds);
+# the range limits stay clear of CoinGecko's 1- and 90-day boundaries. The daily tier is small
+# (365 points a year), so it keeps everything.
+TIERS = (
+    ('5m', DAY - 60 * 60, 5 * 60, 2 * DAY),
+    ('1h', 89 * DAY, 60 * 60, 92 * DAY),
+    ('1d', None, DAY, None),
+)
+
+# Points older than the history kept are only dropped once they make up this fraction of it,
+# so a series is rewritten now and then rather than on every append
+TRIM_SLACK = 0.25
+
+
+def tier_for(seconds):
+    """The tier serving a range of this many seconds"""
+    for tier in TIERS:
+        if tier[1] is None or seconds <= tier[1]:
+            return tier
+
+
+def thin(timestamps, prices, step_ms, after_ms=None):
+    """Keep the first point of every step-long bucket, skipping buckets up to after_ms's"""
+    buckets = timestamps // step_ms
+    keep = np.ones(len(timestamps), bool)
+    keep[1:] = buckets[1:] != buckets[:-1]
+    if after_ms is not None:
+        keep &= buckets > after_ms // step_ms
+    return timestamps[keep], prices[keep]
+
+
+class PriceSeries:
+    """Append-only price history for one coin, currency and tier, stored as raw column files"""
+    def __init__(self, coin_id, vs_currency, tier=TIERS[1], directory=None):
+        self.coin_id = coin_id
+        self.vs_currency = vs_currency
+        self.tier, _, step, self.keep = tier
+        self.step_ms = step * 1000
+        # Coin ids are slugs already, but never let one escape the store directory
+        name = re.sub(r"[^a-z0-9_.-]", "_", f"{coin_id}.{vs_currency}.{self.tier}".lower())
+        directory = directory or os.path.join(get_data_dir(), "prices")
+        os.makedirs(directory, exist_ok=True)
+        self.timestamps_path = os.path.join(directory, f"{name}.ts")
+        self.prices_path = os.path.join(directory, f"{name}.price")
+        self.meta_path = os.path.join(directory, f"{name}.json")
+        # The column files are rewritten in place, so the lock lives in a file of its own
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold the series for a read-modify-write, against other threads and other processes"""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def coverage(self):
+        """Return the (from, to) range in seconds that has been fetched, or None"""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return meta["from"], meta["to"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_coverage(self, covered_from, covered_to):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"from": covered_from, "to": covered_to}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def read(self):
+        """Return (timestamps_ms, prices) as read-only memory-mapped arrays"""
+        count = min(self._count(self.timestamps_path, TIMESTAMP_DTYPE), self._count(self.prices_path, PRICE_DTYPE))
+        if count == 0:
+            return np.empty(0, TIMESTAMP_DTYPE), np.empty(0, PRICE_DTYPE)
+        timestamps = np.memmap(self.timestamps_path, dtype=TIMESTAMP_DTYPE, mode="r", shape=(count,))
+        prices = np.memmap(self.prices_path, dtype=PRICE_DTYPE, mode="r", shape=(count,))
+        return timestamps, prices
+
+    @staticmethod
+    def _count(path, dtype):
+        try:
+            return os.path.getsize(path) // np.dtype(dtype).itemsize
+        except OSError:
+            return 0
+
+    def append(self, points, covered_from, covered_to):
+        """Append [[timestamp_ms, price], ...] newer than what's stored and extend the coverage"""
+        timestamps, prices = self._to_columns(points)
+        stored, _ = self.read()
+        # A short tail comes back at a finer spacing than the tier's; keep one point per step
+        timestamps, prices = thin(timestamps, prices, self.step_ms, int(stored[-1]) if len(stored) else None)
+        with open(self.timestamps_path, "ab") as f:
+            f.write(timestamps.tobytes())
+        with open(self.prices_path, "ab") as f:
+            f.write(prices.tobytes())
+        self._write_coverage(covered_from, covered_to)
+
+    def replace(self, points, covered_from, covered_to):
+        """Rewrite the whole series, e.g. when a longer history than stored is requested"""
+        timestamps, prices = thin(*self._to_columns(points), self.step_ms)
+        self._write(timestamps, prices, covered_from, covered_to)
+
+    def trim(self, now):
+        """Drop points older than the history this tier keeps, once enough have piled up"""
+        coverage = self.coverage()
+        if self.keep is None or coverage is None or coverage[0] >= now - self.keep * (1 + TRIM_SLACK):
+            return
+        covered_from = now - self.keep
+        timestamps, prices = self.read()
+        start = np.searchsorted(timestamps, covered_from * 1000)
+        # Copy out of the memory maps before the files underneath are replaced
+        self._write(np.array(timestamps[start:]), np.array(prices[start:]), covered_from, coverage[1])
+
+    def _write(self, timestamps, prices, covered_from, covered_to):
+        for path, column in ((self.timestamps_path, timestamps), (self.prices_path, prices)):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(column.tobytes())
+            os.replace(tmp_path, path)
+        self._write_coverage(covered_from, covered_to)
+
+    @staticmethod
+    def _to_columns(points):
+        # Sorted, de-duplicated columns from CoinGecko's [[ms, price], ...] pairs
+        if not points:
+            return np.empty(0, TIMESTAMP_DTYPE), np.empty(0, PRICE_DTYPE)
+        pairs = np.asarray(points, dtype=np.float64)
+        timestamps = pairs[:, 0].astype(TIMESTAMP_DTYPE)
+        timestamps, unique = np.unique(timestamps, return_index=True)
+        return timestamps, np.ascontiguousarray(pairs[unique, 1], dtype=PRICE_DTYPE)
+
+
+class PriceStore:
+    def __init__(self, directory=None, min_tail_seconds=MIN_TAIL_SECONDS):
+        self.directory = directory
+        self.min_tail_seconds = min_tail_seconds
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def series(self, coin_id, vs_currency='usd', tier=TIERS[1]):
+        with self._lock:
+            key = (coin_id, vs_currency, tier[0])
+            if key not in self._series:
+                self._series[key] = PriceSeries(coin_id, vs_currency, tier, self.directory)
+            return self._series[key]
+
+    def get_range(self, coin_id, from_timestamp, to_timestamp=None, vs_currency='usd', priority=PRIORITY_PAGE):
+        """Return (timestamps_ms, prices) for a range in seconds, fetching only what isn't stored
+
+        Points are 5 minutes apart for ranges under a day, hourly up to 89 days, daily beyond."""
+        to_timestamp = int(to_timestamp or time.time())
+        from_timestamp = int(from_timestamp)
+        series = self.series(coin_id, vs_currency, tier_for(to_timestamp - from_timestamp))
+
+        # Another process may be fetching the same series; wait for it and use what it stored
+        with series.locked():
+            coverage = series.coverage()
+            if coverage is None or from_timestamp < coverage[0] or coverage[1] < from_timestamp:
+                # Nothing usable stored, or a longer history is wanted: fetch the full range once
+                points = self._fetch(coin_id, vs_currency, from_timestamp, to_timestamp, priority)
+                series.replace(points, from_timestamp, to_timestamp)
+            elif to_timestamp - coverage[1] >= self.min_tail_seconds:
+                # Only ask upstream for the missing tail
+                points = self._fetch(coin_id, vs_currency, coverage[1], to_timestamp, priority)
+                series.append(points, coverage[0], to_timestamp)
+                series.trim(to_timestamp)
+
+            timestamps, prices = series.read()
+
+        # Slicing a memmap returns a view, so no price data is copied here
+        start, end = np.searchsorted(timestamps, [from_timestamp * 1000, to_timestamp * 1000 + 1])
+        return timestamps[start:end], prices[start:end]
+
+    @staticmethod
+    def _fetch(coin_id, vs_currency, from_timestamp, to_timestamp, priority):
+        # Straight to the gateway: every range asked for is different, so caching the response
+        # as well would only fill the market cache with entries nobody reads again
+        chart_data = get_gateway().get_coin_market_chart_range_by_id(
+            coin_id, vs_currency, from_timestamp, to_timestamp, priority=priority
+        )
+        return chart_data.get('prices', [])
+
+
+# Process-wide store shared by every session
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_price_store():
+    """Return the process-wide price store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PriceStore()
+    return _store
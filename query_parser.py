@@ -0,0 +1,88 @@
+# Single-pass intent and coin extraction for user queries
+import re
+from collections import namedtuple
+
+from coin_index import STOPWORDS
+
+# Phrases that signal a question about one or more specific coins
+CRYPTO_KEYWORDS = [
+    "price of", "how is", "what about", "data on", "information on", "stats for", "how much is",
+    "what's the price", "what is the price", "current price", "price for", "value of", "cost of",
+    "worth of", "compare",
+]
+
+# Phrases that signal a question about the market as a whole
+MARKET_KEYWORDS = ["market", "overall", "general", "trending", "crypto market", "cryptocurrency market"]
+
+# Result of parsing one query:
+#   intent    - "coin", "market" or None
+#   coins     - CoinGecko ids mentioned in the query, in order of appearance
+#   candidate - the first word after a coin keyword (e.g. "pepe" in "price of pepe"),
+#               used when the coin isn't in the index
+#   words     - the query's words that weren't part of a keyword phrase
+ParsedQuery = namedtuple("ParsedQuery", ["intent", "coins", "candidate", "words"])
+
+
+class QueryParser:
+    def __init__(self, crypto_keywords=CRYPTO_KEYWORDS, market_keywords=MARKET_KEYWORDS):
+        self.keyword_intents = {keyword: "market" for keyword in market_keywords}
+        self.keyword_intents.update({keyword: "coin" for keyword in crypto_keywords})
+
+        # One alternation for every keyword phrase (longest first so "crypto market" beats
+        # "market"), followed by a catch-all for plain words; finditer() walks the query once
+        phrases = sorted(self.keyword_intents, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"\b(?P<keyword>" + "|".join(re.escape(phrase) for phrase in phrases) + r")\b"
+            r"|(?P<word>[a-z0-9]+)"
+        )
+
+    def parse(self, query, coin_index=None):
+        """Extract the intent, coin mentions and words from a query in one pass"""
+        intents = set()
+        words = []
+        candidate = None
+        expect_candidate = False
+
+        for match in self.pattern.finditer(query.lower()):
+            keyword = match.group("keyword")
+            if keyword:
+                intent = self.keyword_intents[keyword]
+                intents.add(intent)
+                if intent == "coin" and candidate is None:
+                    expect_candidate = True
+                continue
+
+            word = match.group("word")
+            words.append(word)
+            # Skip filler like "the" in "what's the price of the ..." when picking the candidate
+            if expect_candidate and word not in STOPWORDS:
+                expect_candidate = False
+                if len(word) > 1:
+                    candidate = word
+
+        if not intents:
+            return ParsedQuery(None, [], None, words)
+
+        coins = coin_index.find_coins(words) if coin_index is not None else []
+        # Coin questions win over market questions, but only if there's a coin to ask about
+        if "coin" in intents and (coins or candidate):
+            intent = "coin"
+        elif "market" in intents:
+            intent = "market"
+        else:
+            intent = None
+        return ParsedQuery(intent, coins, candidate, words)
+
+    def parse_many(self, queries, coin_index=None):
+        """Parse an iterable of queries lazily, e.g. for offline classification of logged queries"""
+        for query in queries:
+            yield self.parse(query, coin_index)
+
+
+# Default parser, compiled once at import time
+_parser = QueryParser()
+
+
+def parse_query(query, coin_index=None):
+    """Parse a query with the default keyword set"""
+    return _parser.parse(query, coin_index)
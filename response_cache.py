@@ -0,0 +1,161 @@
+# Cache of LLM answers shared across sessions, matching near-duplicate questions
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import telemetry
+
+# How long (in seconds) answers that don't quote market data stay valid
+DEFAULT_TTL = 60 * 60
+
+# Upper bound on cached answers across all buckets
+DEFAULT_MAX_ENTRIES = 2000
+
+# Minimum similarity between two questions for one to reuse the other's answer
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+
+# Words that don't change what's being asked ("what's the price of btc" == "price of btc")
+FILLER_WORDS = {
+    "a", "an", "the", "of", "is", "are", "s", "it", "its", "me", "please", "tell", "can", "you",
+    "could", "would", "right", "now", "currently", "today", "hey", "hi", "hello", "thanks",
+    "what", "whats", "how", "much", "do", "does", "i", "to", "for", "on", "in", "at", "about",
+}
+
+
+def data_version(data_context):
+    """Short, stable version id for a rendered market data block"""
+    if not data_context:
+        return ""
+    return hashlib.blake2b(data_context.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def question_signature(parsed, coin_index=None):
+    """Normalize a parsed query to the words that carry its meaning"""
+    coin_ids = set(parsed.coins)
+    words = []
+    for word in parsed.words:
+        if word in FILLER_WORDS:
+            continue
+        # Coin mentions are part of the cache key already ("btc" and "bitcoin" are the same)
+        if coin_index is not None and coin_ids and coin_index.lookup(word) in coin_ids:
+            continue
+        words.append(word)
+    return " ".join(words)
+
+
+def question_numbers(parsed):
+    """Words of a question that contain digits ("1000", "24h"); similar wording is not enough
+    for these, so questions only share answers when their numbers match exactly"""
+    return tuple(word for word in parsed.words if any(char.isdigit() for char in word))
+
+
+def _trigrams(signature):
+    # Word set plus character trigrams, so small typos still count as similar
+    grams = set(signature.split())
+    padded = f"  {signature} "
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def similarity(grams_a, grams_b):
+    """Jaccard similarity of two n-gram sets"""
+    if not grams_a and not grams_b:
+        return 1.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+class _Entry:
+    __slots__ = ("grams", "response", "expires_at")
+
+    def __init__(self, grams, response, expires_at):
+        self.grams = grams
+        self.response = response
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 default_ttl=DEFAULT_TTL):
+        # Buckets are keyed on (intent, coin ids, data version, numbers) and kept in LRU order;
+        # each bucket holds the few differently-worded questions asked about the same thing
+        self._buckets = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.default_ttl = default_ttl
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def bucket_key(parsed, data_context):
+        return (parsed.intent, tuple(sorted(parsed.coins)), data_version(data_context), question_numbers(parsed))
+
+    def get(self, parsed, data_context, signature):
+        """Return a cached answer to a similar question about the same data, or None"""
+        key = self.bucket_key(parsed, data_context)
+        grams = _trigrams(signature)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket:
+                self._expire(bucket, now)
+                best = max(bucket, key=lambda entry: similarity(grams, entry.grams), default=None)
+                if best is not None and similarity(grams, best.grams) >= self.threshold:
+                    self._buckets.move_to_end(key)
+                    self.hits += 1
+                    telemetry.count("crypgene_cache_requests_total", cache="response", endpoint=key[0], result="hit")
+                    return best.response
+                if not bucket:
+                    del self._buckets[key]
+            self.misses += 1
+            telemetry.count("crypgene_cache_requests_total", cache="response", endpoint=key[0], result="miss")
+            return None
+
+    def set(self, parsed, data_context, signature, response, ttl=None):
+        """Cache an answer; ttl should match how long the quoted data stays fresh"""
+        key = self.bucket_key(parsed, data_context)
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            bucket = self._buckets.setdefault(key, [])
+            bucket.append(_Entry(_trigrams(signature), response, expires_at))
+            self._buckets.move_to_end(key)
+            self._size += 1
+
+            # Evict whole least-recently-used buckets until we're back under the bound
+            while self._size > self.max_entries and self._buckets:
+                _, evicted = self._buckets.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': self._size, 'buckets': len(self._buckets), 'hits': self.hits, 'misses': self.misses}
+
+    def _expire(self, bucket, now):
+        # Must be called with the lock held
+        live = [entry for entry in bucket if entry.expires_at > now]
+        self._size -= len(bucket) - len(live)
+        bucket[:] = live
+
+
+# Process-wide cache shared by every advisor instance
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, creating it on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache()
+    return _shared_cache
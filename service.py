@@ -0,0 +1,279 @@
+# Headless advisor service: CryptoAdvisor behind an ASGI (Starlette) HTTP API
+#
+#   uvicorn service:app --host 0.0.0.0 --port 8000 --workers 4
+#
+# Conversations are keyed by a client-chosen session id and live in the worker that served
+# them, so put the workers behind a load balancer with session affinity on that id. Market
+# data caches, the gateway's rate limit and the response cache are shared by every request
+# in a worker.
+import asyncio
+import contextlib
+import os
+import re
+import time
+from collections import OrderedDict
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import telemetry
+from agent import CryptoAdvisor
+from analytics import start_analytics
+from currency import BASE_CURRENCY
+from coin_index import get_coin_index
+from market_refresher import start_refresher
+
+# Conversations kept per worker; the least recently used one is dropped past this
+MAX_SESSIONS = int(os.getenv("CRYPGENE_MAX_SESSIONS", "1000"))
+
+# Seconds of inactivity after which a conversation is dropped
+SESSION_TTL = int(os.getenv("CRYPGENE_SESSION_TTL", str(30 * 60)))
+
+# Turns processed at once per worker, and how long (in seconds) a turn may wait for a slot
+MAX_CONCURRENT_TURNS = int(os.getenv("CRYPGENE_MAX_CONCURRENT_TURNS", "32"))
+QUEUE_TIMEOUT = float(os.getenv("CRYPGENE_QUEUE_TIMEOUT", "10"))
+
+# Longest accepted user message, in characters
+MAX_MESSAGE_CHARS = 4000
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+CURRENCY_PATTERN = re.compile(r"^[A-Za-z]{3,5}$")
+
+
+class Session:
+    """One conversation: its advisor, and a lock so its turns run one at a time"""
+    __slots__ = ("advisor", "lock", "last_used")
+
+    def __init__(self):
+        self.advisor = CryptoAdvisor()
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """Bounded map of session id -> Session, dropping idle and least recently used sessions"""
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        """Return the session for an id, creating it on first use"""
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = Session()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        session.last_used = now
+        return session
+
+    def pop(self, session_id):
+        return self._sessions.pop(session_id, None)
+
+    def _expire(self, now):
+        # Sessions are ordered by last use, so idle ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl:
+                break
+            del self._sessions[session_id]
+
+
+class TurnLimiter:
+    """Caps turns in flight per worker; callers wait up to a timeout for a slot"""
+    def __init__(self, limit=MAX_CONCURRENT_TURNS, timeout=QUEUE_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+
+    async def acquire(self):
+        """Take a slot; return False if none freed up within the timeout"""
+        try:
+            with telemetry.span("turn_queue"):
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            telemetry.count("crypgene_turns_rejected_total")
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+def error(status, message, headers=None):
+    return JSONResponse({"error": message}, status_code=status, headers=headers)
+
+
+def session_id_or_none(request):
+    session_id = request.path_params["session_id"]
+    return session_id if SESSION_ID_PATTERN.match(session_id) else None
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def post_message(request):
+    """Run one turn: {"message": str, "stream": bool, "currency": str} -> streamed text or {"response": str}"""
+    session_id = session_id_or_none(request)
+    if session_id is None:
+        return error(400, "invalid session id")
+    body = await read_json(request)
+    message = body.get("message") if body else None
+    if not isinstance(message, str) or not message.strip():
+        return error(400, "'message' must be a non-empty string")
+    if len(message) > MAX_MESSAGE_CHARS:
+        return error(413, f"'message' is longer than {MAX_MESSAGE_CHARS} characters")
+    currency = body.get("currency", BASE_CURRENCY)
+    if not isinstance(currency, str) or not CURRENCY_PATTERN.match(currency):
+        return error(400, "'currency' must be a currency code such as 'usd' or 'eur'")
+
+    state = request.app.state
+    session = state.sessions.get(session_id)
+
+    # Queue behind this conversation's previous turn first, so one busy session can't hold
+    # several of the worker's slots; a turn stuck behind it is turned away like a full queue
+    try:
+        await asyncio.wait_for(session.lock.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        telemetry.count("crypgene_turns_rejected_total")
+        return error(429, "this session is still answering an earlier message, try again shortly",
+                     headers={"Retry-After": str(int(QUEUE_TIMEOUT))})
+    if not await state.limiter.acquire():
+        session.lock.release()
+        return error(503, "too many requests in flight, try again shortly",
+                     headers={"Retry-After": str(int(QUEUE_TIMEOUT))})
+
+    # Prices are converted locally, so any currency costs the same upstream requests
+    session.advisor.currency = currency.lower()
+    released = False
+
+    def release():
+        # Called from the stream's cleanup and again as a background task, which still runs
+        # if the client went away before the stream started; only the first call counts
+        nonlocal released
+        if not released:
+            released = True
+            state.limiter.release()
+            session.lock.release()
+
+    if not body.get("stream", True):
+        try:
+            response = await session.advisor.aget_response(message)
+        finally:
+            release()
+        return JSONResponse({"session_id": session_id, "response": response})
+
+    async def chunks():
+        # Market data and the LLM are awaited on the event loop, so a stream holds no thread
+        try:
+            async for chunk in session.advisor.astream_response(message):
+                yield chunk
+        finally:
+            release()
+
+    return StreamingResponse(chunks(), media_type="text/plain; charset=utf-8", background=BackgroundTask(release))
+
+
+async def put_history(request):
+    """Replace a conversation's history: {"messages": [{"role", "content"}, ...]}"""
+    session_id = session_id_or_none(request)
+    if session_id is None:
+        return error(400, "invalid session id")
+    body = await read_json(request)
+    messages = body.get("messages") if body else None
+    if not isinstance(messages, list) or not all(
+            isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str)
+            for m in messages):
+        return error(400, "'messages' must be a list of {role, content} objects")
+
+    session = request.app.state.sessions.get(session_id)
+    async with session.lock:
+        session.advisor.load_conversation(messages)
+    return Response(status_code=204)
+
+
+async def delete_session(request):
+    """Forget a conversation"""
+    session_id = session_id_or_none(request)
+    if session_id is None:
+        return error(400, "invalid session id")
+    request.app.state.sessions.pop(session_id)
+    return Response(status_code=204)
+
+
+async def healthz(request):
+    """Liveness: the worker's event loop is responding"""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    """Readiness: the coin index is loaded, so turns won't stall on building it"""
+    state = request.app.state
+    if state.ready:
+        return JSONResponse({
+            "status": "ready",
+            "sessions": len(state.sessions),
+            "active_turns": state.limiter.active,
+        })
+    if state.warmup is None or state.warmup.done():
+        state.warmup = asyncio.create_task(warm_up(request.app))
+    return JSONResponse({"status": "starting"}, status_code=503)
+
+
+async def metrics(request):
+    """Prometheus metrics for this worker (empty unless CRYPGENE_TELEMETRY=1)"""
+    return PlainTextResponse(telemetry.get_registry().render(), media_type="text/plain; version=0.0.4")
+
+
+async def warm_up(app):
+    try:
+        await asyncio.to_thread(get_coin_index)
+    except Exception as e:
+        print(f"Warm-up failed, not ready yet: {str(e)}")
+        return
+    app.state.ready = True
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    app.state.sessions = SessionStore()
+    app.state.limiter = TurnLimiter()
+    app.state.ready = False
+    # Keep hot market data warm for every request in this worker
+    start_refresher()
+    start_analytics()
+    app.state.warmup = asyncio.create_task(warm_up(app))
+    yield
+
+
+routes = [
+    Route("/v1/sessions/{session_id}/messages", post_message, methods=["POST"]),
+    Route("/v1/sessions/{session_id}/history", put_history, methods=["PUT"]),
+    Route("/v1/sessions/{session_id}", delete_session, methods=["DELETE"]),
+    Route("/healthz", healthz),
+    Route("/readyz", readyz),
+    Route("/metrics", metrics),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("service:app", host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,19 @@
+# Location of CrypGene's local data files (indexes, stores, caches)
+import os
+
+# Override with CRYPGENE_DATA_DIR, e.g. to point at a mounted volume in containers
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".crypgene")
+
+
+def get_data_dir():
+    """Return the local data directory, creating it if needed"""
+    data_dir = os.getenv("CRYPGENE_DATA_DIR", DEFAULT_DATA_DIR)
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def data_path(*parts):
+    """Return a path inside the local data directory"""
+    path = os.path.join(get_data_dir(), *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,303 @@
+# Hot-path instrumentation: timing spans, counters and histograms, exported in Prometheus text
+# format and optionally as JSON log lines. Every call is a cheap no-op unless telemetry is enabled.
+import bisect
+import contextvars
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _env_flag(name):
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "on")
+
+
+# Turn collection on with CRYPGENE_TELEMETRY=1; JSON logs (to stderr) with CRYPGENE_JSON_LOGS=1
+ENABLED = _env_flag("CRYPGENE_TELEMETRY")
+JSON_LOGS = _env_flag("CRYPGENE_JSON_LOGS")
+
+# Local port for the /metrics endpoint; 0 leaves it off
+METRICS_PORT = int(os.getenv("CRYPGENE_METRICS_PORT", "0"))
+
+# Histogram buckets for durations (seconds) and for prompt sizes (tokens)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# Metric descriptions for the Prometheus export
+HELP = {
+    "crypgene_span_seconds": "Time spent in each instrumented stage",
+    "crypgene_cache_requests_total": "Cache lookups by cache, endpoint and result",
+    "crypgene_upstream_requests_total": "CoinGecko requests by endpoint and HTTP status",
+    "crypgene_upstream_retries_total": "CoinGecko requests retried after an error",
+    "crypgene_upstream_rate_limited_total": "CoinGecko responses with status 429",
+    "crypgene_prompt_tokens": "Estimated prompt size sent to the LLM, in tokens",
+    "crypgene_turns_total": "Advisor turns by how they were answered",
+    "crypgene_turns_rejected_total": "Service turns turned away because every slot stayed busy",
+    "crypgene_errors_total": "Errors by where they were caught",
+}
+
+# Id of the advisor turn being processed, attached to every JSON log line
+_turn_id = contextvars.ContextVar("crypgene_turn_id", default=None)
+_turn_ids = itertools.count(1)
+
+_logger = logging.getLogger("crypgene.telemetry")
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _label_key(labels):
+    # Label values are strings in the export anyway; converting here keeps keys sortable
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Registry:
+    """Thread-safe store of counters and histograms keyed by name and label set"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value, labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels, buckets):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                ((key, list(h.counts), h.sum, h.count, h.buckets) for key, h in self.histograms.items()),
+                key=lambda item: item[0]
+            )
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Return counters and histogram summaries as plain data, e.g. for a JSON endpoint"""
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum}
+                    for (name, labels), h in self.histograms.items()
+                ],
+            }
+
+
+_registry = Registry()
+
+
+def get_registry():
+    return _registry
+
+
+def configure(enabled=None, json_logs=None):
+    """Turn metric collection and JSON logging on or off at runtime"""
+    global ENABLED, JSON_LOGS
+    if enabled is not None:
+        ENABLED = enabled
+    if json_logs is not None:
+        JSON_LOGS = json_logs
+    if JSON_LOGS and not _logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+
+
+def count(name, value=1, **labels):
+    """Increment a counter"""
+    if ENABLED:
+        _registry.inc(name, value, labels)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record a value in a histogram"""
+    if ENABLED:
+        _registry.observe(name, value, labels, buckets)
+
+
+def log_event(event, **fields):
+    """Write one JSON log line, tagged with the current turn"""
+    if not JSON_LOGS:
+        return
+    record = {"ts": round(time.time(), 6), "event": event, "turn": _turn_id.get(), **fields}
+    _logger.info(json.dumps(record, default=str))
+
+
+def record_duration(name, seconds, **labels):
+    """Record a duration measured elsewhere (e.g. time to first token) as a span"""
+    if ENABLED:
+        _registry.observe("crypgene_span_seconds", seconds, {"span": name, **labels}, LATENCY_BUCKETS)
+    log_event("span", span=name, seconds=round(seconds, 6), **labels)
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        labels = self.labels if exc_type is None else {**self.labels, "error": exc_type.__name__}
+        record_duration(self.name, seconds, **labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **labels):
+    """Time a block: `with span("parse"): ...`; free when telemetry and JSON logs are off"""
+    if not (ENABLED or JSON_LOGS):
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+
+def start_turn():
+    """Tag the following spans and log lines with a new turn id; returns a token for end_turn"""
+    return _turn_id.set(next(_turn_ids))
+
+
+def end_turn(token):
+    try:
+        _turn_id.reset(token)
+    except ValueError:
+        # A streaming generator closed from another context (e.g. garbage-collected after the
+        # consumer went away) can't reset its own token; the turn id dies with that context
+        pass
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = _registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(_registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown out the app's own output
+        pass
+
+
+# Process-wide metrics server, started once no matter how many sessions ask for it
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """Serve /metrics (Prometheus text) and /metrics.json on a local port, if one is configured"""
+    global _server
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) may already own the port
+                print(f"Could not start metrics server on port {port}: {str(e)}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+
+configure()
@@ -0,0 +1,45 @@
+# Saved chats: owner scoping and search
+import pytest
+
+from chat_store import ChatStore
+
+
+@pytest.fixture(params=[True, False], ids=["fts", "like"])
+def store(request, tmp_path):
+    store = ChatStore(str(tmp_path / "chats.sqlite3"))
+    # Also exercise the substring fallback used when SQLite lacks FTS5
+    store.has_fts = store.has_fts and request.param
+    return store
+
+
+def add_chat(store, owner, text):
+    conversation_id = store.create_conversation(owner, text)
+    store.append_messages(owner, conversation_id, [{"role": "user", "content": text}])
+    return conversation_id
+
+
+def test_search_only_sees_own_chats(store):
+    mine = add_chat(store, "alice", "bitcoin price")
+    add_chat(store, "bob", "bitcoin price")
+
+    assert [chat["id"] for chat in store.search("alice", "bitcoin")] == [mine]
+
+
+def test_wildcards_are_matched_literally(store):
+    add_chat(store, "alice", "is eth up today")
+    underscore = add_chat(store, "alice", "my_wallet balance")
+    percent = add_chat(store, "alice", "up 5% this week")
+
+    if not store.has_fts:
+        assert [chat["id"] for chat in store.search("alice", "_")] == [underscore]
+        assert [chat["id"] for chat in store.search("alice", "%")] == [percent]
+    assert [chat["id"] for chat in store.search("alice", "my_wallet")] == [underscore]
+
+
+def test_other_owners_cannot_read_or_delete(store):
+    conversation_id = add_chat(store, "alice", "bitcoin price")
+
+    assert store.get_messages("bob", conversation_id) == []
+    assert not store.append_messages("bob", conversation_id, [{"role": "user", "content": "hi"}])
+    store.delete_conversation("bob", conversation_id)
+    assert store.count_conversations("alice") == 1
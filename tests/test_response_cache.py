@@ -0,0 +1,71 @@
+# Answers shared through the response cache must not carry one session's history into another
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("langchain_core")
+
+import response_cache
+from agent import CryptoAdvisor
+from coin_index import fallback_index
+
+DATA_CONTEXT = "\n\nLatest data for Bitcoin (BTC):\nPrice: $60,000.00 USD\n"
+QUESTION = "what's the price of bitcoin"
+
+
+class Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class CountingLLM:
+    """Answers every prompt with a new numbered reply"""
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt_value):
+        self.calls += 1
+        return Reply(f"answer {self.calls}")
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "_shared_cache", response_cache.ResponseCache())
+
+
+def make_advisor(llm, history=()):
+    advisor = CryptoAdvisor()
+    advisor.llm = llm
+    advisor.get_coin_index = fallback_index
+    advisor.build_data_context = lambda parsed: DATA_CONTEXT
+    advisor.load_conversation(history)
+    return advisor
+
+
+def test_answers_with_history_are_not_shared():
+    llm = CountingLLM()
+    first = make_advisor(llm, [{"role": "user", "content": "I hold 3 BTC"},
+                               {"role": "assistant", "content": "Nice stack!"}])
+    second = make_advisor(llm, [{"role": "user", "content": "I'm thinking of selling everything"},
+                                {"role": "assistant", "content": "Let's talk it through."}])
+
+    assert first.get_response(QUESTION) == "answer 1"
+    assert second.get_response(QUESTION) == "answer 2"
+    assert llm.calls == 2
+
+
+def test_history_free_answer_is_not_served_to_a_session_with_history():
+    llm = CountingLLM()
+    fresh = make_advisor(llm)
+    with_history = make_advisor(llm, [{"role": "user", "content": "I hold 3 BTC"},
+                                      {"role": "assistant", "content": "Nice stack!"}])
+
+    assert fresh.get_response(QUESTION) == "answer 1"
+    assert with_history.get_response(QUESTION) == "answer 2"
+
+
+def test_first_turns_are_shared():
+    llm = CountingLLM()
+    assert make_advisor(llm).get_response(QUESTION) == "answer 1"
+    assert make_advisor(llm).get_response(QUESTION) == "answer 1"
+    assert llm.calls == 1
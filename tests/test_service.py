@@ -0,0 +1,113 @@
+# The service's streaming turn path and its limits
+import asyncio
+import contextlib
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+pytest.importorskip("httpx")
+pytest.importorskip("langchain_core")
+pytest.importorskip("starlette")
+
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+import response_cache
+import service
+from agent import CryptoAdvisor
+from coin_index import fallback_index
+
+DATA_CONTEXT = "\n\nLatest data for Bitcoin (BTC):\nPrice: $60,000.00 USD\n"
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class StreamingLLM:
+    """Streams a fixed answer word by word"""
+    words = ("Bitcoin", " is", " at", " sixty", " thousand.")
+
+    async def astream(self, prompt_value):
+        for word in self.words:
+            yield Chunk(word)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "_shared_cache", response_cache.ResponseCache())
+
+
+def make_advisor():
+    advisor = CryptoAdvisor()
+    advisor.llm = StreamingLLM()
+    advisor.get_coin_index = fallback_index
+
+    async def abuild_data_context(parsed):
+        return DATA_CONTEXT
+
+    advisor.abuild_data_context = abuild_data_context
+    return advisor
+
+
+@pytest.fixture
+def client():
+    # The service's routes without its lifespan, which would start background refreshes
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.sessions = service.SessionStore()
+        app.state.limiter = service.TurnLimiter()
+        app.state.ready = True
+        yield
+
+    app = Starlette(routes=service.routes, lifespan=lifespan)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_complete_stream_is_recorded():
+    advisor = make_advisor()
+
+    async def consume():
+        return [chunk async for chunk in advisor.astream_response("what's the price of bitcoin")]
+
+    assert "".join(asyncio.run(consume())) == "Bitcoin is at sixty thousand."
+    assert len(advisor.memory) == 1
+
+
+def test_disconnected_stream_is_not_recorded():
+    advisor = make_advisor()
+
+    async def disconnect_after_first_chunk():
+        stream = advisor.astream_response("what's the price of bitcoin")
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(disconnect_after_first_chunk()) == "Bitcoin"
+    assert len(advisor.memory) == 0
+
+
+def test_turn_waiting_on_a_busy_session_gets_429(client, monkeypatch):
+    monkeypatch.setattr(service, "QUEUE_TIMEOUT", 0.1)
+    session = client.app.state.sessions.get("busy")
+    # An earlier turn of the same session still holds its lock
+    asyncio.run(session.lock.acquire())
+
+    response = client.post("/v1/sessions/busy/messages", json={"message": "price of btc", "stream": False})
+
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert client.app.state.limiter.active == 0
+
+
+def test_stream_through_the_service(client):
+    client.app.state.sessions.get("s1").advisor = make_advisor()
+
+    response = client.post("/v1/sessions/s1/messages", json={"message": "what's the price of bitcoin"})
+
+    assert response.status_code == 200
+    assert response.text == "Bitcoin is at sixty thousand."
+    assert not client.app.state.sessions.get("s1").lock.locked()